@@ -1,3 +1,3 @@
 __author__ = 'SmileyBarry'
 
-from . import app, core, errors, user
\ No newline at end of file
+from . import app, cache, core, errors, export, graph, instrument, presence, refresh, retry, throttle, transport, user, vanity
\ No newline at end of file
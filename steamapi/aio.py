@@ -0,0 +1,549 @@
+"""
+Native asyncio counterparts of the API connections and the main Steam objects.
+
+Requires Python 3.7+ and the optional "aiohttp" package. The async objects subclass the regular ones and
+share their caches: awaiting "user.fetch_summary()" fills the same cache entry "user.name" reads from, so
+once data is fetched asynchronously, the plain (blocking) properties return it without touching the network.
+"""
+__author__ = 'SmileyBarry'
+
+import asyncio
+import time
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from .core import GET, POST, STORE_INTERFACE, DEFAULT_JSON_DECODER, _prepare_arguments, _parse_response
+from .decorators import Singleton
+from .user import SteamUser, SteamGroup, SteamUserBadge, UserBatch
+from .app import APP_INFO_FILTERS, SteamApp, SteamAchievement, SteamAchievementSnapshot, SteamAppSchema
+from . import errors, retry, throttle, vanity
+
+if aiohttp is not None:
+    retry.register_not_sent_errors(aiohttp.ClientConnectorError)
+
+
+async def _fetch_cached(inst, prop, fetch):
+    """
+    Return "prop"'s cached value for "inst", or await "fetch()" and cache its result.
+
+    :param prop: The cached_property descriptor the value belongs to. (E.g.: SteamUser._summary)
+    :param fetch: A coroutine function producing the value.
+    """
+    try:
+        return prop.lookup(inst)
+    except KeyError:
+        pass
+    value = await fetch()
+    prop.prime(inst, value)
+    return value
+
+
+class _AsyncConnection(object):
+    """
+    Shared plumbing for the async connection singletons: a lazily-created aiohttp session, bound to the
+    running event loop, and a semaphore that bounds how many calls are in flight at once.
+    """
+    # A throttle.KeyPool, on connections that spread calls across several API keys.
+    key_pool = None
+
+    def _configure_session(self, settings):
+        """
+        :param settings: The "settings" dictionary given to the connection. Recognised keys:
+            max_concurrency -- int. (Default: 10) Maximum number of calls in flight at once.
+            pool_maxsize -- int. (Default: 10) Maximum number of connections kept open per host.
+            keep_alive -- True/False. (Default: True) Whether connections are kept open between calls.
+            timeout -- float or (connect, read) tuple. (Default: None) Timeout for each call, in seconds.
+            json_decoder -- function. (Default: core.DEFAULT_JSON_DECODER) Decodes a raw response body.
+            rate_limiter -- throttle.RateLimiter. (Default: None) Paces calls per API key and interface.
+            retry_policy -- retry.RetryPolicy. (Default: RetryPolicy()) Retries transient failures.
+        """
+        self.max_concurrency = 10
+        self.pool_maxsize = 10
+        self.keep_alive = True
+        self.timeout = None
+
+        if 'max_concurrency' in settings and type(settings['max_concurrency']) is int:
+            self.max_concurrency = settings['max_concurrency']
+        if 'pool_maxsize' in settings and type(settings['pool_maxsize']) is int:
+            self.pool_maxsize = settings['pool_maxsize']
+        if 'keep_alive' in settings and type(settings['keep_alive']) is bool:
+            self.keep_alive = settings['keep_alive']
+        if 'timeout' in settings:
+            self.timeout = settings['timeout']
+        self.json_decoder = settings.get('json_decoder', DEFAULT_JSON_DECODER)
+        self.rate_limiter = settings.get('rate_limiter', None)
+        self.retry_policy = settings.get('retry_policy', retry.RetryPolicy())
+
+        self._session = None
+        self._semaphore = None
+        self._loop = None
+
+    def _ensure_session(self):
+        if aiohttp is None:
+            raise ImportError("The asyncio client requires the 'aiohttp' package.")
+
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            if type(self.timeout) is tuple:
+                timeout = aiohttp.ClientTimeout(connect=self.timeout[0], sock_read=self.timeout[1])
+            else:
+                timeout = aiohttp.ClientTimeout(total=self.timeout)
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency,
+                                             limit_per_host=self.pool_maxsize,
+                                             force_close=not self.keep_alive)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._loop = loop
+        return self._session
+
+    async def _send(self, interface, method, query, kwargs, automatic_parsing, raw=False):
+        self._ensure_session()
+        attempt = 0
+        started = time.time()
+        while True:
+            try:
+                return await self._send_once(interface, method, query, kwargs, automatic_parsing, raw)
+            except (errors.APIException, aiohttp.ClientConnectionError, asyncio.TimeoutError) as exception:
+                if self.retry_policy is None:
+                    raise
+                delay = self.retry_policy.next_delay(attempt, exception, method, time.time() - started)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+
+    async def _send_once(self, interface, method, query, kwargs, automatic_parsing, raw):
+        session = self._ensure_session()
+        if self.key_pool is not None:
+            kwargs["key"] = self.key_pool.acquire()
+        if self.rate_limiter is not None:
+            delay = self.rate_limiter.reserve(kwargs.get("key"), interface)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        async with self._semaphore:
+            if method == POST:
+                request = session.request(method, query, data=kwargs)
+            else:
+                request = session.request(method, query, params=kwargs)
+            async with request as response:
+                retry_after = retry.parse_retry_after(response.headers.get("Retry-After"))
+                if self.key_pool is not None:
+                    self.key_pool.record(kwargs["key"], response.status, retry_after)
+                if response.status != 200:
+                    errors.raiseAppropriateException(response.status, retry_after)
+
+                if raw is True:
+                    return await response.read()
+                elif automatic_parsing is True:
+                    return _parse_response(self.json_decoder(await response.read()))
+                else:
+                    return await response.text()
+
+    async def close(self):
+        """
+        Close the underlying aiohttp session. It is re-created on the next call.
+        """
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+@Singleton
+class AsyncAPIConnection(_AsyncConnection):
+    QUERY_TEMPLATE = "http://api.steampowered.com/{interface}/{command}/{version}/"
+
+    def __init__(self, api_key=None, settings={}):
+        """
+        Initialise the main AsyncAPIConnection. Like APIConnection, this is a singleton object, so further
+        "initialisations" just retrieve the existing instance. Call "reset" to reassign the API key.
+
+        :param api_key: A Steam Web API key. (Optional, but recommended)
+        :param settings: A dictionary of advanced tweaks. (Optional)
+            precache -- True/False. (Default: True) Like APIConnection's: whether "fetch_friends" also fetches
+                        the friends' summaries, in batches.
+            Plus the options of "_AsyncConnection._configure_session".
+        """
+        self.reset(api_key)
+        self._configure_session(settings)
+
+        self.precache = True
+
+        if 'precache' in settings and type(settings['precache']) is bool:
+            self.precache = settings['precache']
+
+    def reset(self, api_key):
+        """
+        :param api_key: A Steam Web API key, a list of keys, or a throttle.KeyPool to spread calls across.
+        """
+        if type(api_key) is list or type(api_key) is tuple:
+            api_key = throttle.KeyPool(api_key)
+        if isinstance(api_key, throttle.KeyPool):
+            self.key_pool = api_key
+            self._api_key = None
+        else:
+            self.key_pool = None
+            self._api_key = api_key
+
+    async def call(self, interface, command, version, method=GET, **kwargs):
+        """
+        Call an API command. Takes the same arguments as APIConnection.call, but must be awaited.
+
+        :rtype : APIResponse or str
+        """
+        return await self._call(interface, command, version, method, kwargs, raw=False)
+
+    async def call_raw(self, interface, command, version, method=GET, **kwargs):
+        """
+        Call an API command like "call_raw" on APIConnection, but must be awaited.
+
+        :rtype : bytes
+        """
+        return await self._call(interface, command, version, method, kwargs, raw=True)
+
+    async def _call(self, interface, command, version, method, kwargs, raw):
+        automatic_parsing = _prepare_arguments(kwargs)
+
+        if self._api_key is not None:
+            kwargs["key"] = self._api_key
+
+        query = self.QUERY_TEMPLATE.format(interface=interface, command=command, version=version)
+
+        return await self._send(interface, method, query, kwargs, automatic_parsing, raw)
+
+
+@Singleton
+class AsyncStoreAPIConnection(_AsyncConnection):
+    QUERY_TEMPLATE = "http://store.steampowered.com/api/{command}/"
+
+    def __init__(self, settings={}):
+        """
+        Initialise the main AsyncStoreAPIConnection. This is a singleton object.
+
+        :param settings: A dictionary of advanced tweaks. See "_AsyncConnection._configure_session".
+                         (Optional)
+        """
+        self._configure_session(settings)
+
+    async def call(self, command, method=GET, **kwargs):
+        """
+        Call a store API command. Takes the same arguments as StoreAPIConnection.call, but must be awaited.
+
+        :rtype : APIResponse or str
+        """
+        return await self._call(command, method, kwargs, raw=False)
+
+    async def call_raw(self, command, method=GET, **kwargs):
+        """
+        Call a store API command like "call_raw" on StoreAPIConnection, but must be awaited.
+
+        :rtype : bytes
+        """
+        return await self._call(command, method, kwargs, raw=True)
+
+    async def _call(self, command, method, kwargs, raw):
+        automatic_parsing = _prepare_arguments(kwargs)
+
+        query = self.QUERY_TEMPLATE.format(command=command)
+
+        return await self._send(STORE_INTERFACE, method, query, kwargs, automatic_parsing, raw)
+
+
+async def _fetch_schema(appid):
+    """
+    The async counterpart of SteamAppSchema.get: shares the same per-process schema store.
+
+    :rtype: SteamAppSchema
+    """
+    schema = SteamAppSchema.lookup(appid)
+    if schema is None:
+        response = await AsyncAPIConnection().call("ISteamUserStats", "GetSchemaForGame", "v2", appid=appid)
+        schema = SteamAppSchema.store(appid, response.game)
+    return schema
+
+
+async def _fetch_achievement_snapshot(userid, appid):
+    """
+    The async counterpart of SteamAchievementSnapshot.get: shares the same per-process snapshot store.
+
+    :rtype: SteamAchievementSnapshot
+    """
+    snapshot = SteamAchievementSnapshot.lookup(userid, appid)
+    if snapshot is None:
+        response = await AsyncAPIConnection().call("ISteamUserStats",
+                                                   "GetPlayerAchievements",
+                                                   "v1",
+                                                   steamid=userid,
+                                                   appid=appid,
+                                                   l="English")
+        snapshot = SteamAchievementSnapshot.store(userid, appid, response.playerstats)
+    return snapshot
+
+
+class AsyncSteamAchievement(SteamAchievement):
+    async def fetch_is_hidden(self):
+        """
+        :rtype: bool
+        """
+        async def fetch():
+            achievement = (await _fetch_schema(self._appid)).achievement(self._id)
+            if achievement is not None:
+                return achievement.hidden != 0
+
+        return await _fetch_cached(self, SteamAchievement.is_hidden, fetch)
+
+    async def fetch_is_achieved(self):
+        """
+        :rtype: bool
+        """
+        if self._userid is None:
+            raise ValueError("No Steam ID linked to this achievement!")
+
+        async def fetch():
+            return (await _fetch_achievement_snapshot(self._userid, self._appid)).is_achieved(self._id)
+
+        return await _fetch_cached(self, SteamAchievement.is_achieved, fetch)
+
+
+class AsyncSteamApp(SteamApp):
+    async def fetch_schema(self):
+        """
+        :rtype: SteamAppSchema
+        """
+        return await _fetch_schema(self._id)
+
+    async def fetch_name(self):
+        """
+        :rtype: str
+        """
+        async def fetch():
+            return (await self.fetch_schema()).name
+
+        return await _fetch_cached(self, SteamApp.name, fetch)
+
+    async def fetch_achievements(self):
+        """
+        :rtype: list of AsyncSteamAchievement
+        """
+        async def fetch():
+            achievements_list = []
+            for achievement in (await self.fetch_schema()).achievements:
+                achievement_obj = AsyncSteamAchievement(self._id, achievement.name, achievement.displayName)
+                SteamAchievement.is_hidden.prime(achievement_obj, achievement.hidden != 0)
+                achievements_list += [achievement_obj]
+            return achievements_list
+
+        return await _fetch_cached(self, SteamApp.achievements, fetch)
+
+    async def fetch_app_info(self):
+        """
+        :rtype: APIResponse
+        """
+        missing = [group for group in APP_INFO_FILTERS if not self._has_details(group)]
+        if len(missing) > 0:
+            connection = AsyncStoreAPIConnection()
+            # Decoded by hand, like SteamApp._fetch_app_details: the store may answer with a bare "null".
+            details = connection.json_decoder(await connection.call_raw("appdetails", appids=self._id,
+                                                                        filters=missing))
+            data = SteamApp._app_data(details if type(details) is dict else None, self._id)
+            for group in missing:
+                getattr(SteamApp, "_details_" + group).prime(self, data)
+        # Every group is cached now, so this doesn't block.
+        return self.app_info
+
+
+async def _resolve_vanity(userurl):
+    """
+    The async counterpart of vanity.resolve_or_raise: shares the default resolver's store.
+
+    :rtype: int
+    :raise: errors.APIUserNotFound if no user has that vanity name.
+    """
+    resolver = vanity.default_resolver()
+    found, steamid = resolver.lookup(userurl)
+    if found is False:
+        response = await AsyncAPIConnection().call("ISteamUser", "ResolveVanityURL", "v0001", vanityurl=userurl)
+        steamid = None if response.success == vanity.NO_MATCH else int(response.steamid)
+        resolver.store(userurl, steamid)
+    if steamid is None:
+        raise errors.APIUserNotFound("No user has the vanity name \"{name}\"".format(name=userurl))
+    return steamid
+
+
+class AsyncSteamUser(SteamUser):
+    _app_class = AsyncSteamApp
+
+    @classmethod
+    async def from_vanity_url(cls, userurl):
+        """
+        Resolve a vanity URL-ending name and create a user for it, without blocking the event loop.
+
+        :type userurl: str
+        :rtype: AsyncSteamUser
+        """
+        return cls(await _resolve_vanity(userurl))
+
+    async def fetch_steamid(self):
+        """
+        The async counterpart of "steamid": resolves a user created from a vanity name without blocking the
+        event loop. Every "fetch_" method calls this first.
+
+        :rtype: int
+        :raise: errors.APIUserNotFound if the user was created from a vanity name no user has.
+        """
+        try:
+            return self._id
+        except AttributeError:
+            pass
+        steamid = await _resolve_vanity(self._userurl)
+        with self._resolve_lock:
+            if "_id" not in self.__dict__:
+                self._join_shared_cache(steamid)
+        return self._id
+
+    async def fetch_achievements(self, app):
+        """
+        :type app: int or SteamApp
+        :rtype: list of SteamAchievement
+        """
+        steamid = await self.fetch_steamid()
+        if isinstance(app, SteamApp):
+            app = app.appid
+        return (await _fetch_achievement_snapshot(steamid, app)).achievements
+
+    async def fetch_summary(self):
+        """
+        :rtype: APIResponse
+        """
+        steamid = await self.fetch_steamid()
+
+        async def fetch():
+            response = await AsyncAPIConnection().call("ISteamUser", "GetPlayerSummaries", "v0002",
+                                                       steamids=steamid)
+            return response.players[0]
+
+        return await _fetch_cached(self, SteamUser._summary, fetch)
+
+    async def fetch_bans(self):
+        """
+        :rtype: APIResponse
+        """
+        steamid = await self.fetch_steamid()
+
+        async def fetch():
+            response = await AsyncAPIConnection().call("ISteamUser", "GetPlayerBans", "v1", steamids=steamid)
+            return response.players[0]
+
+        return await _fetch_cached(self, SteamUser._bans, fetch)
+
+    async def fetch_badges(self):
+        """
+        :rtype: APIResponse
+        """
+        steamid = await self.fetch_steamid()
+
+        async def fetch():
+            return await AsyncAPIConnection().call("IPlayerService", "GetBadges", "v1", steamid=steamid)
+
+        return await _fetch_cached(self, SteamUser._badges, fetch)
+
+    async def fetch_groups(self):
+        """
+        :rtype: list of SteamGroup
+        """
+        steamid = await self.fetch_steamid()
+
+        async def fetch():
+            response = await AsyncAPIConnection().call("ISteamUser", "GetUserGroupList", "v1", steamid=steamid)
+            return [SteamGroup(group.gid) for group in response.groups]
+
+        return await _fetch_cached(self, SteamUser.groups, fetch)
+
+    async def fetch_friends(self):
+        """
+        :rtype: list of AsyncSteamUser
+        """
+        steamid = await self.fetch_steamid()
+
+        async def fetch():
+            response = await AsyncAPIConnection().call("ISteamUser", "GetFriendList", "v0001",
+                                                       steamid=steamid, relationship="friend")
+            friends_list = []
+            for friend in response.friendslist.friends:
+                friend_obj = AsyncSteamUser(friend.steamid)
+                friend_obj.friend_since = friend.friend_since
+                friends_list += [friend_obj]
+
+            # Same as SteamUser.friends, but the summary chunks are fetched concurrently.
+            if AsyncAPIConnection().precache is True:
+                batch = UserBatch(friends_list)
+                jobs = batch._jobs(("summary",))
+                responses = await asyncio.gather(*[AsyncAPIConnection().call(*UserBatch.FIELDS[field][:3],
+                                                                             steamids=chunk)
+                                                   for field, chunk in jobs])
+                for (field, chunk), response in zip(jobs, responses):
+                    batch._prime(field, response)
+            return friends_list
+
+        return await _fetch_cached(self, SteamUser.friends, fetch)
+
+    async def fetch_badge_list(self):
+        """
+        :rtype: list of SteamUserBadge
+        """
+        badges = await self.fetch_badges()
+        return [SteamUserBadge(badge.badgeid,
+                               badge.level,
+                               badge.completion_time,
+                               badge.xp,
+                               badge.scarcity,
+                               badge.appid) for badge in badges.badges]
+
+    async def fetch_recently_played(self):
+        """
+        :rtype: list of AsyncSteamApp
+        """
+        steamid = await self.fetch_steamid()
+
+        async def fetch():
+            response = await AsyncAPIConnection().call("IPlayerService", "GetRecentlyPlayedGames", "v1",
+                                                       steamid=steamid)
+            return self._convert_games_list(response.games)
+
+        return await _fetch_cached(self, SteamUser.recently_played, fetch)
+
+    async def fetch_games(self):
+        """
+        :rtype: list of AsyncSteamApp
+        """
+        steamid = await self.fetch_steamid()
+
+        async def fetch():
+            response = await AsyncAPIConnection().call("IPlayerService",
+                                                       "GetOwnedGames",
+                                                       "v1",
+                                                       steamid=steamid,
+                                                       include_appinfo=True,
+                                                       include_played_free_games=True)
+            return self._convert_games_list(response.games)
+
+        return await _fetch_cached(self, SteamUser.games, fetch)
+
+    async def fetch_owned_games(self):
+        """
+        :rtype: list of AsyncSteamApp
+        """
+        steamid = await self.fetch_steamid()
+
+        async def fetch():
+            response = await AsyncAPIConnection().call("IPlayerService",
+                                                       "GetOwnedGames",
+                                                       "v1",
+                                                       steamid=steamid,
+                                                       include_appinfo=True,
+                                                       include_played_free_games=False)
+            return self._convert_games_list(response.games)
+
+        return await _fetch_cached(self, SteamUser.owned_games, fetch)
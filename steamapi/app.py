@@ -1,106 +1,390 @@
 __author__ = 'SmileyBarry'
 
-from .core import APIConnection, SteamObject, StoreAPIConnection
-from .decorators import cached_property, INFINITE
+from .cache import LRUCache, shared_cache
+from .core import APIConnection, APIResponse, SteamObject, StoreAPIConnection, _chunks, _parallel_map
+from .decorators import cached_property, INFINITE, HOUR
+from . import errors
+
+import datetime
+import threading
+
+# The "appdetails" filter groups "SteamApp.app_info" asks for.
+APP_INFO_FILTERS = ("basic", "fullgame", "developers", "publishers", "demos", "price_overview", "platforms",
+                    "metacritic", "categories", "genres", "recommendations", "release_date")
+
+
+def _check_filter_groups(groups):
+    """
+    :raise: ValueError on groups that aren't in APP_INFO_FILTERS.
+    """
+    for group in groups:
+        if group not in APP_INFO_FILTERS:
+            raise ValueError("Unknown filter group: {group}".format(group=group))
+
+
+class SteamAppSchema(object):
+    """
+    An app's "GetSchemaForGame" response, fetched once per process and shared by "SteamApp.name",
+    "SteamApp.achievements" and "SteamAchievement.is_hidden", with its achievements indexed by API name.
+
+    Use "SteamAppSchema.get" instead of creating these directly. The most recently used schemas are
+    kept; schemas never expire otherwise.
+    """
+    _schemas = LRUCache(max_entries=256)
+
+    def __init__(self, appid, game):
+        """
+        :param appid: The app's ID.
+        :param game: The "game" object of a "GetSchemaForGame" response.
+        :type game: APIResponse
+        """
+        self._appid = appid
+        self._game = game
+        self._achievements = []
+        if game.availableGameStats is not None and game.availableGameStats.achievements is not None:
+            self._achievements = game.availableGameStats.achievements
+        self._achievement_index = {achievement.name: achievement for achievement in self._achievements}
+
+    @classmethod
+    def get(cls, appid):
+        """
+        Return an app's schema, fetching it on first use.
+
+        :rtype: SteamAppSchema
+        """
+        schema = cls.lookup(appid)
+        if schema is None:
+            response = APIConnection().call("ISteamUserStats", "GetSchemaForGame", "v2", appid=appid)
+            schema = cls.store(appid, response.game)
+        return schema
+
+    @classmethod
+    def lookup(cls, appid):
+        """
+        :return: An app's schema if it was already fetched, None otherwise.
+        :rtype: SteamAppSchema or None
+        """
+        return cls._schemas.get(str(appid))
+
+    @classmethod
+    def store(cls, appid, game):
+        """
+        Create an app's schema from a fetched "GetSchemaForGame" response and keep it.
+
+        :type game: APIResponse
+        :rtype: SteamAppSchema
+        """
+        schema = cls(appid, game)
+        cls._schemas.set(str(appid), schema)
+        return schema
+
+    @property
+    def appid(self):
+        return self._appid
+
+    @property
+    def name(self):
+        """
+        :rtype: str
+        """
+        return self._game.gameName
+
+    @property
+    def achievements(self):
+        """
+        :rtype: list of APIResponse
+        """
+        return self._achievements
+
+    def achievement(self, apiname):
+        """
+        :return: The raw schema entry for one achievement, or None if the app has no such achievement.
+        :rtype: APIResponse or None
+        """
+        return self._achievement_index.get(apiname)
 
 
 class SteamApp(SteamObject):
-    def __init__(self, appid, name=None):
+    def __init__(self, appid, name=None, prefetch=None):
+        """
+        :param appid: The app's ID.
+        :param name: The app's name, if already known. (Optional)
+        :param prefetch: Store detail filter groups (see APP_INFO_FILTERS) to fetch together, in one call,
+                         the first time any store detail is read. Without it, each group is fetched on its
+                         own when it's first needed. (Optional)
+        :type prefetch: list of str
+        :raise: ValueError on unknown filter groups.
+        """
         self._id = appid
+        self._cache = shared_cache("app", appid)
+        self._prefetch = tuple(prefetch or ())
+        _check_filter_groups(self._prefetch)
         if name is not None:
-            import time
-            self._cache = dict()
-            self._cache['name'] = (name, time.time())
+            SteamApp.name.prime(self, name)
+
+    # The store only answers multi-app "appdetails" calls for these filter sets, and only for so many app
+    # IDs at once; every other filter set is fetched one app per call. The batch size the store has been
+    # found to accept is remembered per filter set.
+    BATCHED_APPDETAILS_FILTERS = (("price_overview",),)
+    APPDETAILS_BATCH_SIZE = 100
+    _appdetails_batch_sizes = {}
+    _appdetails_batch_sizes_lock = threading.Lock()
+
+    @classmethod
+    def _appdetails_batch_size(cls, filters):
+        """
+        :return: How many app IDs to ask for per "appdetails" call, with these filters.
+        :rtype: int
+        """
+        if filters not in cls.BATCHED_APPDETAILS_FILTERS:
+            return 1
+        return cls._appdetails_batch_sizes.get(filters, cls.APPDETAILS_BATCH_SIZE)
+
+    @classmethod
+    def load_many(cls, apps, filters=APP_INFO_FILTERS, max_workers=4, refresh=False):
+        """
+        Create (or reuse) many apps at once and fill their store details caches with as few "appdetails"
+        calls as the store allows. Price-only loads are requested in batches: the first batch is sent on
+        its own, and split until the store accepts it, and the rest are sent at the size that worked. That
+        size is remembered for the next load. Other filter sets are fetched one app per call.
+
+        :param apps: App IDs and/or SteamApp objects. Duplicates, and apps whose requested filter groups
+                     are all cached already, aren't fetched.
+        :type apps: list of int, str or SteamApp
+        :param filters: The filter groups to load, out of APP_INFO_FILTERS. A narrower set means smaller
+                        responses and larger batches. (E.g.: ("price_overview",))
+        :type filters: tuple of str
+        :param max_workers: How many batches to fetch concurrently.
+        :type max_workers: int
+        :param refresh: Fetch every app, even those whose groups are all cached.
+        :type refresh: bool
+        :rtype: list of SteamApp
+        :raise: ValueError on unknown filter groups.
+        """
+        return cls._load_many(apps, filters, max_workers, refresh)[0]
+
+    @classmethod
+    def _load_many(cls, apps, filters, max_workers, refresh, on_call=None):
+        """
+        "load_many", also counting the calls it made.
+
+        :param on_call: Called (from any thread) right before every "appdetails" call, so callers can count
+                        the calls made even if a later one fails. (Optional)
+        :return: The apps, and the number of "appdetails" calls.
+        :rtype: (list of SteamApp, int)
+        """
+        filters = tuple(filters)
+        _check_filter_groups(filters)
+        app_list = []
+        missing = []
+        seen = set()
+        for app in apps:
+            if not isinstance(app, SteamApp):
+                app = cls(app)
+            if str(app.appid) in seen:
+                continue
+            seen.add(str(app.appid))
+            app_list += [app]
+            if refresh is True or not all(app._has_details(group) for group in filters):
+                missing += [app]
+
+        # Probe with one batch first, so a rejected size is only found out about once...
+        probe_size = cls._appdetails_batch_size(filters)
+        calls = cls._load_app_details(missing[:probe_size], filters, on_call) if len(missing) > 0 else 0
+        # ...then send the rest at the size that worked.
+        batches = _chunks(missing[probe_size:], cls._appdetails_batch_size(filters))
+        calls += sum(_parallel_map(lambda batch: cls._load_app_details(batch, filters, on_call), batches,
+                                   max_workers))
+        return app_list, calls
+
+    @classmethod
+    def _load_app_details(cls, batch, filters, on_call=None):
+        """
+        Fetch and cache one batch's store details, splitting it if the store rejects it.
+
+        :return: The number of "appdetails" calls made.
+        :rtype: int
+        """
+        if on_call is not None:
+            on_call()
+        try:
+            details = cls._fetch_app_details([app.appid for app in batch], filters)
+        except errors.APIBadCall:
+            if len(batch) == 1:
+                raise
+            details = None
+
+        if details is None and len(batch) > 1:
+            # Rejected: halve the learned size (unless another batch has already lowered it further), and
+            # retry at the learned size, which a rejected chunk may lower again on the way.
+            with cls._appdetails_batch_sizes_lock:
+                cls._appdetails_batch_sizes[filters] = min(len(batch) // 2, cls._appdetails_batch_size(filters))
+            calls = 1
+            while len(batch) > 0:
+                batch_size = cls._appdetails_batch_size(filters)
+                calls += cls._load_app_details(batch[:batch_size], filters, on_call)
+                batch = batch[batch_size:]
+            return calls
+
+        for app in batch:
+            data = cls._app_data(details, app.appid)
+            for group in filters:
+                getattr(SteamApp, "_details_" + group).prime(app, data)
+        return 1
+
+    @staticmethod
+    def _fetch_app_details(appids, filters):
+        """
+        :return: The raw "appdetails" response, keyed by app ID, or None if the store refused the batch.
+        :rtype: dict or None
+        """
+        connection = StoreAPIConnection()
+        # Decoded by hand: a refused batch comes back as a bare "null", which "call" can't wrap.
+        details = connection.json_decoder(connection.call_raw("appdetails", appids=appids, filters=list(filters)))
+        if type(details) is not dict or not any(str(appid) in details for appid in appids):
+            return None
+        return details
+
+    @staticmethod
+    def _app_data(details, appid):
+        """
+        :param details: A raw "appdetails" response, or None.
+        :return: One app's details, or None if the store has none for it.
+        :rtype: APIResponse or None
+        """
+        entry = (details or {}).get(str(appid))
+        if type(entry) is dict and entry.get("success") and type(entry.get("data")) is dict:
+            return APIResponse(entry["data"])
+        return None
+
+    def _has_details(self, group):
+        try:
+            getattr(SteamApp, "_details_" + group).lookup(self)
+            return True
+        except KeyError:
+            return False
+
+    def _fetch_details(self, groups):
+        """
+        Fetch some filter groups of this app's store details in one call, along with the "prefetch"
+        groups that aren't cached yet, and cache each group.
+
+        :return: The fetched details, or None if the store has none for this app.
+        :rtype: APIResponse or None
+        """
+        groups = list(groups)
+        for group in self._prefetch:
+            if group not in groups and not self._has_details(group):
+                groups += [group]
+        data = self._app_data(self._fetch_app_details([self._id], groups), self._id)
+        for group in groups:
+            getattr(SteamApp, "_details_" + group).prime(self, data)
+        return data
+
+    def _detail(self, group, field):
+        """
+        :return: One field of this app's store details, fetching its filter group if needed.
+        """
+        details = getattr(self, "_details_" + group)
+        if details:
+            return getattr(details, field)
 
     @property
     def appid(self):
         return self._id
 
+    @property
+    def schema(self):
+        """
+        :rtype: SteamAppSchema
+        """
+        return SteamAppSchema.get(self._id)
+
     @cached_property(ttl=INFINITE)
     def achievements(self):
-        response = APIConnection().call("ISteamUserStats", "GetSchemaForGame", "v2", appid=self._id)
         achievements_list = []
-        import time
-        for achievement in response.game.availableGameStats.achievements:
+        for achievement in self.schema.achievements:
             achievement_obj = SteamAchievement(self._id, achievement.name, achievement.displayName)
-            achievement_obj._cache = {}
-            if achievement.hidden == 0:
-                achievement_obj._cache['hidden'] = (False, time.time())
-            else:
-                achievement_obj._cache['hidden'] = (True, time.time())
+            SteamAchievement.is_hidden.prime(achievement_obj, achievement.hidden != 0)
             achievements_list += [achievement_obj]
         return achievements_list
 
     @cached_property(ttl=INFINITE)
     def name(self):
-        response = APIConnection().call("ISteamUserStats", "GetSchemaForGame", "v2", appid=self._id)
-        return response.game.gameName
+        return self.schema.name
 
-    @cached_property(ttl=INFINITE)
+    @property
     def app_info(self):
-        response = StoreAPIConnection().call("appdetails", appids=self._id, filters="basic,fullgame,developers," +
-                                                                                    "publishers,demos,price_overview," +
-                                                                                    "platforms,metacritic,categories," +
-                                                                                    "genres,recommendations," +
-                                                                                    "release_date")
-        if response[str(self._id)].success:
-            return response[str(self._id)].data
+        """
+        This app's store details, with every filter group in APP_INFO_FILTERS. The groups that aren't
+        cached yet are fetched together, in one call. The properties below only fetch the group they need.
+
+        :rtype: APIResponse or None
+        """
+        missing = [group for group in APP_INFO_FILTERS if not self._has_details(group)]
+        if len(missing) > 0:
+            self._fetch_details(missing)
+
+        parts = []
+        for group in APP_INFO_FILTERS:
+            details = getattr(self, "_details_" + group)
+            if details is not None and all(details is not part for part in parts):
+                parts += [details]
+        if len(parts) == 0:
+            return None
+        elif len(parts) == 1:
+            return parts[0]
+        merged = {}
+        for part in parts:
+            merged.update(part._raw)
+        return APIResponse(merged)
 
     @property
     def type(self):
         """ Either 'game', 'movie' or 'demo'. More values could be possible.  """
-        if self.app_info:
-            return self.app_info.type
+        return self._detail("basic", "type")
 
     @property
     def required_age(self):
         """ Minimum age to access SteamApp. """
-        if self.app_info:
-            return self.app_info.required_age
+        return self._detail("basic", "required_age")
 
     @property
     def dlc(self):
         """ List the appids of the SteamApp's DLCs. """
         #TODO: Return list of SteamApps instead of list of ids
-        if self.app_info:
-            return self.app_info.dlc
+        return self._detail("basic", "dlc")
 
     @property
     def detailed_description(self):
         """ Detailed unicode description of SteamApp in html. """
-        if self.app_info:
-            return self.app_info.detailed_description
+        return self._detail("basic", "detailed_description")
 
     @property
     def about_the_game(self):
         """ Short unicode description of SteamApp in html. """
-        if self.app_info:
-            return self.app_info.about_the_game
+        return self._detail("basic", "about_the_game")
 
     @property
     def supported_languages(self):
         """ Returns an html unicode string describing available languages. """
         #TODO: Translate html into a more user friendly format
-        if self.app_info:
-            return self.app_info.supported_languages
+        return self._detail("basic", "supported_languages")
 
     @property
     def header_image(self):
         """ Link to the header image of the SteamApp. """
-        if self.app_info:
-            return self.app_info.header_image
+        return self._detail("basic", "header_image")
 
     @property
     def legal_notice(self):
         """ Legal notice attached to the SteamApp. """
-        if self.app_info:
-            return self.app_info.legal_notice
+        return self._detail("basic", "legal_notice")
 
     @property
     def website(self):
         """ Link to the SteamApp's website. """
-        if self.app_info:
-            return self.app_info.website
+        return self._detail("basic", "website")
 
     @property
     def pc_requirements(self):
@@ -109,8 +393,7 @@ class SteamApp(SteamObject):
             recommended: Html string describing recommended requirements
             minimunm: Html string describing minimal requirements
         """
-        if self.app_info:
-            return self.app_info.pc_requirements
+        return self._detail("basic", "pc_requirements")
 
     @property
     def mac_requirements(self):
@@ -119,8 +402,7 @@ class SteamApp(SteamObject):
             recommended: Html string describing recommended requirements
             minimunm: Html string describing minimal requirements
         """
-        if self.app_info:
-            return self.app_info.mac_requirements
+        return self._detail("basic", "mac_requirements")
 
     @property
     def linux_requirements(self):
@@ -129,26 +411,22 @@ class SteamApp(SteamObject):
             recommended: Html string describing recommended requirements
             minimunm: Html string describing minimal requirements
         """
-        if self.app_info:
-            return self.app_info.linux_requirements
+        return self._detail("basic", "linux_requirements")
 
     @property
     def fullgame(self):
         """ Steam id of fullgame if current SteamApp is a demo. """
-        if self.app_info:
-            return self.app_info.fullgame
+        return self._detail("fullgame", "fullgame")
 
     @property
     def developers(self):
         """ List of SteamApp's developers. """
-        if self.app_info:
-            return self.app_info.developers
+        return self._detail("developers", "developers")
 
     @property
     def publishers(self):
         """ List of SteamApp's publishers. """
-        if self.app_info:
-            return self.app_info.publishers
+        return self._detail("publishers", "publishers")
 
     @property
     def demos(self):
@@ -158,8 +436,7 @@ class SteamApp(SteamObject):
             description: Used to note the demo's restrictions
         """
         #TODO: Return a SteamApp instead of the demo's appid
-        if self.app_info:
-            return self.app_info.demos
+        return self._detail("demos", "demos")
 
     @property
     def price_overview(self):
@@ -170,8 +447,7 @@ class SteamApp(SteamObject):
             final: Discounted price
             discount_percent
         """
-        if self.app_info:
-            return self.app_info.price_overview
+        return self._detail("price_overview", "price_overview")
 
     @property
     def platforms(self):
@@ -181,8 +457,7 @@ class SteamApp(SteamObject):
             mac
             linux
         """
-        if self.app_info:
-            return self.app_info.platforms
+        return self._detail("platforms", "platforms")
 
     @property
     def metacritic(self):
@@ -191,8 +466,7 @@ class SteamApp(SteamObject):
             score
             url: Url to metacritic page.
         """
-        if self.app_info:
-            return self.app_info.metacritic
+        return self._detail("metacritic", "metacritic")
 
     @property
     def categories(self):
@@ -202,8 +476,7 @@ class SteamApp(SteamObject):
             description: Short description of the category
         """
         #TODO: Transform into a list of descriptions.
-        if self.app_info:
-            return self.app_info.categories
+        return self._detail("categories", "categories")
 
     @property
     def genres(self):
@@ -213,8 +486,7 @@ class SteamApp(SteamObject):
             description: Short description of the genre
         """
         #TODO: Transform into a list of descriptions.
-        if self.app_info:
-            return self.app_info.genres
+        return self._detail("genres", "genres")
 
     @property
     def recommendations(self):
@@ -222,8 +494,7 @@ class SteamApp(SteamObject):
         Information related to the SteamApp recommendations
             total : integer
         """
-        if self.app_info:
-            return self.app_info.recommendations
+        return self._detail("recommendations", "recommendations")
 
     @property
     def release_date(self):
@@ -232,13 +503,25 @@ class SteamApp(SteamObject):
             coming_soon: True if unreleased, False otherwise
             date: Date string formatted according to cc parameter. Empty when unreleased.
         """
-        if self.app_info:
-            return self.app_info.release_date
+        return self._detail("release_date", "release_date")
 
     def __str__(self):
         return self.name
 
 
+def _details_group(group):
+    """
+    Create the cached property holding the store details one filter group was fetched with.
+    """
+    def fetch_group(self):
+        return self._fetch_details((group,))
+    fetch_group.__name__ = "_details_" + group
+    return cached_property(ttl=INFINITE)(fetch_group)
+
+for _group in APP_INFO_FILTERS:
+    setattr(SteamApp, "_details_" + _group, _details_group(_group))
+
+
 class SteamAchievement(SteamObject):
     def __init__(self, linked_appid, apiname, displayname, linked_userid=None):
         self._appid = linked_appid
@@ -264,32 +547,123 @@ class SteamAchievement(SteamObject):
 
     @cached_property(ttl=INFINITE)
     def is_hidden(self):
-        response = APIConnection().call("ISteamUserStats",
-                                        "GetSchemaForGame",
-                                        "v2",
-                                        appid=self._appid)
-        for achievement in response.game.availableGameStats.achievements:
-            if achievement.name == self._id:
-                if achievement.hidden == 0:
-                    return False
-                else:
-                    return True
+        achievement = SteamAppSchema.get(self._appid).achievement(self._id)
+        if achievement is not None:
+            return achievement.hidden != 0
 
     @cached_property(ttl=INFINITE)
     def is_achieved(self):
         if self._userid is None:
             raise ValueError("No Steam ID linked to this achievement!")
-        response = APIConnection().call("ISteamUserStats",
-                                        "GetPlayerAchievements",
-                                        "v1",
-                                        steamid=self._userid,
-                                        appid=self._appid,
-                                        l="English")
-        for achievement in response.playerstats.achievements:
-            if achievement.apiname == self._id:
-                if achievement.achieved == 1:
-                    return True
-                else:
-                    return False
-        # Cannot be found.
-        return False
\ No newline at end of file
+        return SteamAchievementSnapshot.get(self._userid, self._appid).is_achieved(self._id)
+
+    @cached_property(ttl=INFINITE)
+    def unlock_time(self):
+        """
+        :return: When the linked user unlocked this achievement, or None if they haven't.
+        :rtype: datetime.datetime or None
+        """
+        if self._userid is None:
+            raise ValueError("No Steam ID linked to this achievement!")
+        return SteamAchievementSnapshot.get(self._userid, self._appid).unlock_time(self._id)
+
+
+class SteamAchievementSnapshot(object):
+    """
+    One user's achievement progress in one app, from a single "GetPlayerAchievements" call and indexed by
+    API name. "SteamAchievement.is_achieved" and "unlock_time" read from it, so checking every achievement
+    of a game costs one call instead of one per achievement.
+
+    Use "SteamAchievementSnapshot.get" instead of creating these directly. Snapshots are kept for an hour.
+    """
+    _snapshots = LRUCache(max_entries=1024, ttl=HOUR)
+
+    def __init__(self, userid, appid, playerstats):
+        """
+        :param userid: The user's 64-bit SteamID.
+        :param appid: The app's ID.
+        :param playerstats: The "playerstats" object of a "GetPlayerAchievements" response.
+        :type playerstats: APIResponse
+        """
+        self._userid = userid
+        self._appid = appid
+        self._achievements = playerstats.achievements or []
+        self._achievement_index = {achievement.apiname: achievement for achievement in self._achievements}
+
+    @classmethod
+    def get(cls, userid, appid):
+        """
+        Return a user's achievement progress in an app, fetching it if there's no recent snapshot.
+
+        :rtype: SteamAchievementSnapshot
+        """
+        snapshot = cls.lookup(userid, appid)
+        if snapshot is None:
+            response = APIConnection().call("ISteamUserStats",
+                                            "GetPlayerAchievements",
+                                            "v1",
+                                            steamid=userid,
+                                            appid=appid,
+                                            l="English")
+            snapshot = cls.store(userid, appid, response.playerstats)
+        return snapshot
+
+    @classmethod
+    def lookup(cls, userid, appid):
+        """
+        :return: A recent snapshot, or None if there isn't one.
+        :rtype: SteamAchievementSnapshot or None
+        """
+        return cls._snapshots.get((str(userid), str(appid)))
+
+    @classmethod
+    def store(cls, userid, appid, playerstats):
+        """
+        Create a snapshot from a fetched "GetPlayerAchievements" response and keep it.
+
+        :type playerstats: APIResponse
+        :rtype: SteamAchievementSnapshot
+        """
+        snapshot = cls(userid, appid, playerstats)
+        cls._snapshots.set((str(userid), str(appid)), snapshot)
+        return snapshot
+
+    @property
+    def userid(self):
+        return self._userid
+
+    @property
+    def appid(self):
+        return self._appid
+
+    def is_achieved(self, apiname):
+        """
+        :rtype: bool
+        """
+        achievement = self._achievement_index.get(apiname)
+        # Achievements that can't be found aren't achieved.
+        return achievement is not None and achievement.achieved == 1
+
+    def unlock_time(self, apiname):
+        """
+        :rtype: datetime.datetime or None
+        """
+        if not self.is_achieved(apiname):
+            return None
+        return datetime.datetime.fromtimestamp(self._achievement_index[apiname].unlocktime)
+
+    @property
+    def achievements(self):
+        """
+        All of this app's achievements, linked to the user and with "is_achieved" and "unlock_time"
+        already filled in.
+
+        :rtype: list of SteamAchievement
+        """
+        achievements_list = []
+        for achievement in self._achievements:
+            achievement_obj = SteamAchievement(self._appid, achievement.apiname, achievement.name, self._userid)
+            SteamAchievement.is_achieved.prime(achievement_obj, achievement.achieved == 1)
+            SteamAchievement.unlock_time.prime(achievement_obj, self.unlock_time(achievement.apiname))
+            achievements_list += [achievement_obj]
+        return achievements_list
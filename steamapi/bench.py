@@ -0,0 +1,541 @@
+"""
+An offline benchmark for the library's main workflows. It runs against a local stand-in for the Steam Web API
+and store, so results don't depend on the network, the real API's rate limits or an API key::
+
+    python -m steamapi.bench --iterations 50 --latency 0.02 --error-rate 0.01
+
+For every workflow, it reports requests per second, p50/p99 latency per workflow run, the peak memory allocated
+while running it (via "tracemalloc", on Python 3) and the process' peak RSS afterwards.
+
+The stand-in server generates responses shaped and sized like the real ones. To serve recorded responses instead,
+put them in a directory as "<command>.json" (e.g. "GetOwnedGames.json") and pass it as "--responses".
+"""
+__author__ = 'SmileyBarry'
+
+import argparse
+import collections
+import json
+import os
+import random
+import threading
+import time
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qs
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qs
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from .app import SteamApp, SteamAppSchema
+from .core import APIConnection, StoreAPIConnection
+from .user import SteamUser
+
+BASE_STEAMID = 76561197960265728
+BASE_APPID = 100000
+
+# "appdetails" filter groups that fill a field of their own name. "basic" fills everything else.
+_NAMED_DETAIL_GROUPS = ("fullgame", "developers", "publishers", "demos", "price_overview", "platforms",
+                        "metacritic", "categories", "genres", "recommendations", "release_date")
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class FakeSteamServer(object):
+    """
+    A local HTTP server that answers the Web API and store commands the library uses, with configurable
+    latency and error rates. Use it as a context manager to point the API connections at it::
+
+        with FakeSteamServer(latency=0.01) as server:
+            SteamUser(76561197960265728).friends
+            print(server.request_count)
+    """
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, error_status=503, responses_dir=None, seed=0,
+                 friends_per_user=250, games_per_user=500, achievements_per_app=100, description_size=8192,
+                 retry_after=0):
+        """
+        :param latency: Seconds every response is delayed by.
+        :type latency: float
+        :param jitter: Up to this many more seconds, chosen at random per response.
+        :type jitter: float
+        :param error_rate: The fraction of calls answered with "error_status" instead.
+        :type error_rate: float
+        :param responses_dir: A directory of recorded responses, as "<command>.json". Commands without a
+                              recording get a generated response. (Optional)
+        :type responses_dir: str
+        :param seed: Seeds the error and jitter randomness, so runs are repeatable.
+        :param friends_per_user: How many friends "GetFriendList" returns.
+        :param games_per_user: How many games "GetOwnedGames" returns.
+        :param achievements_per_app: How many achievements "GetSchemaForGame" returns.
+        :param description_size: Roughly how long the HTML descriptions of "appdetails" are, in characters.
+        :param retry_after: The "Retry-After" header of 429 answers, in seconds.
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.responses_dir = responses_dir
+        self.friends_per_user = friends_per_user
+        self.games_per_user = games_per_user
+        self.achievements_per_app = achievements_per_app
+        self.description_size = description_size
+        self.retry_after = retry_after
+        self.request_count = 0
+        self.error_count = 0
+        self.bytes_sent = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._recordings = {}
+        self._server = None
+        self._previous_templates = None
+
+    # LIFECYCLE
+    def start(self):
+        """
+        Start serving on a free localhost port, in a background thread.
+        """
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Buffer the whole response, so it goes out in one segment instead of tripping delayed ACKs.
+            wbufsize = 1 << 16
+
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                params = dict((name, values[0]) for name, values in parse_qs(parsed.query).items())
+                if self.command == "POST":
+                    length = int(self.headers.get("Content-Length") or 0)
+                    body = self.rfile.read(length).decode("utf-8")
+                    params.update((name, values[0]) for name, values in parse_qs(body).items())
+                status, body = server._respond(parsed.path, params)
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                if status == 429:
+                    self.send_header("Retry-After", str(server.retry_after))
+                self.end_headers()
+                self.wfile.write(body)
+                self.wfile.flush()
+
+            do_POST = do_GET
+
+            def log_message(self, *args):
+                pass
+
+        self._server = _ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        thread = threading.Thread(target=self._server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def redirect(self):
+        """
+        Point the API connections at this server, until "restore" is called.
+        """
+        api = APIConnection()
+        store = StoreAPIConnection()
+        self._previous_templates = (api.QUERY_TEMPLATE, store.QUERY_TEMPLATE)
+        api.QUERY_TEMPLATE = "http://127.0.0.1:{port}/{{interface}}/{{command}}/{{version}}/".format(port=self.port)
+        store.QUERY_TEMPLATE = "http://127.0.0.1:{port}/api/{{command}}/".format(port=self.port)
+
+    def restore(self):
+        if self._previous_templates is not None:
+            APIConnection().QUERY_TEMPLATE, StoreAPIConnection().QUERY_TEMPLATE = self._previous_templates
+            self._previous_templates = None
+
+    def __enter__(self):
+        self.start()
+        self.redirect()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.restore()
+        self.stop()
+
+    # RESPONSES
+    def _respond(self, path, params):
+        """
+        :return: The HTTP status and body to answer a call with.
+        :rtype: (int, bytes)
+        """
+        with self._lock:
+            self.request_count += 1
+            delay = self.latency
+            if self.jitter > 0:
+                delay += self._random.uniform(0, self.jitter)
+            failed = self.error_rate > 0 and self._random.random() < self.error_rate
+            if failed is True:
+                self.error_count += 1
+        if delay > 0:
+            time.sleep(delay)
+        if failed is True:
+            return self.error_status, b""
+
+        # "/ISteamUser/GetPlayerSummaries/v0002/" or "/api/appdetails/".
+        command = path.strip("/").split("/")[1]
+        body = self._recording(command)
+        if body is None:
+            generate = getattr(self, "_generate_" + command, None)
+            if generate is None:
+                return 404, b""
+            body = json.dumps(generate(params)).encode("utf-8")
+        with self._lock:
+            self.bytes_sent += len(body)
+        return 200, body
+
+    def _recording(self, command):
+        if self.responses_dir is None:
+            return None
+        with self._lock:
+            if command not in self._recordings:
+                path = os.path.join(self.responses_dir, command + ".json")
+                recording = None
+                if os.path.exists(path):
+                    with open(path, "rb") as recording_file:
+                        recording = recording_file.read()
+                self._recordings[command] = recording
+            return self._recordings[command]
+
+    @staticmethod
+    def _player(steamid):
+        number = int(steamid) % 100000
+        player = {"steamid": str(steamid),
+                  "communityvisibilitystate": 1 if number % 10 == 9 else 3,
+                  "profilestate": 1,
+                  "personaname": "Player {number}".format(number=number),
+                  "commentpermission": 1,
+                  "profileurl": "https://steamcommunity.com/profiles/{steamid}/".format(steamid=steamid),
+                  "avatar": "https://avatars.steamstatic.com/{number:040x}.jpg".format(number=number),
+                  "avatarmedium": "https://avatars.steamstatic.com/{number:040x}_medium.jpg".format(number=number),
+                  "avatarfull": "https://avatars.steamstatic.com/{number:040x}_full.jpg".format(number=number),
+                  "avatarhash": "{number:040x}".format(number=number),
+                  "lastlogoff": 1500000000 + number,
+                  "personastate": number % 7,
+                  "realname": "Real Name {number}".format(number=number),
+                  "primaryclanid": "103582791429521408",
+                  "timecreated": 1100000000 + number,
+                  "personastateflags": 0,
+                  "loccountrycode": "US"}
+        if number % 4 == 0:
+            player["gameid"] = str(BASE_APPID + number % 50)
+            player["gameextrainfo"] = "Game {number}".format(number=number % 50)
+        return player
+
+    def _generate_GetPlayerSummaries(self, params):
+        return {"response": {"players": [self._player(steamid) for steamid in params["steamids"].split(",")]}}
+
+    def _generate_GetPlayerBans(self, params):
+        return {"players": [{"SteamId": steamid, "CommunityBanned": False, "VACBanned": False,
+                             "NumberOfVACBans": 0, "DaysSinceLastBan": 0, "NumberOfGameBans": 0,
+                             "EconomyBan": "none"} for steamid in params["steamids"].split(",")]}
+
+    def _generate_GetFriendList(self, params):
+        steamid = int(params["steamid"])
+        return {"friendslist": {"friends": [{"steamid": str(steamid + index + 1),
+                                             "relationship": "friend",
+                                             "friend_since": 1300000000 + index}
+                                            for index in range(self.friends_per_user)]}}
+
+    def _generate_GetOwnedGames(self, params):
+        include_appinfo = params.get("include_appinfo") == "1"
+        games = []
+        for index in range(self.games_per_user):
+            game = {"appid": BASE_APPID + index,
+                    "playtime_forever": index * 37 % 10000,
+                    "playtime_windows_forever": index * 37 % 10000,
+                    "playtime_mac_forever": 0,
+                    "playtime_linux_forever": 0,
+                    "rtime_last_played": 1600000000 + index}
+            if include_appinfo is True:
+                game["name"] = "Game {index}".format(index=index)
+                game["img_icon_url"] = "{index:040x}".format(index=index)
+                game["has_community_visible_stats"] = index % 2 == 0
+            games += [game]
+        return {"response": {"game_count": len(games), "games": games}}
+
+    _generate_GetRecentlyPlayedGames = _generate_GetOwnedGames
+
+    def _generate_GetSchemaForGame(self, params):
+        achievements = [{"name": "ACHIEVEMENT_{index}".format(index=index),
+                         "defaultvalue": 0,
+                         "displayName": "Achievement {index}".format(index=index),
+                         "hidden": index % 5 == 0 and 1 or 0,
+                         "description": "Do the thing number {index} in a remarkable way.".format(index=index),
+                         "icon": "https://cdn.steamstatic.com/{index:040x}.jpg".format(index=index),
+                         "icongray": "https://cdn.steamstatic.com/{index:040x}_gray.jpg".format(index=index)}
+                        for index in range(self.achievements_per_app)]
+        return {"game": {"gameName": "Game {appid}".format(appid=params["appid"]),
+                         "gameVersion": "12",
+                         "availableGameStats": {"achievements": achievements}}}
+
+    def _generate_GetPlayerAchievements(self, params):
+        achievements = [{"apiname": "ACHIEVEMENT_{index}".format(index=index),
+                         "achieved": index % 3 == 0 and 1 or 0,
+                         "unlocktime": index % 3 == 0 and 1500000000 + index or 0}
+                        for index in range(self.achievements_per_app)]
+        return {"playerstats": {"steamID": params["steamid"], "gameName": "Game", "achievements": achievements,
+                                "success": True}}
+
+    def _generate_GetBadges(self, params):
+        badges = [{"badgeid": index, "level": index % 5 + 1, "completion_time": 1400000000 + index,
+                   "xp": 100 * (index + 1), "scarcity": 1000 + index} for index in range(30)]
+        return {"response": {"badges": badges, "player_xp": 5000, "player_level": 25,
+                             "player_xp_needed_to_level_up": 100}}
+
+    def _generate_ResolveVanityURL(self, params):
+        return {"response": {"steamid": str(BASE_STEAMID + len(params["vanityurl"])), "success": 1}}
+
+    def _generate_appdetails(self, params):
+        appids = params["appids"].split(",")
+        groups = params.get("filters", "").split(",") if params.get("filters") else None
+        if len(appids) > 1 and groups != ["price_overview"]:
+            # Like the real store: many apps at once only works for prices.
+            return None
+        return dict((appid, {"success": True, "data": self._app_details(appid, groups)}) for appid in appids)
+
+    def _app_details(self, appid, groups):
+        paragraph = "<p>An <strong>example</strong> paragraph, about as long as a real one. </p>"
+        description = paragraph * (self.description_size // len(paragraph) + 1)
+        requirements = {"minimum": "<strong>Minimum:</strong><br><ul><li>OS: Windows 10</li></ul>",
+                        "recommended": "<strong>Recommended:</strong><br><ul><li>OS: Windows 11</li></ul>"}
+        details = {"type": "game",
+                   "name": "Game {appid}".format(appid=appid),
+                   "steam_appid": int(appid),
+                   "required_age": 0,
+                   "is_free": False,
+                   "dlc": [int(appid) + index for index in range(1, 6)],
+                   "detailed_description": description,
+                   "about_the_game": description,
+                   "short_description": paragraph,
+                   "supported_languages": "English<strong>*</strong>, French, German",
+                   "header_image": "https://cdn.steamstatic.com/apps/{appid}/header.jpg".format(appid=appid),
+                   "website": "https://example.com/",
+                   "pc_requirements": requirements,
+                   "mac_requirements": requirements,
+                   "linux_requirements": requirements,
+                   "legal_notice": "(C) Example Studios.",
+                   "developers": ["Example Studios"],
+                   "publishers": ["Example Publishing"],
+                   "price_overview": {"currency": "USD", "initial": 1999, "final": 999, "discount_percent": 50},
+                   "platforms": {"windows": True, "mac": False, "linux": True},
+                   "metacritic": {"score": 80, "url": "https://www.metacritic.com/game/example"},
+                   "categories": [{"id": index, "description": "Category {index}".format(index=index)}
+                                  for index in range(8)],
+                   "genres": [{"id": str(index), "description": "Genre {index}".format(index=index)}
+                              for index in range(3)],
+                   "recommendations": {"total": 12345},
+                   "release_date": {"coming_soon": False, "date": "1 Jan, 2020"}}
+        if groups is None:
+            return details
+        selected = {}
+        for field in details:
+            group = field if field in _NAMED_DETAIL_GROUPS else "basic"
+            if group in groups:
+                selected[field] = details[field]
+        return selected
+
+
+# WORKFLOWS
+# Each takes the run's index, and uses IDs no other run uses, so no run is answered from another's cache.
+def _user_summaries(run):
+    SteamUser.load_many([BASE_STEAMID + run * 100 + index for index in range(100)], fields=("summary",))
+
+
+def _user_friends(run):
+    for friend in SteamUser(BASE_STEAMID + run * 1000).friends:
+        friend.name
+
+
+def _user_games(run):
+    SteamUser(BASE_STEAMID + run).games
+
+
+def _user_iter_games(run):
+    for game in SteamUser(BASE_STEAMID + run).iter_games():
+        pass
+
+
+def _app_achievements(run):
+    app = SteamApp(BASE_APPID + run)
+    for achievement in app.achievements:
+        achievement.is_hidden
+
+
+def _app_info(run):
+    SteamApp(BASE_APPID + run).app_info
+
+
+def _app_prices(run):
+    for app in SteamApp.load_many([BASE_APPID + run * 100 + index for index in range(100)],
+                                  filters=("price_overview",)):
+        app.price_overview
+
+WORKFLOWS = collections.OrderedDict([("user_summaries", _user_summaries),
+                                     ("user_friends", _user_friends),
+                                     ("user_games", _user_games),
+                                     ("user_iter_games", _user_iter_games),
+                                     ("app_achievements", _app_achievements),
+                                     ("app_info", _app_info),
+                                     ("app_prices", _app_prices)])
+
+
+def _percentile(values, percent):
+    """
+    :return: The nearest-rank percentile of "values".
+    """
+    ordered = sorted(values)
+    if len(ordered) == 0:
+        return 0.0
+    index = max(0, min(len(ordered) - 1, int(round(percent / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def _peak_rss():
+    """
+    :return: This process' peak resident set size so far, in KiB, or None where it can't be measured.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS reports bytes.
+    if os.uname()[0] == "Darwin":
+        peak //= 1024
+    return peak
+
+
+def run_workflow(server, workflow, iterations, first_run=0):
+    """
+    Time "iterations" runs of one workflow against "server", then measure its memory use over a few more.
+
+    :param workflow: A function taking the run's index.
+    :param first_run: The index of the first run. Runs past "first_run + iterations" are used for the memory
+                      measurement.
+    :rtype: dict
+    """
+    requests_before = server.request_count
+    errors_before = server.error_count
+    bytes_before = server.bytes_sent
+    durations = []
+    started = time.time()
+    for run in range(first_run, first_run + iterations):
+        run_started = time.time()
+        workflow(run)
+        durations += [time.time() - run_started]
+    elapsed = time.time() - started
+    requests_sent = server.request_count - requests_before
+
+    result = {"runs": iterations,
+              "requests": requests_sent,
+              "errors": server.error_count - errors_before,
+              "bytes": server.bytes_sent - bytes_before,
+              "seconds": elapsed,
+              "requests_per_second": requests_sent / elapsed if elapsed > 0 else 0.0,
+              "p50_ms": _percentile(durations, 50) * 1000,
+              "p99_ms": _percentile(durations, 99) * 1000,
+              "alloc_peak_kib": None}
+
+    if tracemalloc is not None:
+        # Tracing slows everything down, so memory is measured over separate runs.
+        for run in range(first_run + iterations, first_run + iterations + min(iterations, 5)):
+            tracemalloc.start()
+            try:
+                workflow(run)
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+            result["alloc_peak_kib"] = max(result["alloc_peak_kib"] or 0, peak // 1024)
+    result["peak_rss_kib"] = _peak_rss()
+    return result
+
+
+def run(workflows=None, iterations=20, **server_options):
+    """
+    Run the benchmark.
+
+    :param workflows: Names of the workflows to run, out of WORKFLOWS. (Default: all of them)
+    :type workflows: list of str
+    :param iterations: Timed runs per workflow.
+    :type iterations: int
+    :param server_options: Passed on to FakeSteamServer.
+    :return: Each workflow's results, by name.
+    :rtype: collections.OrderedDict
+    """
+    APIConnection(api_key="BENCHMARK")
+    StoreAPIConnection()
+    results = collections.OrderedDict()
+    with FakeSteamServer(**server_options) as server:
+        for index, name in enumerate(workflows or WORKFLOWS.keys()):
+            # Far apart, so no two workflows share IDs either.
+            results[name] = run_workflow(server, WORKFLOWS[name], iterations, first_run=index * 100000)
+            SteamAppSchema._schemas.clear()
+    return results
+
+
+def _format_table(results):
+    header = ("workflow", "req/s", "p50 ms", "p99 ms", "requests", "errors", "MiB in", "alloc KiB", "RSS KiB")
+    rows = [header]
+    for name, result in results.items():
+        rows += [(name,
+                  "{0:.0f}".format(result["requests_per_second"]),
+                  "{0:.2f}".format(result["p50_ms"]),
+                  "{0:.2f}".format(result["p99_ms"]),
+                  str(result["requests"]),
+                  str(result["errors"]),
+                  "{0:.1f}".format(result["bytes"] / 1048576.0),
+                  "-" if result["alloc_peak_kib"] is None else str(result["alloc_peak_kib"]),
+                  "-" if result["peak_rss_kib"] is None else str(result["peak_rss_kib"]))]
+    widths = [max(len(row[column]) for row in rows) for column in range(len(header))]
+    return "\n".join(" ".join(cell.ljust(width) if column == 0 else cell.rjust(width)
+                              for column, (cell, width) in enumerate(zip(row, widths)))
+                     for row in rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark steamapi against a local stand-in for the Steam Web API.")
+    parser.add_argument("--iterations", type=int, default=20, help="timed runs per workflow")
+    parser.add_argument("--workflow", action="append", choices=list(WORKFLOWS.keys()), dest="workflows",
+                        help="run only this workflow (repeatable)")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds every response is delayed by")
+    parser.add_argument("--jitter", type=float, default=0.0, help="up to this many extra seconds per response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls that fail")
+    parser.add_argument("--error-status", type=int, default=503, help="HTTP status failing calls get")
+    parser.add_argument("--responses", dest="responses_dir", help="directory of recorded <command>.json responses")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    options = parser.parse_args(argv)
+
+    results = run(options.workflows, options.iterations, latency=options.latency, jitter=options.jitter,
+                  error_rate=options.error_rate, error_status=options.error_status,
+                  responses_dir=options.responses_dir)
+    if options.json is True:
+        print(json.dumps(results, indent=2))
+    else:
+        print(_format_table(results))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,360 @@
+__author__ = 'SmileyBarry'
+
+import collections
+import sqlite3
+import threading
+import time
+
+from .core import STORE_INTERFACE
+from .transport import _canonical_query
+from .decorators import HOUR, INFINITE
+
+
+class LRUCache(object):
+    """
+    A small, thread-safe, in-process cache that keeps the most recently used "max_entries" values, each
+    for at most "ttl" seconds. (Zero means forever.)
+    """
+    def __init__(self, max_entries, ttl=INFINITE):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        :return: The cached value, or None if missing or expired.
+        """
+        with self._lock:
+            if key not in self._entries:
+                return None
+            value, created = self._entries.pop(key)
+            if self.ttl > 0 and time.time() - created > self.ttl:
+                return None
+            # Re-inserting moves the key to the most-recently-used end.
+            self._entries[key] = (value, created)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (value, time.time())
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class IdentityMap(object):
+    """
+    A process-wide map from an entity's ID to the '_cache' dictionary shared by every object representing
+    that entity. Two "SteamUser(76561...)" objects created while the map is enabled read and fill the same
+    cache, so the summary is fetched once, no matter how many friend lists the user appears in.
+
+    Only the cache is shared, not the objects themselves: per-relationship attributes like "friend_since" or
+    "playtime_forever" stay on each object.
+
+    Entries are evicted in least-recently-used order once "max_entries" is exceeded, and dropped "ttl"
+    seconds after they were created. Objects created before an entry was evicted keep their (now private)
+    cache; new objects start from a fresh one.
+    """
+    def __init__(self, max_entries=10000, ttl=HOUR):
+        """
+        :param max_entries: The most entities to keep shared caches for. Bounds the map's memory use.
+        :type max_entries: int
+        :param ttl: How long, in seconds, an entity's shared cache lives. Zero means forever.
+        :type ttl: int
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def cache_for(self, kind, entity_id):
+        """
+        Return the shared cache dictionary for an entity, creating it if needed.
+
+        :param kind: The entity type. (E.g.: "user" or "app")
+        :type kind: str
+        :param entity_id: The entity's ID. Integers and their string forms are the same entity.
+        :rtype: dict
+        """
+        key = (kind, str(entity_id))
+        now = time.time()
+        with self._lock:
+            if key in self._entries:
+                cache, created = self._entries.pop(key)
+                if self.ttl > 0 and now - created > self.ttl:
+                    cache, created = {}, now
+            else:
+                cache, created = {}, now
+            # Re-inserting moves the key to the most-recently-used end.
+            self._entries[key] = (cache, created)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return cache
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_identity_map = None
+
+
+def enable_identity_map(max_entries=10000, ttl=HOUR):
+    """
+    Turn on the process-wide identity map for SteamUser and SteamApp objects. (Off by default.)
+    Only objects created after this call share their caches.
+
+    :rtype: IdentityMap
+    """
+    global _identity_map
+    _identity_map = IdentityMap(max_entries, ttl)
+    return _identity_map
+
+
+def disable_identity_map():
+    global _identity_map
+    _identity_map = None
+
+
+def shared_cache(kind, entity_id):
+    """
+    Return the '_cache' dictionary a new object for this entity should use: the shared one if the identity
+    map is enabled, or a private, empty one otherwise.
+
+    :rtype: dict
+    """
+    if _identity_map is None:
+        return {}
+    return _identity_map.cache_for(kind, entity_id)
+
+
+class ResponseCache(object):
+    """
+    Base class for persistent response caches, plugged into the API connections through the
+    "response_cache" setting::
+
+        response_cache = SQLiteResponseCache("/var/cache/steamapi.sqlite")
+        APIConnection(api_key="...", settings={"response_cache": response_cache})
+        StoreAPIConnection(settings={"response_cache": response_cache})
+
+    Only automatically-parsed GET calls are cached, and only for endpoints that have a TTL. Entries are
+    keyed by interface, command, version and the call's normalised parameters (minus the API key), and
+    hold the raw response body, so any process sharing the backend can reuse them.
+
+    Subclasses implement "get", "set_raw" and "clear".
+    """
+    # (interface, command) -> TTL in seconds. INFINITE (zero) means the entry never expires.
+    # Store calls use STORE_INTERFACE as their interface.
+    DEFAULT_TTLS = {("ISteamUserStats", "GetSchemaForGame"): INFINITE,
+                    (STORE_INTERFACE, "appdetails"): 24 * HOUR}
+
+    # Parameters that don't change a call's result.
+    IGNORED_PARAMETERS = ("key", "format")
+
+    def __init__(self, ttls=None, default_ttl=None):
+        """
+        :param ttls: Per-endpoint TTLs, merged over DEFAULT_TTLS. A TTL of None disables caching for
+                     that endpoint.
+        :type ttls: dict
+        :param default_ttl: TTL for endpoints not listed in "ttls". (Default: None, don't cache them)
+        :type default_ttl: int or None
+        """
+        self.ttls = dict(self.DEFAULT_TTLS)
+        if ttls is not None:
+            self.ttls.update(ttls)
+        self.default_ttl = default_ttl
+
+    def ttl_for(self, interface, command):
+        """
+        :return: The TTL for this endpoint, or None if it shouldn't be cached.
+        :rtype: int or None
+        """
+        return self.ttls.get((interface, command), self.default_ttl)
+
+    def make_key(self, interface, command, version, params):
+        """
+        :return: The cache key for a call, or None if this endpoint isn't cached.
+        :rtype: str or None
+        """
+        if self.ttl_for(interface, command) is None:
+            return None
+        query = _canonical_query(params, self.IGNORED_PARAMETERS)
+        return "{interface}/{command}/{version}?{query}".format(interface=interface,
+                                                                command=command,
+                                                                version=version,
+                                                                query=query)
+
+    def set(self, key, value, interface, command):
+        """
+        Cache a raw response body, with the TTL of the endpoint it came from.
+        """
+        ttl = self.ttl_for(interface, command)
+        if ttl is None:
+            return
+        if ttl > 0:
+            expires = time.time() + ttl
+        else:
+            expires = INFINITE
+        self.set_raw(key, value, expires)
+
+    def get(self, key):
+        """
+        :return: The cached raw response body, or None if missing or expired.
+        :rtype: bytes or None
+        """
+        raise NotImplementedError()
+
+    def set_raw(self, key, value, expires):
+        """
+        :param expires: Unix time this entry expires at, or INFINITE.
+        """
+        raise NotImplementedError()
+
+    def clear(self):
+        raise NotImplementedError()
+
+
+class _SQLiteConnections(object):
+    """
+    One connection per thread to an SQLite database file, opened (in WAL mode, so readers don't block the
+    writer) on the thread's first use. SQLite connections can't be shared between threads.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def get(self):
+        """
+        :rtype: sqlite3.Connection
+        """
+        try:
+            return self._local.connection
+        except AttributeError:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+            return connection
+
+
+class SQLiteResponseCache(ResponseCache):
+    """
+    A response cache stored in an SQLite database file. Several threads and worker processes can share
+    one file: the database runs in WAL mode, so readers don't block the writer, and each thread uses its
+    own connection.
+
+    The cache is bounded by entry count and total size. When either is exceeded, the least recently
+    used entries are evicted, down to "LOW_WATER_MARK" of both bounds, so evictions run in batches
+    rather than on every insert. The entry count and total size are kept up to date by triggers, in a
+    one-row table, so checking them doesn't scan the cache.
+    """
+    # The fraction of "max_entries" and "max_bytes" an eviction frees the cache down to.
+    LOW_WATER_MARK = 0.9
+    # Hits only record their access time if the recorded one is older than this many seconds, so most
+    # hits don't write. (Eviction order is only this precise.)
+    ACCESS_RESOLUTION = 60
+
+    def __init__(self, path, ttls=None, default_ttl=None, max_entries=100000, max_bytes=512 * 1024 * 1024):
+        """
+        :param path: The database file. Created if it doesn't exist.
+        :type path: str
+        :param max_entries: The most responses to keep.
+        :type max_entries: int
+        :param max_bytes: The most response bytes to keep.
+        :type max_bytes: int
+        """
+        super(SQLiteResponseCache, self).__init__(ttls, default_ttl)
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._connections = _SQLiteConnections(path)
+
+        connection = self._connection()
+        with connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS responses ("
+                               "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, "
+                               "expires REAL NOT NULL, accessed REAL NOT NULL)")
+            connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+            connection.execute("CREATE TABLE IF NOT EXISTS responses_totals ("
+                               "id INTEGER PRIMARY KEY CHECK (id = 0), entries INTEGER NOT NULL, "
+                               "bytes INTEGER NOT NULL)")
+            # Counted once, for databases created before the totals were kept.
+            connection.execute("INSERT OR IGNORE INTO responses_totals (id, entries, bytes) "
+                               "SELECT 0, COUNT(*), COALESCE(SUM(size), 0) FROM responses")
+            connection.execute("CREATE TRIGGER IF NOT EXISTS responses_inserted AFTER INSERT ON responses BEGIN "
+                               "UPDATE responses_totals SET entries = entries + 1, bytes = bytes + NEW.size; "
+                               "END")
+            connection.execute("CREATE TRIGGER IF NOT EXISTS responses_deleted AFTER DELETE ON responses BEGIN "
+                               "UPDATE responses_totals SET entries = entries - 1, bytes = bytes - OLD.size; "
+                               "END")
+            connection.execute("CREATE TRIGGER IF NOT EXISTS responses_resized AFTER UPDATE OF size ON responses "
+                               "BEGIN UPDATE responses_totals SET bytes = bytes - OLD.size + NEW.size; END")
+
+    def _connection(self):
+        return self._connections.get()
+
+    def get(self, key):
+        connection = self._connection()
+        row = connection.execute("SELECT value, expires, accessed FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        value, expires, accessed = row
+        now = time.time()
+        if expires != INFINITE and expires < now:
+            with connection:
+                connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+            return None
+        if now - accessed > self.ACCESS_RESOLUTION:
+            with connection:
+                connection.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+        return bytes(value)
+
+    def set_raw(self, key, value, expires):
+        connection = self._connection()
+        with connection:
+            # Deleted, then inserted, rather than replaced: "INSERT OR REPLACE" doesn't fire delete triggers.
+            connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+            connection.execute("INSERT INTO responses (key, value, size, expires, accessed) VALUES (?, ?, ?, ?, ?)",
+                               (key, sqlite3.Binary(value), len(value), expires, time.time()))
+            self._evict(connection)
+
+    def _totals(self, connection):
+        """
+        :return: How many entries the cache holds, and their total size.
+        :rtype: (int, int)
+        """
+        return connection.execute("SELECT entries, bytes FROM responses_totals").fetchone()
+
+    def _evict(self, connection):
+        entries, total_size = self._totals(connection)
+        if entries <= self.max_entries and total_size <= self.max_bytes:
+            return
+        connection.execute("DELETE FROM responses WHERE expires != ? AND expires < ?", (INFINITE, time.time()))
+
+        target_entries = int(self.max_entries * self.LOW_WATER_MARK)
+        target_size = int(self.max_bytes * self.LOW_WATER_MARK)
+        entries, total_size = self._totals(connection)
+        while entries > 0 and (entries > target_entries or total_size > target_size):
+            excess = entries - target_entries
+            if total_size > target_size:
+                # Estimated from the average entry size; the loop catches up if it's off.
+                average_size = max(1, total_size // entries)
+                excess = max(excess, (total_size - target_size + average_size - 1) // average_size)
+            connection.execute("DELETE FROM responses WHERE key IN "
+                               "(SELECT key FROM responses ORDER BY accessed LIMIT ?)", (excess,))
+            entries, total_size = self._totals(connection)
+
+    def clear(self):
+        connection = self._connection()
+        with connection:
+            connection.execute("DELETE FROM responses")
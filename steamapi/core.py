@@ -1,15 +1,455 @@
 __author__ = 'SmileyBarry'
 
+import array
+import json
+import struct
+import time
+from multiprocessing.pool import ThreadPool
+
 import requests
+import requests.adapters
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
 
-from .decorators import Singleton
-from . import errors
+from .decorators import Singleton, SingleFlight
+from . import errors, instrument, retry, throttle, transport
 
 GET = "GET"
 POST = "POST"
 
+# The pseudo-interface store calls are filed under, e.g. in response cache keys.
+STORE_INTERFACE = "store"
+
+# Errors a retry policy gets a say on. Anything else (e.g. a malformed URL) is raised right away.
+TRANSIENT_ERRORS = (errors.APIException, requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+
+
+def _decode_json(raw):
+    """
+    The standard library's JSON decoder, for raw response bodies.
+
+    :type raw: bytes
+    """
+    return json.loads(raw.decode("utf-8"))
+
+
+def _find_json_decoder():
+    """
+    Pick the fastest JSON decoder available: "orjson", then "msgspec", then the standard library's.
+
+    :return: A function that decodes a raw response body (bytes) into dicts and lists.
+    """
+    try:
+        import orjson
+        return orjson.loads
+    except ImportError:
+        pass
+    try:
+        import msgspec.json
+        return msgspec.json.decode
+    except ImportError:
+        pass
+    return _decode_json
+
+# The JSON decoder connections use unless their "json_decoder" setting says otherwise.
+DEFAULT_JSON_DECODER = _find_json_decoder()
+
+
+def _prepare_arguments(kwargs):
+    """
+    Encode a call's keyword arguments the way the Web API expects them, in-place.
+
+    :param kwargs: The keyword arguments given to "call".
+    :type kwargs: dict
+    :return: Whether the response should be parsed automatically (False if the caller overrode "format").
+    :rtype: bool
+    """
+    for argument in kwargs:
+        if type(kwargs[argument]) is list:
+            # The API takes multiple values in a "a,b,c" structure, so we
+            # have to encode it in that way.
+            kwargs[argument] = ','.join(str(value) for value in kwargs[argument])
+        elif type(kwargs[argument]) is bool:
+            # The API treats True/False as 1/0. Convert it.
+            if kwargs[argument] is True:
+                kwargs[argument] = 1
+            else:
+                kwargs[argument] = 0
+
+    if "format" in kwargs:
+        return False
+    else:
+        kwargs["format"] = "json"
+        return True
+
+
+def _parse_response(response_obj, stringify_lists=False):
+    """
+    Wrap a decoded JSON response in an APIResponse, unwrapping the Web API's outer "response" envelope.
+
+    :type response_obj: dict
+    :param stringify_lists: Whether lists of plain values are converted to lists of strings. (See "_wrap_value")
+    :rtype: APIResponse
+    """
+    response_class = _StringifyingAPIResponse if stringify_lists is True else APIResponse
+    if len(response_obj.keys()) == 1 and 'response' in response_obj:
+        return response_class(response_obj['response'])
+    else:
+        return response_class(response_obj)
+
+
+def _array_typecode(typecode):
+    """
+    :param typecode: A "struct"/NumPy typecode, e.g. "q".
+    :return: The "array" typecode for items of the same size and signedness, or None if there's none.
+             (Python 2's "array" has no "q" and "Q", but its "l" and "L" are 64-bit on most 64-bit
+             platforms.)
+    :rtype: str or None
+    """
+    for candidate in (typecode, {"q": "l", "Q": "L"}.get(typecode)):
+        if candidate is None:
+            continue
+        try:
+            if array.array(candidate).itemsize == struct.calcsize(typecode):
+                return candidate
+        except ValueError:
+            pass
+    return None
+
+
+def _new_column(typecode, values=()):
+    """
+    :param typecode: A "struct"/NumPy typecode, e.g. "q".
+    :return: An array of "values", or a list where the "array" module can't hold them.
+    :rtype: array.array or list
+    """
+    array_typecode = _array_typecode(typecode)
+    if array_typecode is None:
+        return list(values)
+    return array.array(array_typecode, values)
+
+
+def _chunks(items, size):
+    """
+    Split a sequence into consecutive slices of at most "size" items.
+
+    :rtype: list
+    """
+    return [items[start:start + size] for start in range(0, len(items), size)]
+
+
+def _parallel_imap(function, items, max_workers, ordered=True):
+    """
+    Call "function" on every item, on up to "max_workers" threads, and yield the results as they come in.
+    With one item or one worker, everything runs on the calling thread.
+
+    :param ordered: Yield results in the items' order, rather than as soon as each is ready.
+    :type ordered: bool
+    """
+    items = list(items)
+    if len(items) <= 1 or max_workers <= 1:
+        for item in items:
+            yield function(item)
+        return
+
+    pool = ThreadPool(min(max_workers, len(items)))
+    finished = False
+    try:
+        if ordered is True:
+            results = pool.imap(function, items)
+        else:
+            results = pool.imap_unordered(function, items)
+        for result in results:
+            yield result
+        finished = True
+    finally:
+        if finished is True:
+            pool.close()
+        else:
+            # Abandoned or failed: don't start the items still queued, only wait for those in flight.
+            pool.terminate()
+        pool.join()
+
+
+def _parallel_map(function, items, max_workers):
+    """
+    Like "map", on up to "max_workers" threads. (See "_parallel_imap".)
+
+    :rtype: list
+    """
+    return list(_parallel_imap(function, items, max_workers))
+
+
+class _PooledConnection(object):
+    """
+    Shared plumbing for the API connection singletons: every connection sends its calls through a
+    transport, by default a pooled, keep-alive "requests" session, so repeated calls to the same host
+    reuse an open TCP connection instead of paying for a new handshake each time.
+    """
+    def _configure_session(self, settings):
+        """
+        Create this connection's transport from the advanced settings dictionary.
+
+        :param settings: The "settings" dictionary given to the connection. Recognised keys:
+            pool_connections -- int. (Default: 10) How many per-host connection pools to keep around.
+            pool_maxsize -- int. (Default: 10) Maximum number of connections kept open per host.
+            pool_block -- True/False. (Default: False) Whether to wait for a free connection once
+                          "pool_maxsize" is reached, instead of opening a throwaway one.
+            keep_alive -- True/False. (Default: True) Whether connections are kept open between calls.
+            timeout -- float or (connect, read) tuple. (Default: None) Timeout for each call, in seconds.
+            response_cache -- cache.ResponseCache. (Default: None) A persistent cache for parsed GET calls.
+                              See "cache.SQLiteResponseCache".
+            json_decoder -- function. (Default: DEFAULT_JSON_DECODER) Decodes a raw response body (bytes)
+                            into dicts and lists. Picked automatically from "orjson", "msgspec" or the
+                            standard library, whichever is installed first.
+            rate_limiter -- throttle.RateLimiter. (Default: None) Paces calls per API key and interface.
+            concurrency_limiter -- throttle.AIMDLimiter. (Default: None) Bounds calls in flight, backing off
+                                   when the API throttles or fails.
+            retry_policy -- retry.RetryPolicy. (Default: RetryPolicy()) Retries transient failures with capped,
+                            jittered exponential backoff. None disables retries.
+            single_flight -- True/False. (Default: True) Whether concurrent identical GET calls wait for, and
+                             share the result of, one request instead of each sending their own.
+            transport -- transport.Transport. (Default: a transport.HTTPTransport with the pooling options
+                         above) Sends the HTTP requests. See "transport.RecordingTransport" and
+                         "transport.ReplayTransport" to record calls and play them back without a network.
+        """
+        pool_connections = requests.adapters.DEFAULT_POOLSIZE
+        pool_maxsize = requests.adapters.DEFAULT_POOLSIZE
+        pool_block = requests.adapters.DEFAULT_POOLBLOCK
+        self.keep_alive = True
+        self.timeout = None
+
+        if 'pool_connections' in settings and type(settings['pool_connections']) is int:
+            pool_connections = settings['pool_connections']
+        if 'pool_maxsize' in settings and type(settings['pool_maxsize']) is int:
+            pool_maxsize = settings['pool_maxsize']
+        if 'pool_block' in settings and type(settings['pool_block']) is bool:
+            pool_block = settings['pool_block']
+        if 'keep_alive' in settings and type(settings['keep_alive']) is bool:
+            self.keep_alive = settings['keep_alive']
+        if 'timeout' in settings:
+            self.timeout = settings['timeout']
+        self.response_cache = settings.get('response_cache', None)
+        self.json_decoder = settings.get('json_decoder', DEFAULT_JSON_DECODER)
+        self.rate_limiter = settings.get('rate_limiter', None)
+        self.concurrency_limiter = settings.get('concurrency_limiter', None)
+        self.retry_policy = settings.get('retry_policy', retry.RetryPolicy())
+        self.single_flight = None
+        if settings.get('single_flight', True) is True:
+            self.single_flight = SingleFlight()
+
+        self.transport = settings.get('transport', None)
+        if self.transport is None:
+            self.transport = transport.HTTPTransport(pool_connections, pool_maxsize, pool_block, self.keep_alive)
+
+    def _send(self, method, query, kwargs, stream=False):
+        """
+        Send one HTTP request through the transport.
+
+        :param stream: Return as soon as the headers are in, leaving the body to be read from "raw".
+        :rtype: requests.Response
+        """
+        return self.transport.send(method, query, kwargs, self.timeout, stream)
+
+    # A throttle.KeyPool, on connections that spread calls across several API keys.
+    key_pool = None
+    # Whether this connection's responses convert lists of plain values to lists of strings.
+    stringify_lists = False
+
+    def _send_limited(self, interface, method, query, kwargs, stream=False):
+        """
+        Send one HTTP request, paced by the rate limiter and bounded by the concurrency limiter, if set.
+
+        :rtype: requests.Response
+        """
+        if self.key_pool is not None:
+            # Picked per attempt, so a retry after a 429 moves on to another key.
+            kwargs["key"] = self.key_pool.acquire()
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(kwargs.get("key"), interface)
+        if self.concurrency_limiter is not None:
+            self.concurrency_limiter.acquire()
+
+        success = False
+        try:
+            response = self._send(method, query, kwargs, stream)
+            success = response.status_code != 429 and response.status_code < 500
+        finally:
+            if self.concurrency_limiter is not None:
+                self.concurrency_limiter.release(success)
+        if self.key_pool is not None:
+            self.key_pool.record(kwargs["key"], response.status_code,
+                                 retry.parse_retry_after(response.headers.get("Retry-After")))
+        return response
+
+    def _send_with_retries(self, interface, method, query, kwargs, stream=False, event=None):
+        """
+        Send one HTTP request and check its status, retrying transient failures as the retry policy allows.
+
+        :param event: The call's instrument.CallEvent, if it's instrumented. Gets the status and retry count.
+        :rtype: requests.Response
+        """
+        attempt = 0
+        started = time.time()
+        while True:
+            try:
+                if event is not None:
+                    event.retries = attempt
+                response = self._send_limited(interface, method, query, kwargs, stream)
+                if event is not None:
+                    event.status = response.status_code
+                if response.status_code != 200:
+                    # Hand the connection back to the pool, even if the body was never read.
+                    response.close()
+                    errors.raiseAppropriateException(response.status_code,
+                                                     retry.parse_retry_after(response.headers.get("Retry-After")))
+                return response
+            except TRANSIENT_ERRORS as exception:
+                if self.retry_policy is None:
+                    raise
+                delay = self.retry_policy.next_delay(attempt, exception, method, time.time() - started)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+
+    def _request(self, interface, command, version, method, query, kwargs, automatic_parsing, raw=False):
+        """
+        Perform a prepared call: answer it from the response cache if possible, otherwise send it,
+        check its status and parse it. Concurrent identical GET calls share one request.
+
+        :param raw: Return the undecoded response body instead of parsing it.
+        :rtype: APIResponse, str or bytes
+        """
+        if method == GET and self.single_flight is not None:
+            # Keyed by the parameters' string forms, as sent: values may be unhashable lists.
+            flight_key = (query, transport._canonical_query(kwargs), automatic_parsing, raw)
+            return self.single_flight.do(flight_key, self._request_once, interface, command, version, method,
+                                         query, kwargs, automatic_parsing, raw)
+        return self._request_once(interface, command, version, method, query, kwargs, automatic_parsing, raw)
+
+    def _request_once(self, interface, command, version, method, query, kwargs, automatic_parsing, raw):
+        if not instrument.enabled():
+            return self._perform(interface, command, version, method, query, kwargs, automatic_parsing, raw, None)
+
+        event = instrument.CallEvent(interface, command, version, method, time.time())
+        try:
+            return self._perform(interface, command, version, method, query, kwargs, automatic_parsing, raw, event)
+        except Exception as exception:
+            event.error = exception
+            raise
+        finally:
+            event.latency = time.time() - event.started
+            instrument.emit(event)
+
+    def _perform(self, interface, command, version, method, query, kwargs, automatic_parsing, raw, event):
+        cache_key = None
+        if automatic_parsing is True and method == GET and self.response_cache is not None:
+            cache_key = self.response_cache.make_key(interface, command, version, kwargs)
+            if cache_key is not None:
+                cached = self.response_cache.get(cache_key)
+                if event is not None:
+                    event.cache = "miss" if cached is None else "hit"
+                if cached is not None:
+                    if event is not None:
+                        event.bytes = len(cached)
+                    if raw is True:
+                        return cached
+                    return self._decode(cached, event)
+
+        response = self._send_with_retries(interface, method, query, kwargs, event=event)
+        if event is not None:
+            event.bytes = len(response.content)
+
+        if raw is True:
+            if cache_key is not None:
+                self.response_cache.set(cache_key, response.content, interface, command)
+            return response.content
+        elif automatic_parsing is True:
+            if cache_key is not None:
+                self.response_cache.set(cache_key, response.content, interface, command)
+            return self._decode(response.content, event)
+        else:
+            return response.text
+
+    def _decode(self, body, event):
+        """
+        Decode a raw response body and wrap it in an APIResponse, timing both steps if the call is instrumented.
+
+        :rtype: APIResponse
+        """
+        if event is None:
+            return _parse_response(self.json_decoder(body), self.stringify_lists)
+        started = time.time()
+        decoded = self.json_decoder(body)
+        decoded_at = time.time()
+        response = _parse_response(decoded, self.stringify_lists)
+        event.decode_time = decoded_at - started
+        event.wrap_time = time.time() - decoded_at
+        return response
+
+    def _iter_items(self, interface, command, version, method, query, kwargs, path):
+        """
+        Perform a prepared call and yield the items of one list in its response, as raw JSON values.
+
+        With "ijson" installed, the response body is parsed incrementally as it streams in, so only one
+        item is held in memory at a time. Otherwise, the body is decoded in one go first. Either way, no
+        APIResponse objects are created. Streamed calls skip the response cache.
+
+        :param path: The keys leading to the list, from the top of the response. (E.g.: ("response", "games"))
+        :type path: tuple of str
+        """
+        event = None
+        if instrument.enabled():
+            event = instrument.CallEvent(interface, command, version, method, time.time())
+        try:
+            response = self._send_with_retries(interface, method, query, kwargs, stream=ijson is not None,
+                                               event=event)
+            try:
+                if ijson is not None:
+                    # The body is read straight off the socket, so ask urllib3 to undo any gzip encoding.
+                    response.raw.decode_content = True
+                    for item in ijson.items(response.raw, ".".join(path + ("item",)), use_float=True):
+                        yield item
+                    return
+
+                if event is not None:
+                    event.bytes = len(response.content)
+                items = self.json_decoder(response.content)
+                for key in path:
+                    if type(items) is not dict or key not in items:
+                        return
+                    items = items[key]
+                for item in items:
+                    yield item
+            finally:
+                response.close()
+        except Exception as exception:
+            if event is not None:
+                event.error = exception
+            raise
+        finally:
+            if event is not None:
+                # The latency covers reading the whole list. Streamed, the body's size isn't known.
+                event.latency = time.time() - event.started
+                instrument.emit(event)
+
+    @property
+    def pool_stats(self):
+        """
+        Connection pool usage. A "hit" is a request that reused an already-open connection, a "miss" is
+        one that had to open a new one. Transports that don't pool connections report zeros.
+
+        :rtype: dict
+        """
+        return self.transport.pool_stats
+
+
 @Singleton
-class APIConnection(object):
+class APIConnection(_PooledConnection):
     QUERY_TEMPLATE = "http://api.steampowered.com/{interface}/{command}/{version}/"
 
     def __init__(self, api_key=None, settings={}):
@@ -18,23 +458,42 @@ class APIConnection(object):
         will not re-initialise the instance but just retrieve the existing instance. To reassign an API key,
         retrieve the Singleton instance and call "reset" with the key.
 
-        :param api_key: A Steam Web API key. (Optional, but recommended)
+        :param api_key: A Steam Web API key, or several as a list or a throttle.KeyPool. (Optional, but
+                        recommended)
         :param settings: A dictionary of advanced tweaks. Beware! (Optional)
             precache -- True/False. (Default: True) Decides whether attributes that retrieve
                         a group of users, such as "friends", should precache player summaries,
                         like nicknames. Recommended if you plan to use nicknames right away, since
                         caching is done in groups and retrieving one-by-one takes a while.
+            pool_connections, pool_maxsize, pool_block, keep_alive, timeout -- Connection pooling
+                        options. See "_PooledConnection._configure_session" for details.
+            stringify_lists -- True/False. (Default: False) Whether lists of plain values in this
+                        connection's responses are converted to lists of strings, like older versions
+                        did. Store responses are unaffected.
 
         """
         self.reset(api_key)
+        self._configure_session(settings)
 
         self.precache = True
 
         if 'precache' in settings and type(settings['precache']) is bool:
             self.precache = settings['precache']
+        if 'stringify_lists' in settings and type(settings['stringify_lists']) is bool:
+            self.stringify_lists = settings['stringify_lists']
 
     def reset(self, api_key):
-        self._api_key = api_key
+        """
+        :param api_key: A Steam Web API key, a list of keys, or a throttle.KeyPool to spread calls across.
+        """
+        if type(api_key) is list or type(api_key) is tuple:
+            api_key = throttle.KeyPool(api_key)
+        if isinstance(api_key, throttle.KeyPool):
+            self.key_pool = api_key
+            self._api_key = None
+        else:
+            self.key_pool = None
+            self._api_key = api_key
 
     def call(self, interface, command, version, method=GET, **kwargs):
         """
@@ -52,54 +511,61 @@ class APIConnection(object):
 
         :rtype : APIResponse or str
         """
-        for argument in kwargs:
-            if type(kwargs[argument]) is list:
-                # The API takes multiple values in a "a,b,c" structure, so we
-                # have to encode it in that way.
-                kwargs[argument] = ','.join(kwargs[argument])
-            elif type(kwargs[argument]) is bool:
-                # The API treats True/False as 1/0. Convert it.
-                if kwargs[argument] is True:
-                    kwargs[argument] = 1
-                else:
-                    kwargs[argument] = 0
-
-        automatic_parsing = True
-        if "format" in kwargs:
-            automatic_parsing = False
-        else:
-            kwargs["format"] = "json"
+        return self._call(interface, command, version, method, kwargs, raw=False)
+
+    def call_raw(self, interface, command, version, method=GET, **kwargs):
+        """
+        Call an API command like "call", but return the response body as it came off the wire, without
+        decoding or wrapping it. Useful for handing large responses to your own parser.
+
+        :rtype : bytes
+        """
+        return self._call(interface, command, version, method, kwargs, raw=True)
+
+    def iter_items(self, interface, command, version, path, method=GET, **kwargs):
+        """
+        Call an API command like "call", but yield the items of one list in the response one by one,
+        as raw JSON values, instead of returning the whole response. Meant for very long lists, like
+        large friend lists or game libraries: with "ijson" installed, memory use stays flat no matter how
+        long the list is. "format" cannot be overridden.
+
+        :param path: The keys leading to the list. (E.g.: ("friendslist", "friends") for "GetFriendList")
+        :type path: tuple of str
+        :rtype: generator
+        """
+        _prepare_arguments(kwargs)
 
         if self._api_key is not None:
             kwargs["key"] = self._api_key
 
         query = self.QUERY_TEMPLATE.format(interface=interface, command=command, version=version)
 
-        if method == POST:
-            response = requests.request(method, query, data=kwargs)
-        else:
-            response = requests.request(method, query, params=kwargs)
+        return self._iter_items(interface, command, version, method, query, kwargs, tuple(path))
 
-        if response.status_code != 200:
-            errors.raiseAppropriateException(response.status_code)
+    def _call(self, interface, command, version, method, kwargs, raw):
+        automatic_parsing = _prepare_arguments(kwargs)
 
-        if automatic_parsing is True:
-            response_obj = response.json()
-            if len(response_obj.keys()) == 1 and 'response' in response_obj:
-                return APIResponse(response_obj['response'])
-            else:
-                return APIResponse(response_obj)
+        if self._api_key is not None:
+            kwargs["key"] = self._api_key
+
+        query = self.QUERY_TEMPLATE.format(interface=interface, command=command, version=version)
+
+        return self._request(interface, command, version, method, query, kwargs, automatic_parsing, raw)
 
 
 @Singleton
-class StoreAPIConnection(object):
+class StoreAPIConnection(_PooledConnection):
     QUERY_TEMPLATE = "http://store.steampowered.com/api/{command}/"
 
-    def __init__(self):
+    def __init__(self, settings={}):
         """
         Initialise the main StoreAPIConnection. Since StoreAPIConnection is a singleton object, any further "initialisations"
         will not re-initialise the instance but just retrieve the existing instance.
+
+        :param settings: A dictionary of advanced tweaks. Accepts the same connection pooling options as
+                         APIConnection. (Optional)
         """
+        self._configure_session(settings)
 
     def call(self, command, method=GET, **kwargs):
         """
@@ -115,40 +581,49 @@ class StoreAPIConnection(object):
 
         :rtype : APIResponse or str
         """
-        for argument in kwargs:
-            if type(kwargs[argument]) is list:
-                # The API takes multiple values in a "a,b,c" structure, so we
-                # have to encode it in that way.
-                kwargs[argument] = ','.join(kwargs[argument])
-            elif type(kwargs[argument]) is bool:
-                # The API treats True/False as 1/0. Convert it.
-                if kwargs[argument] is True:
-                    kwargs[argument] = 1
-                else:
-                    kwargs[argument] = 0
-
-        automatic_parsing = True
-        if "format" in kwargs:
-            automatic_parsing = False
-        else:
-            kwargs["format"] = "json"
+        return self._call(command, method, kwargs, raw=False)
+
+    def call_raw(self, command, method=GET, **kwargs):
+        """
+        Call a store API command like "call", but return the response body as it came off the wire,
+        without decoding or wrapping it.
+
+        :rtype : bytes
+        """
+        return self._call(command, method, kwargs, raw=True)
+
+    def _call(self, command, method, kwargs, raw):
+        automatic_parsing = _prepare_arguments(kwargs)
 
         query = self.QUERY_TEMPLATE.format(command=command)
 
-        if method == POST:
-            response = requests.request(method, query, data=kwargs)
-        else:
-            response = requests.request(method, query, params=kwargs)
+        return self._request(STORE_INTERFACE, command, None, method, query, kwargs, automatic_parsing, raw)
 
-        if response.status_code != 200:
-            errors.raiseAppropriateException(response.status_code)
 
-        if automatic_parsing is True:
-            response_obj = response.json()
-            if len(response_obj.keys()) == 1 and 'response' in response_obj:
-                return APIResponse(response_obj['response'])
+def _wrap_value(value, stringify_lists=False):
+    """
+    Wrap one raw JSON value the way APIResponse exposes it: dictionaries become APIResponses, lists
+    holding dictionaries become APIResponseLists and everything else is returned as-is.
+
+    :param stringify_lists: Whether lists that aren't purely dictionaries become lists of strings, here and
+                            in the wrapped values' own nested values. Always on while
+                            "APIResponse.stringify_lists" is set.
+    """
+    stringify_lists = stringify_lists or APIResponse.stringify_lists
+    if type(value) is dict:
+        if stringify_lists is True:
+            return _StringifyingAPIResponse(value)
+        return APIResponse(value)
+    elif type(value) is list:
+        if stringify_lists is True:
+            # The old behaviour: lists that aren't purely dictionaries become lists of strings.
+            if all(type(list_item) is dict for list_item in value):
+                return _StringifyingAPIResponseList(value)
             else:
-                return APIResponse(response_obj)
+                return [str(entry) for entry in value]
+        elif any(type(list_item) is dict for list_item in value):
+            return APIResponseList(value)
+    return value
 
 
 class APIResponse(object):
@@ -156,25 +631,25 @@ class APIResponse(object):
     A dict-proxying object which objectifies API responses for prettier code,
     easier prototyping and less meaningless debugging ("Oh, I forgot square brackets.").
 
-    Recursively wraps every response given to it, by replacing each 'dict' object with an
-    APIResponse instance. Other types are safe.
+    Wraps the parsed response lazily: nested dictionaries are wrapped in APIResponse instances (and
+    lists of them in APIResponseLists) only when they are first accessed. The parsed JSON itself is
+    never copied, and is available through "_raw".
+
+    Lists of plain values are returned as they are. Set the "stringify_lists" APIConnection setting to
+    True to get the old behaviour back for that connection's responses, where they were converted to
+    lists of strings. Setting "APIResponse.stringify_lists" does the same for every response, store and
+    asyncio responses included.
     """
+    __slots__ = ("_real_dictionary", "_wrapped")
+
+    stringify_lists = False
+    # Set on the responses of connections with the "stringify_lists" setting on. (See "_wrap_value")
+    _stringify_lists = False
+
     def __init__(self, father_dict):
-        # Initialize an empty dictionary.
-        self._real_dictionary = {}
-        # Recursively wrap the response in APIResponse instances.
-        for item in father_dict:
-            if type(father_dict[item]) is dict:
-                self._real_dictionary[item] = APIResponse(father_dict[item])
-            elif type(father_dict[item]) is list:
-                #Recurse if list contains dictionaries
-                if all(type(list_item) is dict for list_item in father_dict[item]):
-                    self._real_dictionary[item] = [APIResponse(entry) for entry in father_dict[item]]
-                #Otherwise set as list of strings
-                else:
-                    self._real_dictionary[item] = [str(entry) for entry in father_dict[item]]
-            else:
-                self._real_dictionary[item] = father_dict[item]
+        self._real_dictionary = father_dict
+        # Wrapped nested values, by key. Created on first nested access.
+        self._wrapped = None
 
     def __repr__(self):
         return dict.__repr__(self._real_dictionary)
@@ -183,21 +658,114 @@ class APIResponse(object):
     def __dict__(self):
         return self._real_dictionary
 
+    @property
+    def _raw(self):
+        """
+        The underlying, parsed JSON dictionary.
+
+        :rtype: dict
+        """
+        return self._real_dictionary
+
+    def _get(self, item):
+        value = self._real_dictionary[item]
+        if type(value) is not dict and type(value) is not list:
+            return value
+        wrapped = self._wrapped
+        if wrapped is None:
+            wrapped = self._wrapped = {}
+        elif item in wrapped:
+            return wrapped[item]
+        wrapped[item] = _wrap_value(value, self._stringify_lists)
+        return wrapped[item]
+
     def __getattribute__(self, item):
         if item.startswith("_"):
             return super(APIResponse, self).__getattribute__(item)
         else:
             if item in self._real_dictionary:
-                return self._real_dictionary[item]
+                return self._get(item)
             else:
                 return None
 
     def __getitem__(self, item):
-        return self._real_dictionary[item]
+        return self._get(item)
 
     def __iter__(self):
         return self._real_dictionary.__iter__()
 
+    def __contains__(self, item):
+        return item in self._real_dictionary
+
+    def __len__(self):
+        return len(self._real_dictionary)
+
+
+class APIResponseList(object):
+    """
+    A read-only, list-like view over a raw JSON list, which wraps the dictionaries in it in APIResponse
+    instances as they are accessed.
+    """
+    __slots__ = ("_real_list", "_wrapped")
+
+    _stringify_lists = False
+
+    def __init__(self, father_list):
+        self._real_list = father_list
+        self._wrapped = None
+
+    def __repr__(self):
+        return list.__repr__(self._real_list)
+
+    @property
+    def _raw(self):
+        """
+        The underlying, parsed JSON list.
+
+        :rtype: list
+        """
+        return self._real_list
+
+    def __getitem__(self, index):
+        if type(index) is slice:
+            return [self[position] for position in range(*index.indices(len(self._real_list)))]
+        if self._wrapped is None:
+            self._wrapped = [None] * len(self._real_list)
+        wrapped = self._wrapped[index]
+        if wrapped is None:
+            wrapped = self._wrapped[index] = _wrap_value(self._real_list[index], self._stringify_lists)
+        return wrapped
+
+    def __len__(self):
+        return len(self._real_list)
+
+    def __iter__(self):
+        for index in range(len(self._real_list)):
+            yield self[index]
+
+    def __eq__(self, other):
+        if isinstance(other, APIResponseList):
+            other = other._real_list
+        return self._real_list == other
+
+    def __ne__(self, other):
+        return not self == other
+
+
+class _StringifyingAPIResponse(APIResponse):
+    """
+    An APIResponse from a connection with the "stringify_lists" setting on.
+    """
+    __slots__ = ()
+
+    _stringify_lists = True
+
+
+class _StringifyingAPIResponseList(APIResponseList):
+    __slots__ = ()
+
+    _stringify_lists = True
+
 
 class SteamObject(object):
     @property
@@ -1,8 +1,11 @@
 __author__ = 'SmileyBarry'
 
+import collections
 import threading
 import time
 
+from . import instrument
+
 
 class debug(object):
     @staticmethod
@@ -18,6 +21,132 @@ HOUR = 60 * MINUTE
 INFINITE = 0
 
 
+class SingleFlight(object):
+    """
+    Collapses concurrent calls that share a key into one: the first caller runs the function, and
+    everyone who asks for the same key while it's running waits for, and shares, its result (or its
+    exception). Once the call completes, the key is forgotten.
+    """
+    class _Flight(object):
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self.shared_calls = 0
+
+    def do(self, key, function, *args, **kwargs):
+        with self._lock:
+            flight = self._flights.get(key)
+            is_leader = flight is None
+            if is_leader:
+                flight = self._flights[key] = SingleFlight._Flight()
+            else:
+                self.shared_calls += 1
+
+        if not is_leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = function(*args, **kwargs)
+            return flight.result
+        except Exception as exception:
+            flight.error = exception
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+
+class _RefreshQueue(object):
+    """
+    Runs cached properties' background refreshes on a fixed number of daemon threads, started on first use,
+    so a burst of stale reads queues up instead of starting a thread (and a call) per read.
+
+    Refreshes of a property with a "refresh_many" hook are coalesced: a worker waits "batch_delay" seconds
+    for more of them to queue up, then hands up to "max_batch" objects to the hook at once.
+    """
+    def __init__(self, max_workers=4, batch_delay=0.05, max_batch=100):
+        self.max_workers = max_workers
+        self.batch_delay = batch_delay
+        self.max_batch = max_batch
+        # (cached_property, object, flight key) triples.
+        self._queue = collections.deque()
+        self._condition = threading.Condition()
+        self._workers = []
+        self._running = 0
+
+    def submit(self, prop, inst, flight_key):
+        with self._condition:
+            self._queue.append((prop, inst, flight_key))
+            if len(self._workers) < self.max_workers:
+                worker = threading.Thread(target=self._work)
+                worker.daemon = True
+                self._workers += [worker]
+                worker.start()
+            self._condition.notify()
+
+    def wait(self, timeout=None):
+        """
+        Wait until every queued refresh has run.
+
+        :return: Whether they all have, rather than the timeout running out.
+        :rtype: bool
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._condition:
+            while len(self._queue) > 0 or self._running > 0:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def _take_batch(self):
+        """
+        Wait for a queued refresh and take it, along with the queued refreshes it can be coalesced with.
+
+        :return: The property, and (object, flight key) pairs to refresh it for.
+        """
+        with self._condition:
+            while len(self._queue) == 0:
+                self._condition.wait()
+            prop, inst, flight_key = self._queue.popleft()
+            self._running += 1
+        entries = [(inst, flight_key)]
+        if prop.refresh_many is None:
+            return prop, entries
+
+        time.sleep(self.batch_delay)
+        with self._condition:
+            others = collections.deque()
+            while len(self._queue) > 0 and len(entries) < self.max_batch:
+                queued = self._queue.popleft()
+                if queued[0] is prop:
+                    entries += [queued[1:]]
+                else:
+                    others.append(queued)
+            self._queue.extendleft(reversed(others))
+        return prop, entries
+
+    def _work(self):
+        while True:
+            prop, entries = self._take_batch()
+            try:
+                prop._refresh(entries)
+            finally:
+                with self._condition:
+                    self._running -= 1
+                    self._condition.notify_all()
+
+
 class cached_property(object):
     """(C) 2011 Christopher Arndt, MIT License
 
@@ -50,9 +179,30 @@ class cached_property(object):
 
         del instance._cache[<property name>]
 
+    Set "stale_ttl" to serve expired values for that many more seconds while a
+    background thread refreshes them, instead of making the reader wait::
+
+            @cached_property(ttl=600, stale_ttl=600)
+
+    Background refreshes run on a small, shared pool of threads. A property whose
+    values can be fetched for many objects at once can set a "refresh_many" hook,
+    a function that takes a list of objects and primes all of them; stale reads
+    queued together are then refreshed with one call to it.
+
+    Accesses are thread-safe: concurrent misses on the same property of the same
+    object wait for one evaluation, while other properties stay unaffected.
+
+    Code that fetches a value some other way (e.g. in bulk, or asynchronously)
+    can read and fill the cache through the descriptor itself::
+
+        MyClass.randint.lookup(instance)     # KeyError if missing or expired
+        MyClass.randint.prime(instance, 42)
+
     """
-    def __init__(self, ttl=300):
+    def __init__(self, ttl=300, stale_ttl=0, refresh_many=None):
         self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.refresh_many = refresh_many
 
     def __call__(self, fget, doc=None):
         self.fget = fget
@@ -61,21 +211,114 @@ class cached_property(object):
         self.__module__ = fget.__module__
         return self
 
+    # Concurrent misses on the same property of the same cache wait for one evaluation.
+    _flights = SingleFlight()
+    # Flight keys with a background refresh queued or running.
+    _refreshing = set()
+    _refreshing_lock = threading.Lock()
+    _refresh_queue = _RefreshQueue()
+
     def __get__(self, inst, owner):
+        if inst is None:
+            return self
+        cache = self._cache_of(inst)
+        # Keyed by the cache itself, so objects sharing a cache (see cache.IdentityMap) share the flight.
+        flight_key = (id(cache), self.__name__)
+        entry = cache.get(self.__name__)
+        outcome = instrument.CacheEvent.MISS
+        if entry is not None:
+            value, last_update = entry
+            age = time.time() - last_update
+            if self.ttl <= 0 or age <= self.ttl:
+                if instrument.enabled():
+                    self._emit(inst, instrument.CacheEvent.HIT)
+                return value
+            if age <= self.ttl + self.stale_ttl:
+                if instrument.enabled():
+                    self._emit(inst, instrument.CacheEvent.STALE)
+                self._refresh_in_background(inst, flight_key)
+                return value
+            outcome = instrument.CacheEvent.EXPIRED
+        if instrument.enabled():
+            self._emit(inst, outcome)
+        return cached_property._flights.do(flight_key, self._evaluate, inst)
+
+    def _emit(self, inst, outcome):
+        instrument.emit(instrument.CacheEvent(inst.__class__.__name__, self.__name__, outcome))
+
+    def _refresh_in_background(self, inst, flight_key):
+        with cached_property._refreshing_lock:
+            if flight_key in cached_property._refreshing:
+                return
+            cached_property._refreshing.add(flight_key)
+        cached_property._refresh_queue.submit(self, inst, flight_key)
+
+    def _refresh(self, entries):
+        """
+        Refresh this property for (object, flight key) pairs. Runs on a background thread.
+        """
+        try:
+            if len(entries) > 1:
+                self.refresh_many([inst for inst, flight_key in entries])
+            else:
+                inst, flight_key = entries[0]
+                cached_property._flights.do(flight_key, self._evaluate, inst)
+        except Exception:
+            # Readers keep getting the stale value; the next access past "stale_ttl" retries in
+            # the foreground and raises.
+            pass
+        finally:
+            with cached_property._refreshing_lock:
+                for inst, flight_key in entries:
+                    cached_property._refreshing.discard(flight_key)
+
+    def _evaluate(self, inst):
+        # Another thread may have filled the cache between our miss and this flight.
+        try:
+            return self.lookup(inst)
+        except KeyError:
+            pass
         now = time.time()
+        value = self.fget(inst)
+        self._cache_of(inst)[self.__name__] = (value, now)
+        return value
+
+    @staticmethod
+    def _cache_of(inst):
+        # setdefault is atomic, so racing threads can't each create (and lose) their own '_cache'.
+        return inst.__dict__.setdefault('_cache', {})
+
+    def lookup(self, inst):
+        """
+        Return this property's cached value for "inst" without evaluating the getter.
+
+        :raise: KeyError if there is no cached value, or if it has expired.
+        """
         try:
             value, last_update = inst._cache[self.__name__]
-            if self.ttl > 0 and now - last_update > self.ttl:
-                raise AttributeError
-        except (KeyError, AttributeError):
-            value = self.fget(inst)
-            try:
-                cache = inst._cache
-            except AttributeError:
-                cache = inst._cache = {}
-            cache[self.__name__] = (value, now)
+        except AttributeError:
+            raise KeyError(self.__name__)
+        if self.ttl > 0 and time.time() - last_update > self.ttl:
+            raise KeyError(self.__name__)
         return value
 
+    def last_updated(self, inst):
+        """
+        :return: When this property's cached value for "inst" was computed, in seconds since the epoch,
+                 or None if there is none. Expired values count.
+        :rtype: float or None
+        """
+        entry = getattr(inst, '_cache', {}).get(self.__name__)
+        if entry is None:
+            return None
+        return entry[1]
+
+    def prime(self, inst, value):
+        """
+        Store "value" as this property's cached value for "inst", as if the getter had just returned it.
+        """
+        self._cache_of(inst)[self.__name__] = (value, time.time())
+
 
 class Singleton:
     """
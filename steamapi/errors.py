@@ -6,8 +6,12 @@ from .decorators import debug
 class APIException(Exception):
     """
     Base class for all API exceptions.
+
+    Exceptions raised for an HTTP response carry its "status_code" and, if the API asked callers to
+    back off, how many seconds to wait in "retry_after".
     """
-    pass
+    status_code = None
+    retry_after = None
 
 
 class APIError(APIException):
@@ -18,6 +22,13 @@ class APIError(APIException):
     pass
 
 
+class APIThrottled(APIError):
+    """
+    You're sending calls faster than the API allows, and it asked you to slow down. (429)
+    """
+    pass
+
+
 class APIFailure(APIException):
     """
     An API failure signifies a problem with your request (e.g.: invalid API), a problem with your data,
@@ -49,6 +60,18 @@ class APIUnauthorized(APIFailure):
     """
     pass
 
+class APIUserNotFound(APIFailure):
+    """
+    No user has the vanity URL-ending name you tried to resolve.
+    """
+    pass
+
+class APIRecordingNotFound(APIFailure):
+    """
+    You're replaying recorded responses (see "transport.ReplayTransport"), and this call wasn't recorded.
+    """
+    pass
+
 class APIConfigurationError(APIFailure):
     """
     There's either no APIConnection defined, or
@@ -57,16 +80,23 @@ class APIConfigurationError(APIFailure):
 
 
 @debug.no_return
-def raiseAppropriateException(status_code):
-    if status_code / 100 == 4:
+def raiseAppropriateException(status_code, retry_after=None):
+    if status_code == 429:
+        exception = APIThrottled()
+    elif status_code // 100 == 4:
         if status_code == 404:
-            raise APINotFound()
+            exception = APINotFound()
         elif status_code == 401:
-            raise APIUnauthorized()
+            exception = APIUnauthorized()
         elif status_code == 400:
-            raise APIBadCall()
+            exception = APIBadCall()
         else:
-            raise APIFailure()
-    elif status_code / 100 == 5:
-        raise APIError()
+            exception = APIFailure()
+    elif status_code // 100 == 5:
+        exception = APIError()
+    else:
+        return
+    exception.status_code = status_code
+    exception.retry_after = retry_after
+    raise exception
 
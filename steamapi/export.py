@@ -0,0 +1,262 @@
+__author__ = 'SmileyBarry'
+
+import array
+import os
+import struct
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from . import errors
+from .core import APIConnection, _array_typecode, _new_column, _parallel_imap
+from .decorators import cached_property, INFINITE
+from .user import SteamUser
+
+
+def _write_column(typecode, column, column_file):
+    """
+    Write a column as native-endian, packed values.
+
+    :type column: array.array or list
+    """
+    if not isinstance(column, array.array) or column.typecode != _array_typecode(typecode):
+        column = _new_column(typecode, column)
+    if isinstance(column, array.array):
+        column.tofile(column_file)
+    else:
+        column_file.write(struct.pack("={count}{typecode}".format(count=len(column), typecode=typecode),
+                                      *column))
+
+
+def _column_from_bytes(typecode, data):
+    """
+    The reverse of "_write_column".
+
+    :rtype: array.array or list
+    """
+    column = _new_column(typecode)
+    if isinstance(column, array.array):
+        if hasattr(column, "frombytes"):
+            column.frombytes(data)
+        else:
+            column.fromstring(data)
+        return column
+    count = len(data) // struct.calcsize(typecode)
+    return list(struct.unpack("={count}{typecode}".format(count=count, typecode=typecode), data))
+
+
+class _ColumnarExport(object):
+    """
+    Shared plumbing for the columnar exports: a handful of typed, flat arrays, saved to (and loaded
+    from) one raw binary file each. The files hold native-endian values with no header, so they can be
+    memory-mapped as-is, e.g. with "numpy.memmap".
+    """
+    # (column name, array typecode) pairs. Subclasses fill this in.
+    COLUMNS = ()
+
+    def __init__(self, **columns):
+        for name, typecode in self.COLUMNS:
+            setattr(self, name, columns[name])
+
+    def save(self, directory):
+        """
+        Write every column to "<directory>/<column>.bin".
+        """
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        for name, typecode in self.COLUMNS:
+            column = getattr(self, name)
+            with open(os.path.join(directory, name + ".bin"), "wb") as column_file:
+                if numpy is not None and isinstance(column, numpy.ndarray):
+                    column.tofile(column_file)
+                else:
+                    _write_column(typecode, column, column_file)
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """
+        Read an export saved with "save".
+
+        :param mmap: If NumPy is installed, memory-map the files (read-only) instead of reading them into
+                     memory. Without NumPy, the columns are always read into arrays.
+        :type mmap: bool
+        """
+        columns = {}
+        for name, typecode in cls.COLUMNS:
+            path = os.path.join(directory, name + ".bin")
+            if numpy is not None:
+                dtype = numpy.dtype(typecode)
+                if mmap is True and os.path.getsize(path) > 0:
+                    columns[name] = numpy.memmap(path, dtype=dtype, mode="r")
+                else:
+                    columns[name] = numpy.fromfile(path, dtype=dtype)
+            else:
+                with open(path, "rb") as column_file:
+                    columns[name] = _column_from_bytes(typecode, column_file.read())
+        return cls(**columns)
+
+    def as_numpy(self):
+        """
+        :return: This export's columns as NumPy arrays, without copying those already backed by NumPy.
+        :rtype: dict
+        """
+        if numpy is None:
+            raise ImportError("as_numpy requires the 'numpy' package.")
+        return dict((name, numpy.asarray(getattr(self, name), dtype=numpy.dtype(typecode)))
+                    for name, typecode in self.COLUMNS)
+
+
+class FriendGraphCSR(_ColumnarExport):
+    """
+    A friend graph in compressed sparse row form: "nodes" holds the SteamIDs whose friend lists were
+    collected, and the friends of nodes[i] are targets[offsets[i]:offsets[i + 1]]. That's three flat
+    int64 arrays, instead of a SteamUser object (and its cache) per friend.
+
+    Build one from edges (e.g. "graph.FriendGraphCrawler.crawl()") or straight from users.
+    """
+    COLUMNS = (("nodes", "q"), ("offsets", "q"), ("targets", "q"))
+
+    @classmethod
+    def from_edges(cls, edges):
+        """
+        :param edges: (SteamID, friend's SteamID, ...) tuples, in any order. Extra items are ignored.
+        :rtype: FriendGraphCSR
+        """
+        node_index = {}
+        nodes = _new_column("q")
+        sources = _new_column("q")
+        targets = _new_column("q")
+        for edge in edges:
+            source = int(edge[0])
+            if source not in node_index:
+                node_index[source] = len(nodes)
+                nodes.append(source)
+            sources.append(node_index[source])
+            targets.append(int(edge[1]))
+
+        # Counting sort of the edges by source.
+        offsets = _new_column("q", [0]) * (len(nodes) + 1)
+        for source in sources:
+            offsets[source + 1] += 1
+        for index in range(len(nodes)):
+            offsets[index + 1] += offsets[index]
+        next_slot = _new_column("q", offsets[:-1])
+        sorted_targets = _new_column("q", [0]) * len(targets)
+        for source, target in zip(sources, targets):
+            sorted_targets[next_slot[source]] = target
+            next_slot[source] += 1
+
+        return cls(nodes=nodes, offsets=offsets, targets=sorted_targets)
+
+    @classmethod
+    def from_users(cls, users, max_workers=8):
+        """
+        Fetch the friend lists of many users concurrently and build a graph from them. Friend lists are
+        read as raw responses; no SteamUser objects are created. Users with private friend lists are left
+        out of the graph, like users with no friends.
+
+        :type users: list of int, str or SteamUser
+        :rtype: FriendGraphCSR
+        """
+        def fetch_friends(user):
+            steamid = getattr(user, "steamid", user)
+            try:
+                response = APIConnection().call("ISteamUser", "GetFriendList", "v0001", steamid=steamid,
+                                                relationship="friend")
+            except errors.APIUnauthorized:
+                # Private friend list.
+                return []
+            if response.friendslist is None:
+                return []
+            return [(steamid, friend.steamid) for friend in response.friendslist.friends]
+
+        return cls.from_edges(edge for friend_list in _parallel_imap(fetch_friends, users, max_workers)
+                              for edge in friend_list)
+
+    @cached_property(ttl=INFINITE)
+    def _node_index(self):
+        return dict((int(steamid), index) for index, steamid in enumerate(self.nodes))
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def friends_of(self, steamid):
+        """
+        :return: The SteamIDs of a node's friends, or an empty sequence if it isn't in the graph.
+        """
+        index = self._node_index.get(int(steamid))
+        if index is None:
+            return self.targets[0:0]
+        return self.targets[self.offsets[index]:self.offsets[index + 1]]
+
+
+class PlaytimeMatrix(_ColumnarExport):
+    """
+    A sparse user x app matrix of total playtime, in minutes, in compressed sparse row form: the games of
+    users[i] are apps[offsets[i]:offsets[i + 1]], with their playtimes at the same positions of
+    "playtimes". Apps are stored by app ID, so rows from different users line up without a lookup table.
+    """
+    COLUMNS = (("users", "q"), ("offsets", "q"), ("apps", "q"), ("playtimes", "i"))
+
+    @classmethod
+    def from_games(cls, rows):
+        """
+        :param rows: (SteamID, games) pairs, where "games" are SteamApp objects (e.g. "SteamUser.games") or
+                     raw "GetOwnedGames" entries.
+        :rtype: PlaytimeMatrix
+        """
+        users = _new_column("q")
+        offsets = _new_column("q", [0])
+        apps = _new_column("q")
+        playtimes = _new_column("i")
+        for steamid, games in rows:
+            users.append(int(steamid))
+            for game in games:
+                apps.append(int(game.appid))
+                playtimes.append(int(getattr(game, "playtime_forever", None) or 0))
+            offsets.append(len(apps))
+        return cls(users=users, offsets=offsets, apps=apps, playtimes=playtimes)
+
+    @classmethod
+    def from_users(cls, users, include_played_free_games=True, max_workers=8):
+        """
+        Fetch the owned games of many users concurrently and build a matrix from them. Users whose games
+        are already cached are read from the cache; the rest are read as raw responses, without creating
+        SteamApp objects.
+
+        :type users: list of int, str or SteamUser
+        :rtype: PlaytimeMatrix
+        """
+        def fetch_games(user):
+            if isinstance(user, SteamUser) and include_played_free_games is True:
+                try:
+                    return user.steamid, SteamUser.games.lookup(user)
+                except KeyError:
+                    pass
+            steamid = getattr(user, "steamid", user)
+            response = APIConnection().call("IPlayerService",
+                                            "GetOwnedGames",
+                                            "v1",
+                                            steamid=steamid,
+                                            include_appinfo=False,
+                                            include_played_free_games=include_played_free_games)
+            return steamid, response.games or []
+
+        return cls.from_games(_parallel_imap(fetch_games, users, max_workers))
+
+    def __len__(self):
+        return len(self.users)
+
+    def to_scipy(self):
+        """
+        :return: The matrix as a SciPy CSR matrix, plus the app ID of each of its columns.
+        :rtype: (scipy.sparse.csr_matrix, numpy.ndarray)
+        """
+        import scipy.sparse
+        columns = self.as_numpy()
+        app_ids, column_indices = numpy.unique(columns["apps"], return_inverse=True)
+        matrix = scipy.sparse.csr_matrix((columns["playtimes"], column_indices, columns["offsets"]),
+                                         shape=(len(columns["users"]), len(app_ids)))
+        return matrix, app_ids
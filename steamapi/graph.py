@@ -0,0 +1,309 @@
+__author__ = 'SmileyBarry'
+
+import collections
+import os
+import sqlite3
+
+from .core import APIConnection, _chunks, _parallel_imap
+from .consts import CommunityVisibilityState
+from .user import UserBatch
+from . import errors
+
+# The most SteamIDs to look up in one SQLite query. (SQLite's default limit on query parameters is 999.)
+_LOOKUP_CHUNK_SIZE = 500
+
+
+class _CrawlState(object):
+    """
+    A crawl's progress, in memory: the visited set, the frontier being expanded (and how far along it is) and
+    the next level's frontier. Memory use is bounded by the crawl's "max_nodes".
+    """
+    def __init__(self, max_depth, max_nodes):
+        self.max_depth = max_depth
+        self.max_nodes = max_nodes
+        self.depth = 0
+        self.position = 0
+        self._frontier = []
+        self._next_frontier = []
+        self._visited = set()
+
+    @property
+    def visited_count(self):
+        return len(self._visited)
+
+    def seed(self, steamids):
+        """
+        Add users to the current level's frontier, regardless of "max_nodes".
+        """
+        for steamid in steamids:
+            if steamid not in self._visited:
+                self._visited.add(steamid)
+                self._frontier += [steamid]
+
+    def discover(self, steamids):
+        """
+        Add the users not visited yet to the next level's frontier, up to "max_nodes".
+        """
+        for steamid in steamids:
+            if steamid not in self._visited and len(self._visited) < self.max_nodes:
+                self._visited.add(steamid)
+                self._next_frontier += [steamid]
+
+    def window(self, size):
+        """
+        :return: The next "size" users of the current level's frontier.
+        :rtype: list of int
+        """
+        return self._frontier[self.position:self.position + size]
+
+    def advance(self, count):
+        """
+        Mark the next "count" users of the frontier, and everything discovered from them, as done.
+        """
+        self.position += count
+
+    def next_level(self):
+        self.depth += 1
+        self._frontier = self._next_frontier
+        self._next_frontier = []
+        self.position = 0
+
+
+class _SQLiteCrawlState(object):
+    """
+    A crawl's progress, in an SQLite database file, so crawls outlive the process and the visited set doesn't
+    have to fit in memory. Discovered users are written as they're found, in a transaction committed once per
+    window: a checkpoint costs as much as the window's new users, and a crash rolls back to the last one.
+
+    Used from one thread at a time: the thread consuming "FriendGraphCrawler.crawl".
+    """
+    def __init__(self, path):
+        self.path = path
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        connection = self._connection
+        with connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS crawl_progress ("
+                               "id INTEGER PRIMARY KEY CHECK (id = 0), max_depth INTEGER NOT NULL, "
+                               "max_nodes INTEGER NOT NULL, depth INTEGER NOT NULL, position INTEGER NOT NULL)")
+            connection.execute("CREATE TABLE IF NOT EXISTS crawl_visited (steamid INTEGER PRIMARY KEY)")
+            connection.execute("CREATE TABLE IF NOT EXISTS crawl_frontier ("
+                               "depth INTEGER NOT NULL, position INTEGER NOT NULL, steamid INTEGER NOT NULL, "
+                               "PRIMARY KEY (depth, position))")
+        row = connection.execute("SELECT max_depth, max_nodes, depth, position FROM crawl_progress").fetchone()
+        if row is None:
+            row = (0, 0, 0, 0)
+        self.max_depth, self.max_nodes, self.depth, self.position = row
+        self.visited_count = connection.execute("SELECT COUNT(*) FROM crawl_visited").fetchone()[0]
+        # How many users each level's frontier holds.
+        self._sizes = collections.defaultdict(int)
+        for depth, size in connection.execute("SELECT depth, COUNT(*) FROM crawl_frontier GROUP BY depth"):
+            self._sizes[depth] = size
+
+    def reset(self, max_depth, max_nodes):
+        """
+        Forget any saved progress, and start a new crawl.
+        """
+        with self._connection:
+            self._connection.execute("DELETE FROM crawl_progress")
+            self._connection.execute("DELETE FROM crawl_visited")
+            self._connection.execute("DELETE FROM crawl_frontier")
+            self._connection.execute("INSERT INTO crawl_progress (id, max_depth, max_nodes, depth, position) "
+                                     "VALUES (0, ?, ?, 0, 0)", (max_depth, max_nodes))
+        self.max_depth = max_depth
+        self.max_nodes = max_nodes
+        self.depth = 0
+        self.position = 0
+        self.visited_count = 0
+        self._sizes.clear()
+
+    def _add(self, steamids, depth, limit):
+        """
+        Add the users not visited yet, up to "limit" of them (None for no limit), to a level's frontier.
+        """
+        new = []
+        seen = set()
+        for chunk in _chunks(list(steamids), _LOOKUP_CHUNK_SIZE):
+            rows = self._connection.execute("SELECT steamid FROM crawl_visited WHERE steamid IN "
+                                            "({marks})".format(marks=", ".join("?" * len(chunk))), chunk)
+            visited = set(row[0] for row in rows)
+            for steamid in chunk:
+                if steamid not in visited and steamid not in seen:
+                    seen.add(steamid)
+                    new += [steamid]
+        if limit is not None:
+            new = new[:max(0, limit)]
+        if len(new) == 0:
+            return
+        position = self._sizes[depth]
+        self._connection.executemany("INSERT INTO crawl_visited (steamid) VALUES (?)", [(steamid,) for steamid in new])
+        self._connection.executemany("INSERT INTO crawl_frontier (depth, position, steamid) VALUES (?, ?, ?)",
+                                     [(depth, position + index, steamid) for index, steamid in enumerate(new)])
+        self._sizes[depth] += len(new)
+        self.visited_count += len(new)
+
+    def seed(self, steamids):
+        self._add(steamids, self.depth, None)
+        self._connection.commit()
+
+    def discover(self, steamids):
+        if self.visited_count < self.max_nodes:
+            self._add(steamids, self.depth + 1, self.max_nodes - self.visited_count)
+
+    def window(self, size):
+        return [row[0] for row in self._connection.execute("SELECT steamid FROM crawl_frontier WHERE depth = ? "
+                                                           "AND position >= ? ORDER BY position LIMIT ?",
+                                                           (self.depth, self.position, size))]
+
+    def advance(self, count):
+        self.position += count
+        self._connection.execute("UPDATE crawl_progress SET position = ?", (self.position,))
+        self._connection.commit()
+
+    def next_level(self):
+        self.depth += 1
+        self.position = 0
+        self._connection.execute("DELETE FROM crawl_frontier WHERE depth < ?", (self.depth,))
+        self._connection.execute("UPDATE crawl_progress SET depth = ?, position = 0", (self.depth,))
+        self._connection.commit()
+        self._sizes.pop(self.depth - 1, None)
+
+
+class FriendGraphCrawler(object):
+    """
+    A breadth-first crawler over the Steam friend graph. Starting from a few seed users, it fetches friend
+    lists level by level, concurrently, and streams the edges it finds::
+
+        crawler = FriendGraphCrawler([76561197960287930], max_depth=2, max_nodes=100000,
+                                     checkpoint_path="crawl.sqlite")
+        for steamid, friend_steamid, friend_since in crawler.crawl():
+            ...
+
+    The crawler works on raw SteamIDs (ints) and never builds SteamUser objects, so its memory use is
+    just the visited set and the current frontier. Before each window of the frontier is expanded, its
+    summaries are fetched in batches of 100 so private profiles (whose friend lists can't be read) are
+    skipped without wasting a call on each; "on_summaries" receives those summaries if you want them.
+
+    With a "checkpoint_path", the visited set and the frontiers are kept in an SQLite database there
+    instead of in memory, and progress is committed after every window; "FriendGraphCrawler.resume" picks
+    up from the last commit. Edges of a window that was in progress when the crawl stopped are yielded
+    again on resume.
+    """
+    def __init__(self, seeds, max_depth=1, max_nodes=10000, max_workers=8, window=1000,
+                 skip_private=True, on_summaries=None, checkpoint_path=None):
+        """
+        :param seeds: SteamIDs to start from.
+        :type seeds: list of int
+        :param max_depth: How many hops away from the seeds to expand. 1 fetches the seeds' friend lists.
+        :type max_depth: int
+        :param max_nodes: The most users to discover. Users found past the budget appear as edge targets
+                          but are never expanded.
+        :type max_nodes: int
+        :param max_workers: How many friend lists to fetch concurrently.
+        :type max_workers: int
+        :param window: How many frontier users are expanded between checkpoints.
+        :type window: int
+        :param skip_private: Whether to check summaries first and skip private profiles.
+        :type skip_private: bool
+        :param on_summaries: Called with each batch of fetched summaries (list of APIResponse).
+        :param checkpoint_path: An SQLite database file to keep the crawl's progress in. Any progress
+                                already saved there is discarded; see "resume" to continue it. (Optional)
+        :type checkpoint_path: str
+        """
+        self.max_depth = max_depth
+        self.max_nodes = max_nodes
+        self.max_workers = max_workers
+        self.window = window
+        self.skip_private = skip_private
+        self.on_summaries = on_summaries
+        self.checkpoint_path = checkpoint_path
+
+        if checkpoint_path is None:
+            self._state = _CrawlState(max_depth, max_nodes)
+        else:
+            self._state = _SQLiteCrawlState(checkpoint_path)
+            self._state.reset(max_depth, max_nodes)
+        self._state.seed([int(seed) for seed in seeds])
+
+    @classmethod
+    def resume(cls, checkpoint_path, **kwargs):
+        """
+        Create a crawler that continues from a checkpoint database. Options not saved in the checkpoint
+        (workers, callbacks, ...) can be passed again as keyword arguments.
+
+        :rtype: FriendGraphCrawler
+        :raise: IOError if there's no checkpoint at "checkpoint_path".
+        """
+        if not os.path.exists(checkpoint_path):
+            raise IOError("No crawl checkpoint at {path}".format(path=checkpoint_path))
+        state = _SQLiteCrawlState(checkpoint_path)
+        kwargs.setdefault("max_depth", state.max_depth)
+        kwargs.setdefault("max_nodes", state.max_nodes)
+        crawler = cls([], **kwargs)
+        crawler.checkpoint_path = checkpoint_path
+        state.max_depth = crawler.max_depth
+        state.max_nodes = crawler.max_nodes
+        crawler._state = state
+        return crawler
+
+    def save_checkpoint(self):
+        """
+        Commit the crawl's progress. The crawl does so after every window on its own; with no
+        "checkpoint_path", this does nothing.
+        """
+        if self.checkpoint_path is not None:
+            self._state.advance(0)
+
+    @property
+    def visited_count(self):
+        return self._state.visited_count
+
+    def crawl(self):
+        """
+        Run (or continue) the crawl.
+
+        :return: A generator of (SteamID, friend's SteamID, friend_since) edges.
+        """
+        state = self._state
+        while state.depth < self.max_depth:
+            window_ids = state.window(self.window)
+            if len(window_ids) == 0:
+                if state.position == 0:
+                    # Nothing left to expand.
+                    return
+                state.next_level()
+                continue
+
+            window = window_ids
+            if self.skip_private is True or self.on_summaries is not None:
+                window = self._filter_public(window_ids)
+
+            for steamid, friends in _parallel_imap(self._fetch_friends, window, self.max_workers,
+                                                  ordered=False):
+                for friend_steamid, friend_since in friends:
+                    yield steamid, friend_steamid, friend_since
+                state.discover([friend_steamid for friend_steamid, friend_since in friends])
+
+            state.advance(len(window_ids))
+
+    def _filter_public(self, steamids):
+        public = set()
+        for chunk in _chunks(steamids, UserBatch.CHUNK_SIZE):
+            summaries = APIConnection().call("ISteamUser", "GetPlayerSummaries", "v0002", steamids=chunk).players
+            if self.on_summaries is not None:
+                self.on_summaries(summaries)
+            for summary in summaries:
+                # The Web API reports friends-only profiles as private, too.
+                if self.skip_private is False or summary.communityvisibilitystate != CommunityVisibilityState.PRIVATE:
+                    public.add(int(summary.steamid))
+        return [steamid for steamid in steamids if steamid in public]
+
+    @staticmethod
+    def _fetch_friends(steamid):
+        try:
+            response = APIConnection().call("ISteamUser", "GetFriendList", "v0001", steamid=steamid,
+                                            relationship="friend")
+        except errors.APIUnauthorized:
+            # Private friend list.
+            return steamid, []
+        friends = response.friendslist.friends if response.friendslist is not None else []
+        return steamid, [(int(friend.steamid), friend.friend_since) for friend in friends]
@@ -0,0 +1,304 @@
+__author__ = 'SmileyBarry'
+
+import threading
+
+# Subscribed sinks. Code that emits events checks this list first, so nothing is measured while it's empty.
+_sinks = []
+_sinks_lock = threading.Lock()
+
+
+def subscribe(sink):
+    """
+    Start sending instrumentation events to a sink: any function (or callable object) that takes one event,
+    a CallEvent or a CacheEvent. Sinks are called on the thread that made the call, so they should be quick.
+
+    :return: The sink, for chaining.
+    """
+    global _sinks
+    with _sinks_lock:
+        # Replaced rather than appended to, so emitting never iterates over a list being modified.
+        _sinks = _sinks + [sink]
+    return sink
+
+
+def unsubscribe(sink):
+    global _sinks
+    with _sinks_lock:
+        _sinks = [subscribed for subscribed in _sinks if subscribed is not sink]
+
+
+def enabled():
+    """
+    :return: Whether any sink is subscribed.
+    :rtype: bool
+    """
+    return len(_sinks) > 0
+
+
+def emit(event):
+    for sink in _sinks:
+        sink(event)
+
+
+class CallEvent(object):
+    """
+    One API call, from the moment it was made until it returned or raised.
+
+        interface, command, version, method -- What was called. Store calls have STORE_INTERFACE as
+                                               their interface and no version.
+        started -- Unix time the call was made.
+        latency -- Seconds until it returned, retries and waits included.
+        status -- The last HTTP status received, or None if no response came back.
+        bytes -- The response body's size, or None if it was streamed.
+        decode_time -- Seconds spent decoding the JSON body.
+        wrap_time -- Seconds spent wrapping it in an APIResponse.
+        retries -- How many times the call was retried.
+        cache -- "hit" or "miss" if the response cache was consulted, None otherwise.
+        error -- The exception the call raised, if any.
+    """
+    __slots__ = ("interface", "command", "version", "method", "started", "latency", "status", "bytes",
+                 "decode_time", "wrap_time", "retries", "cache", "error")
+
+    def __init__(self, interface, command, version, method, started):
+        self.interface = interface
+        self.command = command
+        self.version = version
+        self.method = method
+        self.started = started
+        self.latency = 0.0
+        self.status = None
+        self.bytes = None
+        self.decode_time = 0.0
+        self.wrap_time = 0.0
+        self.retries = 0
+        self.cache = None
+        self.error = None
+
+    def __repr__(self):
+        return '<{clsname} {interface}.{command} {status} ({latency:.3f}s)>'.format(clsname=self.__class__.__name__,
+                                                                                interface=self.interface,
+                                                                                command=self.command,
+                                                                                status=self.status,
+                                                                                latency=self.latency)
+
+
+class CacheEvent(object):
+    """
+    One read of a cached property.
+
+        owner -- The name of the class the property belongs to. (E.g.: "SteamUser")
+        name -- The property's name. (E.g.: "_summary")
+        outcome -- HIT (fresh value), STALE (expired value served while a refresh runs), EXPIRED (expired
+                   value, recomputed) or MISS (no value yet, computed).
+    """
+    __slots__ = ("owner", "name", "outcome")
+
+    HIT = "hit"
+    STALE = "stale"
+    EXPIRED = "expired"
+    MISS = "miss"
+
+    def __init__(self, owner, name, outcome):
+        self.owner = owner
+        self.name = name
+        self.outcome = outcome
+
+    def __repr__(self):
+        return '<{clsname} {owner}.{name} {outcome}>'.format(clsname=self.__class__.__name__,
+                                                             owner=self.owner,
+                                                             name=self.name,
+                                                             outcome=self.outcome)
+
+
+class Histogram(object):
+    """
+    An in-memory sink that aggregates call events per endpoint (latency histogram, bytes, decode and
+    wrap time, retries, errors) and counts cached property outcomes per property::
+
+        histogram = instrument.subscribe(instrument.Histogram())
+        ...
+        histogram.stats()
+    """
+    # Upper bounds of the latency buckets, in seconds. Latencies past the last one land in "+Inf".
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._calls = {}
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        with self._lock:
+            if isinstance(event, CacheEvent):
+                key = (event.owner, event.name, event.outcome)
+                self._cache[key] = self._cache.get(key, 0) + 1
+                return
+
+            key = (event.interface, event.command)
+            stats = self._calls.get(key)
+            if stats is None:
+                stats = self._calls[key] = {"count": 0,
+                                            "errors": 0,
+                                            "latency_sum": 0.0,
+                                            "latency_buckets": [0] * (len(self.buckets) + 1),
+                                            "bytes": 0,
+                                            "decode_time": 0.0,
+                                            "wrap_time": 0.0,
+                                            "retries": 0,
+                                            "cache_hits": 0}
+            stats["count"] += 1
+            if event.error is not None:
+                stats["errors"] += 1
+            stats["latency_sum"] += event.latency
+            for index, bound in enumerate(self.buckets):
+                if event.latency <= bound:
+                    break
+            else:
+                index = len(self.buckets)
+            stats["latency_buckets"][index] += 1
+            stats["bytes"] += event.bytes or 0
+            stats["decode_time"] += event.decode_time
+            stats["wrap_time"] += event.wrap_time
+            stats["retries"] += event.retries
+            if event.cache == "hit":
+                stats["cache_hits"] += 1
+
+    def stats(self):
+        """
+        :return: A copy of the aggregates: "calls", by (interface, command), and "cached_properties", by
+                 (owner, name, outcome).
+        :rtype: dict
+        """
+        with self._lock:
+            calls = dict((key, dict(stats, latency_buckets=list(stats["latency_buckets"])))
+                         for key, stats in self._calls.items())
+            return {"calls": calls, "cached_properties": dict(self._cache)}
+
+    def percentile(self, interface, command, percent):
+        """
+        :return: An upper bound on an endpoint's latency percentile, from its bucket, in seconds. None if the
+                 endpoint has no calls, infinity if it's past the last bucket.
+        :rtype: float or None
+        """
+        with self._lock:
+            stats = self._calls.get((interface, command))
+            if stats is None:
+                return None
+            rank = percent / 100.0 * stats["count"]
+            seen = 0
+            for index, count in enumerate(stats["latency_buckets"]):
+                seen += count
+                if seen >= rank and count > 0:
+                    return self.buckets[index] if index < len(self.buckets) else float("inf")
+            return float("inf")
+
+    def reset(self):
+        with self._lock:
+            self._calls.clear()
+            self._cache.clear()
+
+
+def _label_value(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+class PrometheusExporter(Histogram):
+    """
+    A Histogram that can render its aggregates in the Prometheus text exposition format, e.g. for a
+    "/metrics" endpoint::
+
+        exporter = instrument.subscribe(instrument.PrometheusExporter())
+        ...
+        body = exporter.render()
+    """
+    def __init__(self, buckets=Histogram.DEFAULT_BUCKETS, prefix="steamapi"):
+        super(PrometheusExporter, self).__init__(buckets)
+        self.prefix = prefix
+
+    def render(self):
+        """
+        :rtype: str
+        """
+        stats = self.stats()
+        prefix = self.prefix
+        lines = ["# HELP {prefix}_call_latency_seconds API call latency, retries included.".format(prefix=prefix),
+                 "# TYPE {prefix}_call_latency_seconds histogram".format(prefix=prefix)]
+        counters = (("calls_total", "count", "API calls made."),
+                    ("call_errors_total", "errors", "API calls that raised."),
+                    ("response_bytes_total", "bytes", "Response bytes received."),
+                    ("decode_seconds_total", "decode_time", "Time spent decoding JSON."),
+                    ("wrap_seconds_total", "wrap_time", "Time spent wrapping responses."),
+                    ("retries_total", "retries", "Retried attempts."),
+                    ("response_cache_hits_total", "cache_hits", "Calls answered by the response cache."))
+
+        for (interface, command), call_stats in sorted(stats["calls"].items(), key=lambda item: str(item[0])):
+            labels = 'interface="{interface}",command="{command}"'.format(interface=_label_value(interface),
+                                                                         command=_label_value(command))
+            cumulative = 0
+            for index, count in enumerate(call_stats["latency_buckets"]):
+                cumulative += count
+                bound = "+Inf" if index == len(self.buckets) else repr(self.buckets[index])
+                lines += ['{prefix}_call_latency_seconds_bucket{{{labels},le="{bound}"}} {count}'.format(
+                    prefix=prefix, labels=labels, bound=bound, count=cumulative)]
+            lines += ["{prefix}_call_latency_seconds_sum{{{labels}}} {value}".format(
+                prefix=prefix, labels=labels, value=repr(call_stats["latency_sum"]))]
+            lines += ["{prefix}_call_latency_seconds_count{{{labels}}} {value}".format(
+                prefix=prefix, labels=labels, value=call_stats["count"])]
+
+        for name, field, description in counters:
+            lines += ["# HELP {prefix}_{name} {description}".format(prefix=prefix, name=name, description=description),
+                      "# TYPE {prefix}_{name} counter".format(prefix=prefix, name=name)]
+            for (interface, command), call_stats in sorted(stats["calls"].items(), key=lambda item: str(item[0])):
+                lines += ['{prefix}_{name}{{interface="{interface}",command="{command}"}} {value}'.format(
+                    prefix=prefix, name=name, interface=_label_value(interface), command=_label_value(command),
+                    value=repr(call_stats[field]))]
+
+        lines += ["# HELP {prefix}_cached_property_reads_total Cached property reads, by outcome.".format(prefix=prefix),
+                  "# TYPE {prefix}_cached_property_reads_total counter".format(prefix=prefix)]
+        for (owner, name, outcome), count in sorted(stats["cached_properties"].items()):
+            lines += ['{prefix}_cached_property_reads_total{{owner="{owner}",name="{name}",outcome="{outcome}"}} '
+                      '{count}'.format(prefix=prefix, owner=_label_value(owner), name=_label_value(name),
+                                       outcome=outcome, count=count)]
+        return "\n".join(lines) + "\n"
+
+
+class SpanSink(object):
+    """
+    A sink that turns every call event into an OpenTelemetry-style span and hands it to a callback, to be
+    forwarded to a tracer. A span is a dictionary::
+
+        {"name": "ISteamUser.GetPlayerSummaries",
+         "start_time": 1700000000.0, "end_time": 1700000000.1,   # Unix time, in seconds
+         "status": "OK",                                          # or "ERROR"
+         "attributes": {"http.method": "GET", "http.status_code": 200, "steamapi.interface": ...}}
+
+    Cached property events are ignored.
+    """
+    def __init__(self, callback):
+        self.callback = callback
+
+    def __call__(self, event):
+        if not isinstance(event, CallEvent):
+            return
+        attributes = {"http.method": event.method,
+                      "steamapi.interface": event.interface,
+                      "steamapi.command": event.command,
+                      "steamapi.retries": event.retries,
+                      "steamapi.decode_time": event.decode_time,
+                      "steamapi.wrap_time": event.wrap_time}
+        if event.version is not None:
+            attributes["steamapi.version"] = event.version
+        if event.status is not None:
+            attributes["http.status_code"] = event.status
+        if event.bytes is not None:
+            attributes["http.response_content_length"] = event.bytes
+        if event.cache is not None:
+            attributes["steamapi.response_cache"] = event.cache
+        if event.error is not None:
+            attributes["exception.type"] = event.error.__class__.__name__
+        self.callback({"name": "{interface}.{command}".format(interface=event.interface, command=event.command),
+                       "start_time": event.started,
+                       "end_time": event.started + event.latency,
+                       "status": "OK" if event.error is None else "ERROR",
+                       "attributes": attributes})
@@ -0,0 +1,188 @@
+__author__ = 'SmileyBarry'
+
+import collections
+import random
+import threading
+import time
+
+from .consts import Enum, OnlineState
+from .core import APIConnection, _chunks, _new_column, _parallel_map
+from .user import UserBatch
+
+
+class PresenceChange(Enum):
+    CAME_ONLINE = "came_online"
+    WENT_OFFLINE = "went_offline"
+    # Online, but e.g. from "online" to "away".
+    STATE_CHANGED = "state_changed"
+    STARTED_GAME = "started_game"
+    STOPPED_GAME = "stopped_game"
+
+# One change to one user's presence. "old" and "new" are persona states (see consts.OnlineState) for
+# state changes, and game IDs for game changes. (0 means no game.) "time" is the poll's Unix time.
+PresenceEvent = collections.namedtuple("PresenceEvent", ("kind", "steamid", "old", "new", "time"))
+
+
+class PresenceTracker(object):
+    """
+    Tracks the online state and current game of many users by polling "GetPlayerSummaries" (100 users
+    per call) and reporting only what changed since the previous poll::
+
+        tracker = PresenceTracker(steamids, interval=60, on_event=handle_event)
+        tracker.start()
+
+    The last known state of every user is kept in a few flat arrays (SteamIDs, persona states, game IDs
+    and last log-off times), indexed by position, instead of SteamUser objects. Each poll still compares
+    every returned player against them, so it does a small, fixed amount of work per user tracked; only
+    the users whose state or game changed are written back and turned into events, and no per-user
+    objects are created or kept between polls.
+
+    The first poll only records the initial state, without reporting events. Users the API doesn't return
+    (e.g. invalid SteamIDs) keep their last known state.
+    """
+    def __init__(self, steamids, interval=60, on_event=None, max_workers=4):
+        """
+        :param steamids: The users to track.
+        :type steamids: list of int or str
+        :param interval: Seconds between polls, while running in the background.
+        :type interval: float
+        :param on_event: Called with every PresenceEvent, in the polling thread.
+        :param max_workers: How many calls to make concurrently.
+        :type max_workers: int
+        """
+        self.interval = interval
+        self.on_event = on_event
+        self.max_workers = max_workers
+        self.polls = 0
+
+        self._index = {}
+        self._steamids = _new_column("q")
+        for steamid in steamids:
+            steamid = int(steamid)
+            if steamid not in self._index:
+                self._index[steamid] = len(self._steamids)
+                self._steamids.append(steamid)
+        self._states = _new_column("b", [OnlineState.OFFLINE]) * len(self._steamids)
+        self._games = _new_column("Q", [0]) * len(self._steamids)
+        self._last_logoffs = _new_column("q", [0]) * len(self._steamids)
+        # Whether each user was returned by a poll yet.
+        self._seen = bytearray(len(self._steamids))
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __len__(self):
+        return len(self._steamids)
+
+    def state(self, steamid):
+        """
+        :return: A user's last known persona state, game ID (0 if none) and last log-off (Unix time), or
+                 None if no poll returned the user yet.
+        :rtype: (int, int, int) or None
+        """
+        index = self._index.get(int(steamid))
+        if index is None or self._seen[index] == 0:
+            return None
+        return self._states[index], self._games[index], self._last_logoffs[index]
+
+    def _fetch_chunk(self, steamids):
+        connection = APIConnection()
+        # Decoded without wrapping, since only three fields per player are read.
+        response = connection.json_decoder(connection.call_raw("ISteamUser", "GetPlayerSummaries", "v0002",
+                                                               steamids=list(steamids)))
+        return response.get("response", {}).get("players", [])
+
+    def poll(self):
+        """
+        Poll every tracked user once and report what changed.
+
+        :return: The changes since the previous poll.
+        :rtype: list of PresenceEvent
+        """
+        with self._lock:
+            now = time.time()
+            # Everything is fetched before anything is applied, so a failed call loses no events.
+            chunks = _parallel_map(self._fetch_chunk, _chunks(self._steamids, UserBatch.CHUNK_SIZE), self.max_workers)
+            events = self._apply(chunks, now, self.polls == 0)
+            self.polls += 1
+
+        if self.on_event is not None:
+            for event in events:
+                self.on_event(event)
+        return events
+
+    def _apply(self, chunks, now, first_poll):
+        """
+        Compare fetched summaries against the last known state, update it in place and collect the changes.
+        """
+        events = []
+        for players in chunks:
+            for player in players:
+                index = self._index.get(int(player["steamid"]))
+                if index is None:
+                    continue
+                state = player.get("personastate", OnlineState.OFFLINE)
+                game = int(player.get("gameid") or 0)
+                self._last_logoffs[index] = player.get("lastlogoff", 0)
+                old_state = self._states[index]
+                old_game = self._games[index]
+                if state == old_state and game == old_game:
+                    self._seen[index] = 1
+                    continue
+
+                self._states[index] = state
+                self._games[index] = game
+                if first_poll is True or self._seen[index] == 0:
+                    self._seen[index] = 1
+                    continue
+
+                steamid = self._steamids[index]
+                if state != old_state:
+                    if old_state == OnlineState.OFFLINE:
+                        kind = PresenceChange.CAME_ONLINE
+                    elif state == OnlineState.OFFLINE:
+                        kind = PresenceChange.WENT_OFFLINE
+                    else:
+                        kind = PresenceChange.STATE_CHANGED
+                    events += [PresenceEvent(kind, steamid, old_state, state, now)]
+                if game != old_game:
+                    if old_game != 0 and game == 0:
+                        kind = PresenceChange.STOPPED_GAME
+                    else:
+                        kind = PresenceChange.STARTED_GAME
+                    events += [PresenceEvent(kind, steamid, old_game, game, now)]
+        return events
+
+    # BACKGROUND THREAD
+    def start(self):
+        """
+        Start polling in a background (daemon) thread.
+        """
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """
+        Stop the background thread, waiting for the poll in progress to finish.
+        """
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            started = time.time()
+            try:
+                self.poll()
+            except Exception:
+                # Nothing was applied; the next poll picks up the changes.
+                pass
+            # Keep a steady pace, and jitter it so several trackers don't poll in lock-step.
+            delay = self.interval * random.uniform(0.95, 1.05) - (time.time() - started)
+            self._stop.wait(max(0.0, delay))
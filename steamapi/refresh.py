@@ -0,0 +1,276 @@
+__author__ = 'SmileyBarry'
+
+import collections
+import random
+import threading
+import time
+
+from .app import APP_INFO_FILTERS, SteamApp, _check_filter_groups
+from .core import _parallel_map
+from .decorators import HOUR
+from .user import SteamUser, UserBatch
+
+
+class RefreshScheduler(object):
+    """
+    Keeps the cached data of a watch list of users and apps fresh in the background, so readers find it
+    already cached instead of refetching it on their own thread once it expires::
+
+        scheduler = RefreshScheduler(max_calls=120, period=60)
+        scheduler.watch_users(users)
+        scheduler.watch_apps(apps)
+        scheduler.start()
+
+    Every "interval" seconds, it refreshes the fields that are within "lead" (a fraction of their TTL) of
+    expiring. Summaries are refreshed 100 users per "GetPlayerSummaries" call, and prices many apps per
+    "appdetails" call; badges, and other store details, take one call per user or app. Calls are capped at
+    "max_calls" per "period", most overdue first, and each watched object's refreshes are shifted by a
+    random part of "jitter", so objects loaded together don't all expire (and get refreshed) together.
+
+    The scheduler refreshes the caches of the objects it's given. Pass the objects your code reads from, or
+    enable the identity map (see "cache.enable_identity_map") so every object for the same ID shares them.
+    """
+    # User field -> the cached property it keeps fresh. "summary" and "currently_playing" are both
+    # refreshed with batched "GetPlayerSummaries" calls.
+    USER_FIELDS = {"summary": SteamUser._summary,
+                   "currently_playing": SteamUser.currently_playing,
+                   "badges": SteamUser._badges}
+
+    def __init__(self, user_fields=("summary", "currently_playing"), app_groups=APP_INFO_FILTERS,
+                 app_ttl=6 * HOUR, max_calls=60, period=60, lead=0.1, jitter=0.1, interval=10, max_workers=4):
+        """
+        :param user_fields: What to keep fresh for watched users, out of USER_FIELDS.
+        :type user_fields: tuple of str
+        :param app_groups: Which store detail filter groups to keep fresh for watched apps.
+        :type app_groups: tuple of str
+        :param app_ttl: How often app details are refreshed, in seconds. (They never expire on their own.)
+        :type app_ttl: int
+        :param max_calls: The most calls the scheduler may make per "period".
+        :type max_calls: int
+        :param period: The budget's window, in seconds.
+        :type period: float
+        :param lead: How early to refresh, as a fraction of each field's TTL.
+        :type lead: float
+        :param jitter: Up to this fraction of each field's TTL, chosen at random per watched object, is added
+                       to "lead".
+        :type jitter: float
+        :param interval: Seconds between checks, while running in the background.
+        :type interval: float
+        :param max_workers: How many calls to make concurrently.
+        :type max_workers: int
+        :raise: ValueError on unknown fields or groups.
+        """
+        for field in user_fields:
+            if field not in self.USER_FIELDS:
+                raise ValueError("Unknown field: {field}".format(field=field))
+        _check_filter_groups(app_groups)
+        self.user_fields = tuple(user_fields)
+        self.app_groups = tuple(app_groups)
+        self.app_ttl = app_ttl
+        self.max_calls = max_calls
+        self.period = period
+        self.lead = lead
+        self.jitter = jitter
+        self.interval = interval
+        self.max_workers = max_workers
+
+        # ID -> (object, random offset in [0, 1)), for the watched users and apps.
+        self._users = collections.OrderedDict()
+        self._apps = collections.OrderedDict()
+        self._calls = collections.deque()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.refreshes = 0
+        self.deferred = 0
+
+    # WATCH LIST
+    def watch_users(self, users):
+        """
+        :type users: list of int, str or SteamUser
+        :return: The watched SteamUser objects, in order.
+        :rtype: list of SteamUser
+        """
+        watched = []
+        with self._lock:
+            for user in users:
+                if not isinstance(user, SteamUser):
+                    user = SteamUser(user)
+                key = str(user.steamid)
+                if key not in self._users:
+                    self._users[key] = (user, random.random())
+                watched += [self._users[key][0]]
+        return watched
+
+    def unwatch_users(self, users):
+        with self._lock:
+            for user in users:
+                self._users.pop(str(getattr(user, "steamid", user)), None)
+
+    def watch_apps(self, apps):
+        """
+        :type apps: list of int, str or SteamApp
+        :return: The watched SteamApp objects, in order.
+        :rtype: list of SteamApp
+        """
+        watched = []
+        with self._lock:
+            for app in apps:
+                if not isinstance(app, SteamApp):
+                    app = SteamApp(app)
+                key = str(app.appid)
+                if key not in self._apps:
+                    self._apps[key] = (app, random.random())
+                watched += [self._apps[key][0]]
+        return watched
+
+    def unwatch_apps(self, apps):
+        with self._lock:
+            for app in apps:
+                self._apps.pop(str(getattr(app, "appid", app)), None)
+
+    # SCHEDULING
+    def _due_at(self, inst, prop, ttl, offset):
+        """
+        :return: When a field should be refreshed, in seconds since the epoch. Zero if it was never loaded.
+        :rtype: float
+        """
+        last_updated = prop.last_updated(inst)
+        if last_updated is None:
+            return 0.0
+        return last_updated + ttl * (1 - self.lead - self.jitter * offset)
+
+    def _remaining_budget(self, now):
+        with self._lock:
+            while len(self._calls) > 0 and self._calls[0] <= now - self.period:
+                self._calls.popleft()
+            return self.max_calls - len(self._calls)
+
+    def _spend(self, calls):
+        now = time.time()
+        with self._lock:
+            self._calls.extend([now] * calls)
+
+    def run_once(self):
+        """
+        Refresh whatever is due now, within the budget. Called periodically by the background thread, but
+        can also be called directly, e.g. from your own scheduler.
+
+        :return: How many calls were made.
+        :rtype: int
+        """
+        now = time.time()
+        with self._lock:
+            users = list(self._users.values())
+            apps = list(self._apps.values())
+
+        # (due time, kind, object), for everything due, most overdue first.
+        due = []
+        for user, offset in users:
+            summary_due = None
+            for field in self.user_fields:
+                prop = self.USER_FIELDS[field]
+                due_at = self._due_at(user, prop, prop.ttl, offset)
+                if due_at > now:
+                    continue
+                if field == "badges":
+                    due += [(due_at, "badges", user)]
+                else:
+                    summary_due = due_at if summary_due is None else min(summary_due, due_at)
+            if summary_due is not None:
+                due += [(summary_due, "summary", user)]
+        for app, offset in apps:
+            due_at = min(self._due_at(app, getattr(SteamApp, "_details_" + group), self.app_ttl, offset)
+                         for group in self.app_groups) if len(self.app_groups) > 0 else now + 1
+            if due_at <= now:
+                due += [(due_at, "app", app)]
+        batch_sizes = {"summary": UserBatch.CHUNK_SIZE,
+                       "badges": 1,
+                       "app": SteamApp._appdetails_batch_size(self.app_groups)}
+        # Most overdue first, and on ties, whatever refreshes the most objects per call.
+        due.sort(key=lambda item: (item[0], -batch_sizes[item[1]]))
+
+        # Take the items that fit in the budget.
+        budget = self._remaining_budget(now)
+        selected = {"summary": [], "badges": [], "app": []}
+        calls = 0
+        for due_at, kind, inst in due:
+            items = selected[kind]
+            # A new call is needed whenever the kind's current batch is full.
+            extra_call = 1 if len(items) % batch_sizes[kind] == 0 else 0
+            if calls + extra_call > budget:
+                self.deferred += 1
+                continue
+            calls += extra_call
+            items += [inst]
+
+        # Every call is charged as it's made, not once they all succeed: while Steam is refusing calls, the
+        # ones that failed count against the budget too. A batch the store rejects costs more calls than
+        # planned, and those count as well.
+        made = []
+
+        def spend():
+            # list.append is atomic, so worker threads can all count here.
+            made.append(1)
+            self._spend(1)
+
+        if len(selected["summary"]) > 0:
+            self._refresh_summaries(selected["summary"], spend)
+        if len(selected["app"]) > 0:
+            SteamApp._load_many(selected["app"], self.app_groups, self.max_workers, True, on_call=spend)
+        if len(selected["badges"]) > 0:
+            self._refresh_badges(selected["badges"], spend)
+        self.refreshes += sum(len(items) for items in selected.values())
+        return len(made)
+
+    def _refresh_summaries(self, users, on_call):
+        batch = UserBatch(users)
+
+        def load_chunk(job):
+            on_call()
+            batch._load_chunk(job)
+
+        _parallel_map(load_chunk, batch._jobs(("summary",), refresh=True), self.max_workers)
+        if "currently_playing" in self.user_fields:
+            for user in users:
+                # Recomputed from the summary just fetched, without another call.
+                SteamUser.currently_playing.prime(user, SteamUser.currently_playing.fget(user))
+
+    def _refresh_badges(self, users, on_call):
+        def refresh(user):
+            on_call()
+            SteamUser._badges.prime(user, SteamUser._badges.fget(user))
+
+        _parallel_map(refresh, users, self.max_workers)
+
+    # BACKGROUND THREAD
+    def start(self):
+        """
+        Start refreshing in a background (daemon) thread.
+        """
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """
+        Stop the background thread, waiting for the refresh in progress to finish.
+        """
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception:
+                # Whatever failed stays due, and is retried on the next check.
+                pass
+            # Jittered too, so several schedulers don't poll in lock-step.
+            self._stop.wait(self.interval * random.uniform(0.9, 1.1))
@@ -0,0 +1,133 @@
+__author__ = 'SmileyBarry'
+
+import email.utils
+import random
+import time
+
+import requests.exceptions
+
+from . import errors
+
+# Transport errors that guarantee the request never reached the server, so repeating it is always safe.
+# "requests" before 2.4 has no ConnectTimeout. It reports failed connections as ConnectionError, the same
+# as connections reset after the request went out, so none of its errors qualify.
+NOT_SENT_ERRORS = (requests.exceptions.ConnectTimeout,) if hasattr(requests.exceptions, "ConnectTimeout") else ()
+
+
+def register_not_sent_errors(*error_classes):
+    """
+    Mark more transport error classes as "the request never reached the server". (E.g.: for other
+    HTTP clients, like the asyncio one.)
+    """
+    global NOT_SENT_ERRORS
+    NOT_SENT_ERRORS += tuple(error_classes)
+
+
+def parse_retry_after(value):
+    """
+    Parse a "Retry-After" header, which is either a number of seconds or an HTTP date.
+
+    :type value: str or None
+    :return: How long to wait, in seconds, or None if the header is missing or malformed.
+    :rtype: float or None
+    """
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    parsed = email.utils.parsedate_tz(value)
+    if parsed is None:
+        return None
+    return max(0.0, email.utils.mktime_tz(parsed) - time.time())
+
+
+class RetryPolicy(object):
+    """
+    Decides whether, and after how long, a failed call is retried. Plugged into the API connections
+    through the "retry_policy" setting.
+
+    Each error class gets its own retry budget. The wait between attempts grows exponentially from
+    "backoff" up to "max_backoff", with "full jitter" (a random wait between zero and that bound) so
+    that many clients failing at once don't retry in lock-step. A "Retry-After" header, when the API
+    sends one, takes precedence. No retry is scheduled past the overall "deadline".
+
+    POST calls aren't assumed to be idempotent: they are only retried when the server certainly didn't
+    process them (a 429, or a connection that was never established), unless "retry_post" is set.
+    """
+    # Error class -> how many times to retry it. The first matching class, in order, applies.
+    DEFAULT_RETRIES = ((errors.APIThrottled, 5),
+                       (errors.APIError, 3),
+                       (errors.APIException, 0))
+
+    def __init__(self, retries=None, network_retries=3, backoff=0.5, max_backoff=30.0, jitter=True,
+                 deadline=60.0, retry_post=False):
+        """
+        :param retries: (error class, retry count) pairs, checked before DEFAULT_RETRIES.
+        :type retries: tuple
+        :param network_retries: How many times to retry transport errors (timeouts, dropped connections).
+        :type network_retries: int
+        :param backoff: The base wait, in seconds, doubled on every attempt.
+        :type backoff: float
+        :param max_backoff: The longest wait between two attempts, in seconds.
+        :type max_backoff: float
+        :param jitter: Whether to randomise waits.
+        :type jitter: bool
+        :param deadline: The longest a call may take, in seconds, retries included. None means no limit.
+        :type deadline: float or None
+        :param retry_post: Whether POST calls are safe to repeat.
+        :type retry_post: bool
+        """
+        self.retries = tuple(retries or ()) + self.DEFAULT_RETRIES
+        self.network_retries = network_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.deadline = deadline
+        self.retry_post = retry_post
+        self.total_retries = 0
+
+    def max_retries(self, exception):
+        """
+        :rtype: int
+        """
+        if not isinstance(exception, errors.APIException):
+            return self.network_retries
+        for error_class, max_retries in self.retries:
+            if isinstance(exception, error_class):
+                return max_retries
+        return 0
+
+    def is_safe_to_repeat(self, method, exception):
+        """
+        :rtype: bool
+        """
+        if method != "POST" or self.retry_post is True:
+            return True
+        return isinstance(exception, errors.APIThrottled) or isinstance(exception, NOT_SENT_ERRORS)
+
+    def next_delay(self, attempt, exception, method, elapsed):
+        """
+        :param attempt: How many retries this call already had.
+        :type attempt: int
+        :param exception: Why the last attempt failed: an APIException, or a transport error.
+        :param method: The call's HTTP method.
+        :param elapsed: Seconds since the call's first attempt.
+        :return: How long to wait before retrying, or None to give up.
+        :rtype: float or None
+        """
+        if attempt >= self.max_retries(exception) or not self.is_safe_to_repeat(method, exception):
+            return None
+
+        delay = min(self.max_backoff, self.backoff * (2 ** attempt))
+        if self.jitter is True:
+            delay = random.uniform(0, delay)
+        retry_after = getattr(exception, "retry_after", None)
+        if retry_after is not None:
+            delay = retry_after
+
+        if self.deadline is not None and elapsed + delay > self.deadline:
+            return None
+        self.total_retries += 1
+        return delay
@@ -0,0 +1,303 @@
+__author__ = 'SmileyBarry'
+
+import threading
+import time
+
+from . import errors
+
+
+class TokenBucket(object):
+    """
+    A classic token bucket: refills at "rate" tokens per second, holds up to "burst" tokens, and every
+    call takes one.
+    """
+    def __init__(self, rate, burst=None):
+        """
+        :param rate: Calls allowed per second, on average.
+        :type rate: float
+        :param burst: How many calls may go out back-to-back after an idle period. (Default: "rate")
+        :type burst: float
+        """
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(rate, 1))
+        self._tokens = self.burst
+        self._last_refill = time.time()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """
+        Take a token, possibly one that hasn't been refilled yet.
+
+        :return: How long the caller must wait, in seconds, before using the token.
+        :rtype: float
+        """
+        with self._lock:
+            now = time.time()
+            self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate)
+            self._last_refill = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+
+class RateLimiter(object):
+    """
+    Client-side pacing for API calls, plugged into the API connections through the "rate_limiter"
+    setting. Every call takes a token from its API key's bucket and, if its interface has its own limit,
+    from that interface's bucket as well, waiting until both allow it.
+
+    Store calls have no key and are only limited if STORE_INTERFACE ("store") has a limit.
+    """
+    def __init__(self, rate=None, burst=None, key_rates=None, interface_rates=None):
+        """
+        :param rate: Calls per second allowed for each API key. (Default: None, unlimited)
+        :type rate: float
+        :param burst: Bucket size for every bucket. (Default: each bucket's rate)
+        :type burst: float
+        :param key_rates: Per-key overrides of "rate", by API key.
+        :type key_rates: dict
+        :param interface_rates: Calls per second allowed for each listed interface, across all keys.
+                                (E.g.: {"ISteamUserStats": 5})
+        :type interface_rates: dict
+        """
+        self.rate = rate
+        self.burst = burst
+        self.key_rates = key_rates or {}
+        self.interface_rates = interface_rates or {}
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self.throttled_calls = 0
+        self.throttled_time = 0.0
+
+    def _bucket(self, name, rate):
+        with self._lock:
+            if name not in self._buckets:
+                self._buckets[name] = TokenBucket(rate, self.burst)
+            return self._buckets[name]
+
+    def reserve(self, api_key, interface):
+        """
+        Take this call's tokens without waiting.
+
+        :return: How long the caller must wait, in seconds, before sending the call.
+        :rtype: float
+        """
+        delay = 0.0
+        if api_key is not None:
+            rate = self.key_rates.get(api_key, self.rate)
+            if rate is not None:
+                delay = max(delay, self._bucket(("key", api_key), rate).reserve())
+        if interface in self.interface_rates:
+            delay = max(delay, self._bucket(("interface", interface), self.interface_rates[interface]).reserve())
+        if delay > 0:
+            with self._lock:
+                self.throttled_calls += 1
+                self.throttled_time += delay
+        return delay
+
+    def acquire(self, api_key, interface):
+        """
+        Block until this call may be sent.
+        """
+        delay = self.reserve(api_key, interface)
+        if delay > 0:
+            time.sleep(delay)
+
+    @property
+    def stats(self):
+        """
+        :return: How many calls were held back, and for how long in total, in seconds.
+        :rtype: dict
+        """
+        return {"throttled_calls": self.throttled_calls,
+                "throttled_time": self.throttled_time}
+
+
+class AIMDLimiter(object):
+    """
+    An adaptive concurrency limit, plugged into the API connections through the "concurrency_limiter"
+    setting. The limit grows additively while calls succeed (about one more slot per round of
+    successful calls), and is cut multiplicatively whenever the API answers with a 429 or a 5xx, or a
+    call fails outright.
+    """
+    def __init__(self, initial=10, minimum=1, maximum=100, increase=1.0, decrease=0.5):
+        """
+        :param initial: The starting number of calls allowed in flight.
+        :param minimum: The limit never goes below this.
+        :param maximum: The limit never goes above this.
+        :param increase: How much the limit grows over one limit's worth of successful calls.
+        :param decrease: What the limit is multiplied by on a backoff.
+        """
+        self.minimum = minimum
+        self.maximum = maximum
+        self.increase = float(increase)
+        self.decrease = float(decrease)
+        self._limit = float(initial)
+        self._in_flight = 0
+        self._condition = threading.Condition()
+        self.backoffs = 0
+        self.throttled_time = 0.0
+
+    @property
+    def limit(self):
+        """
+        :rtype: int
+        """
+        return max(self.minimum, int(self._limit))
+
+    def acquire(self):
+        """
+        Block until a slot is free, and take it.
+        """
+        with self._condition:
+            if self._in_flight >= self.limit:
+                started = time.time()
+                while self._in_flight >= self.limit:
+                    self._condition.wait()
+                self.throttled_time += time.time() - started
+            self._in_flight += 1
+
+    def release(self, success):
+        """
+        Give a slot back and adjust the limit.
+
+        :param success: False if the call was throttled, failed with a 5xx or didn't complete.
+        :type success: bool
+        """
+        with self._condition:
+            self._in_flight -= 1
+            if success is True:
+                self._limit = min(self.maximum, self._limit + self.increase / self._limit)
+            else:
+                self._limit = max(self.minimum, self._limit * self.decrease)
+                self.backoffs += 1
+            self._condition.notify_all()
+
+    @property
+    def stats(self):
+        """
+        :rtype: dict
+        """
+        return {"limit": self.limit,
+                "in_flight": self._in_flight,
+                "backoffs": self.backoffs,
+                "throttled_time": self.throttled_time}
+
+
+class KeyPool(object):
+    """
+    A pool of Steam Web API keys that calls are spread across, for when one key's daily quota isn't
+    enough. Give it to APIConnection in place of a single key::
+
+        APIConnection(api_key=KeyPool(["KEY1", "KEY2"], strategy=KeyPool.LEAST_USED))
+
+    (A plain list of keys works too, with the default options.)
+
+    Each key's calls are counted per UTC day. A key that reaches "daily_quota", or that the API answers
+    with a 429, is taken out of rotation until the next day or until its cooldown ends. When no key is
+    available, calls fail with APIThrottled, with "retry_after" set to when the next key frees up.
+    """
+    ROUND_ROBIN = "round_robin"
+    LEAST_USED = "least_used"
+
+    def __init__(self, keys, strategy=ROUND_ROBIN, daily_quota=100000, cooldown=60):
+        """
+        :param keys: The API keys.
+        :type keys: list of str
+        :param strategy: ROUND_ROBIN or LEAST_USED (fewest calls today).
+        :type strategy: str
+        :param daily_quota: Calls allowed per key per UTC day.
+        :type daily_quota: int
+        :param cooldown: Seconds a key rests after a 429 without a "Retry-After" header.
+        :type cooldown: float
+        """
+        if len(keys) == 0:
+            raise ValueError("A key pool needs at least one key.")
+        self.keys = list(keys)
+        self.strategy = strategy
+        self.daily_quota = daily_quota
+        self.cooldown = cooldown
+        self._calls = dict((key, 0) for key in self.keys)
+        self._throttled = dict((key, 0) for key in self.keys)
+        self._cooldown_until = dict((key, 0.0) for key in self.keys)
+        self._day = self._today()
+        self._next_index = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _today():
+        return int(time.time() // 86400)
+
+    def _roll_over(self):
+        today = self._today()
+        if today != self._day:
+            self._day = today
+            for key in self.keys:
+                self._calls[key] = 0
+
+    def _is_available(self, key, now):
+        return self._calls[key] < self.daily_quota and self._cooldown_until[key] <= now
+
+    def acquire(self):
+        """
+        Pick the key for the next call, and count the call against it.
+
+        :rtype: str
+        :raise: APIThrottled if every key is exhausted or cooling down.
+        """
+        with self._lock:
+            self._roll_over()
+            now = time.time()
+            available = [key for key in self.keys if self._is_available(key, now)]
+            if len(available) == 0:
+                exception = errors.APIThrottled()
+                exception.retry_after = self._time_until_available(now)
+                raise exception
+
+            if self.strategy == KeyPool.LEAST_USED:
+                key = min(available, key=lambda candidate: self._calls[candidate])
+            else:
+                # Walk the ring from where we left off, skipping unavailable keys.
+                for offset in range(len(self.keys)):
+                    key = self.keys[(self._next_index + offset) % len(self.keys)]
+                    if key in available:
+                        self._next_index = (self._next_index + offset + 1) % len(self.keys)
+                        break
+            self._calls[key] += 1
+            return key
+
+    def _time_until_available(self, now):
+        next_day = (self._day + 1) * 86400 - now
+        waits = []
+        for key in self.keys:
+            if self._calls[key] < self.daily_quota:
+                waits += [self._cooldown_until[key] - now]
+            else:
+                waits += [max(next_day, self._cooldown_until[key] - now)]
+        return max(0.0, min(waits))
+
+    def record(self, key, status_code, retry_after=None):
+        """
+        Report how a call made with "key" went.
+        """
+        if status_code != 429:
+            return
+        with self._lock:
+            if key in self._throttled:
+                self._throttled[key] += 1
+                rest = retry_after if retry_after is not None else self.cooldown
+                self._cooldown_until[key] = max(self._cooldown_until[key], time.time() + rest)
+
+    @property
+    def usage(self):
+        """
+        :return: For each key: calls made today, 429s received, and whether it's currently in rotation.
+        :rtype: dict
+        """
+        with self._lock:
+            self._roll_over()
+            now = time.time()
+            return dict((key, {"calls_today": self._calls[key],
+                               "throttled": self._throttled[key],
+                               "available": self._is_available(key, now)}) for key in self.keys)
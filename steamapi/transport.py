@@ -0,0 +1,300 @@
+__author__ = 'SmileyBarry'
+
+import base64
+import gzip
+import hashlib
+import io
+import json
+import os
+import random
+import threading
+import time
+
+import requests
+import requests.adapters
+import requests.models
+import requests.structures
+
+from . import errors
+
+try:
+    from urllib.parse import urlparse
+except ImportError:
+    from urlparse import urlparse
+
+
+class Transport(object):
+    """
+    Sends the API connections' HTTP requests. Plugged into the connections through the "transport"
+    setting; by default, each connection uses its own HTTPTransport.
+
+    Subclasses implement "send".
+    """
+    def send(self, method, url, params, timeout=None, stream=False):
+        """
+        :param method: "GET" or "POST".
+        :param url: The call's URL, without a query string.
+        :param params: The call's parameters. Sent in the query string for GET, or as a form for POST.
+        :type params: dict
+        :param timeout: Seconds to wait, or a (connect, read) tuple.
+        :param stream: Whether the body may be read incrementally from "raw" instead of "content".
+        :rtype: requests.Response
+        """
+        raise NotImplementedError()
+
+    @property
+    def pool_stats(self):
+        """
+        :rtype: dict
+        """
+        return {"requests": 0, "hits": 0, "misses": 0}
+
+
+class HTTPTransport(Transport):
+    """
+    The live transport: one pooled, keep-alive "requests" session, so repeated calls to the same host reuse an
+    open TCP connection instead of paying for a new handshake each time.
+    """
+    def __init__(self, pool_connections=requests.adapters.DEFAULT_POOLSIZE,
+                 pool_maxsize=requests.adapters.DEFAULT_POOLSIZE, pool_block=requests.adapters.DEFAULT_POOLBLOCK,
+                 keep_alive=True):
+        """
+        See "core._PooledConnection._configure_session" for the options.
+        """
+        self._session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_connections,
+                                                pool_maxsize=pool_maxsize,
+                                                pool_block=pool_block)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        if keep_alive is False:
+            self._session.headers["Connection"] = "close"
+
+    def send(self, method, url, params, timeout=None, stream=False):
+        if method == "POST":
+            return self._session.request(method, url, data=params, timeout=timeout, stream=stream)
+        else:
+            return self._session.request(method, url, params=params, timeout=timeout, stream=stream)
+
+    @property
+    def pool_stats(self):
+        """
+        Connection pool usage, summed across every host this transport has talked to. A "hit" is a request
+        that reused an already-open connection, a "miss" is one that had to open a new one.
+
+        :rtype: dict
+        """
+        requests_sent = 0
+        connections_opened = 0
+        for adapter in set(self._session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for pool_key in pools.keys():
+                pool = pools.get(pool_key)
+                if pool is None:
+                    continue
+                requests_sent += pool.num_requests
+                connections_opened += pool.num_connections
+        return {"requests": requests_sent,
+                "hits": requests_sent - connections_opened,
+                "misses": connections_opened}
+
+
+def _canonical_query(params, ignored=()):
+    """
+    Normalise a call's parameters into a query string that's the same however they were ordered, e.g. to
+    key caches and recordings with.
+
+    :param ignored: Parameter names to leave out.
+    :rtype: str
+    """
+    return "&".join("{name}={value}".format(name=name, value=params[name])
+                    for name in sorted(params) if name not in ignored)
+
+
+def _replace_file(source, target):
+    """
+    Move a file over another one in one step, so readers see either the old file or the new one, never
+    neither.
+    """
+    if hasattr(os, "replace"):
+        os.replace(source, target)
+        return
+    try:
+        # Python 2: "rename" replaces an existing target, atomically, on POSIX...
+        os.rename(source, target)
+    except OSError:
+        # ...but not on Windows, where the target has to go first.
+        if not os.path.exists(target):
+            raise
+        os.remove(target)
+        os.rename(source, target)
+
+
+def _make_response(url, status_code, headers, body):
+    """
+    Build a "requests" response around a body that's already in memory. Its "raw" stream reads the same body.
+
+    :type body: bytes
+    :rtype: requests.Response
+    """
+    response = requests.models.Response()
+    response.url = url
+    response.status_code = status_code
+    response.headers = requests.structures.CaseInsensitiveDict(headers)
+    response.encoding = "utf-8"
+    response._content = body
+    response.raw = io.BytesIO(body)
+    return response
+
+
+class Cassette(object):
+    """
+    A directory of recorded responses, one gzip-compressed JSON file per distinct request. Requests are keyed
+    by method, URL path and parameters, so recordings replay against any host. The API key is never part of
+    the key, nor stored.
+    """
+    # Parameters left out of keys and recordings.
+    IGNORED_PARAMETERS = ("key",)
+    # Response headers kept in recordings.
+    RECORDED_HEADERS = ("Content-Type", "Retry-After")
+
+    def __init__(self, path):
+        """
+        :param path: The cassette's directory. Created on the first recording if it doesn't exist.
+        :type path: str
+        """
+        self.path = path
+
+    def key(self, method, url, params):
+        """
+        :rtype: str
+        """
+        request = "{method} {path}?{query}".format(method=method,
+                                                   path=urlparse(url).path,
+                                                   query=_canonical_query(params, self.IGNORED_PARAMETERS))
+        return hashlib.sha1(request.encode("utf-8")).hexdigest()
+
+    def _file_for(self, key):
+        return os.path.join(self.path, key + ".json.gz")
+
+    def load(self, key):
+        """
+        :return: The recording for a key, or None if there isn't one.
+        :rtype: dict or None
+        """
+        path = self._file_for(key)
+        if not os.path.exists(path):
+            return None
+        with gzip.open(path, "rb") as recording_file:
+            recording = json.loads(recording_file.read().decode("utf-8"))
+        recording["body"] = base64.b64decode(recording["body"])
+        return recording
+
+    def save(self, key, method, url, params, response, elapsed):
+        """
+        Record a response. Written to a temporary file first, so concurrent readers never see half a recording.
+
+        :type response: requests.Response
+        :param elapsed: How long the request took, in seconds.
+        """
+        if not os.path.isdir(self.path):
+            try:
+                os.makedirs(self.path)
+            except OSError:
+                # Another thread got there first.
+                if not os.path.isdir(self.path):
+                    raise
+        recording = {"method": method,
+                     "path": urlparse(url).path,
+                     "params": dict((name, str(value)) for name, value in params.items()
+                                    if name not in self.IGNORED_PARAMETERS),
+                     "status_code": response.status_code,
+                     "headers": dict((name, response.headers[name]) for name in self.RECORDED_HEADERS
+                                     if name in response.headers),
+                     "elapsed": elapsed,
+                     "body": base64.b64encode(response.content).decode("ascii")}
+        path = self._file_for(key)
+        temporary_path = "{path}.{thread}.tmp".format(path=path, thread=threading.current_thread().ident)
+        with gzip.open(temporary_path, "wb") as recording_file:
+            recording_file.write(json.dumps(recording).encode("utf-8"))
+        _replace_file(temporary_path, path)
+
+
+class RecordingTransport(Transport):
+    """
+    Sends requests through another transport (live HTTP by default) and records every response to a
+    cassette, for ReplayTransport to play back later::
+
+        recorder = RecordingTransport("cassettes/friends")
+        APIConnection(api_key="...", settings={"transport": recorder})
+        StoreAPIConnection(settings={"transport": recorder})
+
+    Throttled (429) and server error (5xx) responses aren't recorded, so a retried call keeps the answer
+    that eventually went through.
+    """
+    def __init__(self, path, transport=None):
+        """
+        :param path: The cassette's directory.
+        :type path: str
+        :param transport: The transport that actually sends requests. (Default: a new HTTPTransport)
+        :type transport: Transport
+        """
+        self.cassette = Cassette(path)
+        self.transport = transport if transport is not None else HTTPTransport()
+
+    def send(self, method, url, params, timeout=None, stream=False):
+        started = time.time()
+        # Always read in full, since the body has to be recorded.
+        response = self.transport.send(method, url, params, timeout)
+        elapsed = time.time() - started
+        if response.status_code != 429 and response.status_code < 500:
+            self.cassette.save(self.cassette.key(method, url, params), method, url, params, response, elapsed)
+        if stream is True:
+            return _make_response(response.url, response.status_code, response.headers, response.content)
+        return response
+
+    @property
+    def pool_stats(self):
+        return self.transport.pool_stats
+
+
+class ReplayTransport(Transport):
+    """
+    Answers requests from a cassette made by RecordingTransport, without touching the network. Calls that
+    weren't recorded fail with APIRecordingNotFound.
+    """
+    # Pass as "latency" to sleep for as long as each request took when it was recorded.
+    RECORDED = "recorded"
+
+    def __init__(self, path, latency=None, jitter=0.0):
+        """
+        :param path: The cassette's directory.
+        :type path: str
+        :param latency: Seconds to sleep before every response, to simulate the network, or RECORDED.
+                        (Default: None, answer right away)
+        :type latency: float, str or None
+        :param jitter: Up to this many more seconds, chosen at random per response.
+        :type jitter: float
+        """
+        self.cassette = Cassette(path)
+        self.latency = latency
+        self.jitter = jitter
+        self.replayed = 0
+
+    def send(self, method, url, params, timeout=None, stream=False):
+        recording = self.cassette.load(self.cassette.key(method, url, params))
+        if recording is None:
+            raise errors.APIRecordingNotFound("No recording of {method} {url}".format(method=method, url=url))
+
+        delay = 0.0
+        if self.latency == ReplayTransport.RECORDED:
+            delay = recording["elapsed"]
+        elif self.latency is not None:
+            delay = self.latency
+        if self.jitter > 0:
+            delay += random.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+        self.replayed += 1
+        return _make_response(url, recording["status_code"], recording["headers"], recording["body"])
@@ -1,11 +1,22 @@
 __author__ = 'SmileyBarry'
 
-from .core import APIConnection, SteamObject
+from .core import APIConnection, SteamObject, _chunks, _parallel_map
 
-from .app import SteamApp
+from .app import SteamApp, SteamAchievementSnapshot
+from .cache import shared_cache
+from . import vanity
 from .decorators import cached_property, INFINITE, MINUTE, HOUR
 
+import collections
 import datetime
+import threading
+
+# Lightweight records yielded by the "SteamUser.iter_*" generators. They hold the raw API values.
+GameRecord = collections.namedtuple("GameRecord", ("appid", "name", "playtime_forever", "playtime_2weeks"))
+FriendRecord = collections.namedtuple("FriendRecord", ("steamid", "relationship", "friend_since"))
+GroupRecord = collections.namedtuple("GroupRecord", ("gid",))
+BadgeRecord = collections.namedtuple("BadgeRecord", ("badgeid", "level", "completion_time", "xp", "scarcity",
+                                                     "appid"))
 
 class SteamUserBadge(SteamObject):
     def __init__(self, badge_id, level, completion_time, xp, scarcity, appid=None):
@@ -98,15 +109,19 @@ class SteamUser(SteamObject):
         if userid is None and userurl is None:
             raise ValueError("One of the arguments must be supplied.")
 
-        if userurl is not None:
-            response = APIConnection().call("ISteamUser", "ResolveVanityURL", "v0001", vanityurl=userurl)
-            userid = response.steamid
+        if userid is None:
+            # Resolved on first use (see "steamid"), so creating users never touches the network.
+            found, userid = vanity.default_resolver().lookup(userurl)
+            if found is False or userid is None:
+                self._userurl = userurl
+                self._resolve_lock = threading.Lock()
+                return
 
-        if userid is not None:
-            self._id = userid
+        self._id = userid
+        self._cache = shared_cache("user", userid)
 
     def __eq__(self, other):
-        if type(other) is SteamUser:
+        if isinstance(other, SteamUser):
             if self.steamid == other.steamid:
                 return True
             else:
@@ -118,8 +133,11 @@ class SteamUser(SteamObject):
         return self.name
 
     # PRIVATE UTILITIES
-    @staticmethod
-    def _convert_games_list(raw_list):
+    # The class used for apps this user's properties return. Subclasses may swap it for their own.
+    _app_class = SteamApp
+
+    @classmethod
+    def _convert_games_list(cls, raw_list):
         """
         Convert a raw, APIResponse-formatted list of games into full SteamApp objects.
         :type raw_list: list of APIResponse
@@ -127,7 +145,7 @@ class SteamUser(SteamObject):
         """
         games_list = []
         for game in raw_list:
-            game_obj = SteamApp(game.appid, game.name)
+            game_obj = cls._app_class(game.appid, game.name)
             if 'playtime_2weeks' in game:
                 game_obj.playtime_2weeks = game.playtime_2weeks
             if 'playtime_forever' in game:
@@ -135,7 +153,7 @@ class SteamUser(SteamObject):
             games_list += [game_obj]
         return games_list
 
-    @cached_property(ttl=2 * HOUR)
+    @cached_property(ttl=2 * HOUR, stale_ttl=1 * HOUR)
     def _summary(self):
         """
         :rtype: APIResponse
@@ -149,21 +167,170 @@ class SteamUser(SteamObject):
         """
         return APIConnection().call("ISteamUser", "GetPlayerBans", "v1", steamids=self.steamid).players[0]
 
-    @cached_property(ttl=30 * MINUTE)
+    @cached_property(ttl=30 * MINUTE, stale_ttl=30 * MINUTE)
     def _badges(self):
         """
         :rtype: APIResponse
         """
         return APIConnection().call("IPlayerService", "GetBadges", "v1", steamid=self.steamid)
 
+    # PUBLIC UTILITIES
+    @classmethod
+    def load_many(cls, users, fields=("summary", "bans"), max_workers=4):
+        """
+        Create (or reuse) many users at once and fill their caches with a handful of batched calls,
+        instead of one call per user and field. See "UserBatch".
+
+        :param users: SteamIDs and/or SteamUser objects. Duplicates are only fetched once.
+        :type users: list of int, str or SteamUser
+        :param fields: Which cached data to load. Any of "summary" and "bans".
+        :type fields: tuple of str
+        :param max_workers: How many chunks to fetch concurrently.
+        :type max_workers: int
+        :rtype: list of SteamUser
+        """
+        return UserBatch(users, user_class=cls).load(fields, max_workers).users
+
+    @classmethod
+    def load_achievements(cls, users, apps, max_workers=4):
+        """
+        Fetch the achievement progress of every user in every app, concurrently. Each (user, app) pair
+        still takes one "GetPlayerAchievements" call, since the API has no batched form, but pairs with
+        a recent snapshot are skipped.
+
+        :type users: list of int, str or SteamUser
+        :type apps: list of int or SteamApp
+        :param max_workers: How many calls to run concurrently.
+        :type max_workers: int
+        :return: A map of (SteamID, app ID) to that user's achievements in that app.
+        :rtype: dict
+        """
+        pairs = []
+        for user in users:
+            if isinstance(user, SteamUser):
+                user = user.steamid
+            for app in apps:
+                if isinstance(app, SteamApp):
+                    app = app.appid
+                pairs += [(user, app)]
+
+        def load_pair(pair):
+            return SteamAchievementSnapshot.get(pair[0], pair[1]).achievements
+
+        return dict(zip(pairs, _parallel_map(load_pair, pairs, max_workers)))
+
+    def achievements(self, app):
+        """
+        This user's achievements in an app, fetched with a single call and with "is_achieved" and
+        "unlock_time" already filled in.
+
+        :type app: int or SteamApp
+        :rtype: list of SteamAchievement
+        """
+        if isinstance(app, SteamApp):
+            app = app.appid
+        return SteamAchievementSnapshot.get(self.steamid, app).achievements
+
+    def _iter_games(self, include_played_free_games):
+        for game in APIConnection().iter_items("IPlayerService",
+                                               "GetOwnedGames",
+                                               "v1",
+                                               ("response", "games"),
+                                               steamid=self.steamid,
+                                               include_appinfo=True,
+                                               include_played_free_games=include_played_free_games):
+            yield GameRecord(game["appid"],
+                             game.get("name"),
+                             game.get("playtime_forever"),
+                             game.get("playtime_2weeks"))
+
+    def iter_games(self):
+        """
+        Like "games", but streamed: yields one record per game as the response is parsed, without
+        building SteamApp objects or caching the list. Use it for very large libraries.
+
+        :rtype: generator of GameRecord
+        """
+        return self._iter_games(True)
+
+    def iter_owned_games(self):
+        """
+        Like "owned_games", but streamed. See "iter_games".
+
+        :rtype: generator of GameRecord
+        """
+        return self._iter_games(False)
+
+    def iter_friends(self):
+        """
+        Like "friends", but streamed: yields one record per friend as the response is parsed, without
+        building SteamUser objects or precaching their summaries.
+
+        :rtype: generator of FriendRecord
+        """
+        for friend in APIConnection().iter_items("ISteamUser", "GetFriendList", "v0001",
+                                                 ("friendslist", "friends"),
+                                                 steamid=self.steamid, relationship="friend"):
+            yield FriendRecord(int(friend["steamid"]), friend.get("relationship"), friend.get("friend_since"))
+
+    def iter_groups(self):
+        """
+        Like "groups", but streamed.
+
+        :rtype: generator of GroupRecord
+        """
+        for group in APIConnection().iter_items("ISteamUser", "GetUserGroupList", "v1", ("response", "groups"),
+                                                steamid=self.steamid):
+            yield GroupRecord(int(group["gid"]))
+
+    def iter_badges(self):
+        """
+        Like "badges", but streamed. "completion_time" is left as a Unix timestamp.
+
+        :rtype: generator of BadgeRecord
+        """
+        for badge in APIConnection().iter_items("IPlayerService", "GetBadges", "v1", ("response", "badges"),
+                                                steamid=self.steamid):
+            yield BadgeRecord(badge["badgeid"],
+                              badge.get("level"),
+                              badge.get("completion_time"),
+                              badge.get("xp"),
+                              badge.get("scarcity"),
+                              badge.get("appid"))
+
     # PUBLIC ATTRIBUTES
     @property
     def steamid(self):
         """
         :rtype: int
+        :raise: errors.APIUserNotFound if the user was created from a vanity name no user has.
         """
+        try:
+            return self._id
+        except AttributeError:
+            return self._resolve()
+
+    def _resolve(self):
+        with self._resolve_lock:
+            if "_id" not in self.__dict__:
+                self._join_shared_cache(vanity.resolve_or_raise(self._userurl))
         return self._id
 
+    def _join_shared_cache(self, steamid):
+        """
+        Give a user created from a vanity name its resolved ID, and switch it to the ID's shared cache.
+        Reading any cached property has already given this object a private one; whatever it holds is carried
+        over. Call with "_resolve_lock" held.
+        """
+        cache = shared_cache("user", steamid)
+        for name, entry in list(self.__dict__.get("_cache", {}).items()):
+            cache.setdefault(name, entry)
+        self._cache = cache
+        self._id = steamid
+
+    # Resolves vanity names too.
+    id = steamid
+
     @cached_property(ttl=INFINITE)
     def name(self):
         """
@@ -185,7 +352,7 @@ class SteamUser(SteamObject):
         """
         return self._summary.loccountrycode
 
-    @cached_property(ttl=10 * MINUTE)
+    @cached_property(ttl=10 * MINUTE, stale_ttl=10 * MINUTE)
     def currently_playing(self):
         """
         :rtype: SteamApp
@@ -284,30 +451,12 @@ class SteamUser(SteamObject):
         for friend in response.friendslist.friends:
             friend_obj = SteamUser(friend.steamid)
             friend_obj.friend_since = friend.friend_since
-            friend_obj._cache = {}
             friends_list += [friend_obj]
 
         # Fetching some details, like name, could take some time.
         # So, do a few combined queries for all users.
         if APIConnection().precache is True:
-            id_player_map = {friend.steamid: friend for friend in friends_list}
-            ids = id_player_map.keys()
-            CHUNK_SIZE = 35
-
-            chunks = [ids[start:start+CHUNK_SIZE] for start in range(len(ids))[::CHUNK_SIZE]]
-            # We have to encode "steamids" into one, comma-delimited list because requests
-            # just transforms it into a thousand parameters.
-            for chunk in chunks:
-                player_details = APIConnection().call("ISteamUser",
-                                                      "GetPlayerSummaries",
-                                                      "v0002",
-                                                      steamids=chunk).players
-
-                import time
-                now = time.time()
-                for player_summary in player_details:
-                    # Fill in the cache with this info.
-                    id_player_map[player_summary.steamid]._cache["_summary"] = (player_summary, now)
+            UserBatch(friends_list).load(fields=("summary",))
         return friends_list
 
     @property  # Already cached by "_badges".
@@ -385,4 +534,106 @@ class SteamUser(SteamObject):
         """
         :rtype: bool
         """
-        return self._bans.CommunityBanned
\ No newline at end of file
+        return self._bans.CommunityBanned
+
+
+class UserBatch(object):
+    """
+    A de-duplicated group of users whose summaries and bans are loaded together. The Web API accepts up
+    to 100 SteamIDs per "GetPlayerSummaries" or "GetPlayerBans" call, so loading 10,000 users takes
+    about 100 calls per field instead of 10,000.
+    """
+    CHUNK_SIZE = 100
+
+    # field name -> (interface, command, version, cached property, SteamID key in the response)
+    FIELDS = {"summary": ("ISteamUser", "GetPlayerSummaries", "v0002", SteamUser._summary, "steamid"),
+              "bans": ("ISteamUser", "GetPlayerBans", "v1", SteamUser._bans, "SteamId")}
+
+    def __init__(self, users, user_class=SteamUser):
+        """
+        :param users: SteamIDs and/or SteamUser objects. Existing objects are filled in-place.
+        :type users: list of int, str or SteamUser
+        :param user_class: The class used to create users from plain SteamIDs.
+        """
+        self._users = []
+        self._id_user_map = {}
+        for user in users:
+            if not isinstance(user, SteamUser):
+                user = user_class(user)
+            key = str(user.steamid)
+            if key not in self._id_user_map:
+                self._id_user_map[key] = user
+                self._users += [user]
+
+    @property
+    def users(self):
+        """
+        :rtype: list of SteamUser
+        """
+        return list(self._users)
+
+    def __iter__(self):
+        return iter(self._users)
+
+    def __len__(self):
+        return len(self._users)
+
+    def load(self, fields=("summary", "bans"), max_workers=4, refresh=False):
+        """
+        Fetch the requested fields for every user that doesn't already have a fresh cached copy.
+
+        :param fields: Any of "summary" and "bans".
+        :type fields: tuple of str
+        :param max_workers: How many chunks to fetch concurrently.
+        :type max_workers: int
+        :param refresh: Fetch the fields for every user, even those with a fresh cached copy.
+        :type refresh: bool
+        :return: This batch, for chaining.
+        :rtype: UserBatch
+        :raise: ValueError on unknown fields.
+        """
+        _parallel_map(self._load_chunk, self._jobs(fields, refresh), max_workers)
+        return self
+
+    def _jobs(self, fields, refresh=False):
+        """
+        :return: The calls needed to load some fields: (field, chunk of SteamIDs) pairs.
+        :rtype: list of (str, list of str)
+        :raise: ValueError on unknown fields.
+        """
+        jobs = []
+        for field in fields:
+            if field not in self.FIELDS:
+                raise ValueError("Unknown field: {field}".format(field=field))
+            prop = self.FIELDS[field][3]
+            missing = []
+            for user in self._users:
+                if refresh is True:
+                    missing += [str(user.steamid)]
+                    continue
+                try:
+                    prop.lookup(user)
+                except KeyError:
+                    missing += [str(user.steamid)]
+            jobs += [(field, chunk) for chunk in _chunks(missing, self.CHUNK_SIZE)]
+        return jobs
+
+    def _load_chunk(self, job):
+        field, chunk = job
+        interface, command, version = self.FIELDS[field][:3]
+        # "steamids" is encoded into one, comma-delimited list by APIConnection.call.
+        self._prime(field, APIConnection().call(interface, command, version, steamids=chunk))
+
+    def _prime(self, field, response):
+        """
+        Fill in the users' caches from one chunk's response.
+        """
+        prop, id_key = self.FIELDS[field][3:]
+        for player in response.players:
+            # Fill in the cache with this info.
+            prop.prime(self._id_user_map[str(player[id_key])], player)
+
+
+# Stale summaries read together (e.g. across a friend list) are refreshed in the background 100 users per
+# call, rather than one call each.
+SteamUser._summary.refresh_many = lambda users: UserBatch(users).load(fields=("summary",))
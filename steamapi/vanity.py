@@ -0,0 +1,273 @@
+__author__ = 'SmileyBarry'
+
+import collections
+import threading
+import time
+
+from . import errors
+from .cache import _SQLiteConnections
+from .core import APIConnection, _chunks, _parallel_map
+from .decorators import HOUR
+
+# "ResolveVanityURL"'s "success" value for names no user has.
+NO_MATCH = 42
+
+# The most names to look up in one SQLite query. (SQLite's default limit on query parameters is 999.)
+_LOOKUP_CHUNK_SIZE = 500
+
+
+def _normalise(name):
+    # Vanity names are case-insensitive.
+    return name.strip().lower()
+
+
+class VanityResolver(object):
+    """
+    Resolves vanity URL-ending names to 64-bit SteamIDs, caching the answers::
+
+        resolver = VanityResolver("/var/cache/steamapi-vanity.sqlite")
+        vanity.set_default_resolver(resolver)
+        steamids = resolver.resolve_many(names)
+
+    Answers are kept in a bounded, in-process LRU and, if a "path" is given, in an SQLite database file
+    that outlives the process and can be shared by several of them. Names no user has are cached too (as
+    None), for a shorter time, so they aren't looked up again on every import either.
+
+    Users can change their vanity names, so found names are kept for "ttl" seconds only.
+    """
+    def __init__(self, path=None, max_entries=10000, ttl=24 * HOUR, negative_ttl=HOUR, max_workers=4):
+        """
+        :param path: An SQLite database file to persist answers in. Created if it doesn't exist.
+                     (Default: None, keep them in memory only)
+        :type path: str or None
+        :param max_entries: The most answers to keep in memory.
+        :type max_entries: int
+        :param ttl: How long, in seconds, to trust a resolved name.
+        :type ttl: int
+        :param negative_ttl: How long, in seconds, to trust that a name doesn't exist.
+        :type negative_ttl: int
+        :param max_workers: How many names "resolve_many" resolves concurrently.
+        :type max_workers: int
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_workers = max_workers
+        # Normalised name -> (SteamID or None, Unix time it expires at)
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._connections = _SQLiteConnections(path) if path is not None else None
+        self.calls = 0
+
+        if path is not None:
+            connection = self._connection()
+            with connection:
+                connection.execute("CREATE TABLE IF NOT EXISTS vanity_names ("
+                                   "name TEXT PRIMARY KEY, steamid INTEGER, expires REAL NOT NULL)")
+
+    def _connection(self):
+        return self._connections.get()
+
+    # CACHE
+    def _remember(self, name, steamid, expires):
+        with self._lock:
+            self._entries.pop(name, None)
+            self._entries[name] = (steamid, expires)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _lookup_memory(self, name, now):
+        """
+        :return: (found, SteamID or None)
+        :rtype: (bool, int or None)
+        """
+        with self._lock:
+            if name not in self._entries:
+                return False, None
+            steamid, expires = self._entries.pop(name)
+            if expires < now:
+                return False, None
+            # Re-inserting moves the name to the most-recently-used end.
+            self._entries[name] = (steamid, expires)
+            return True, steamid
+
+    def _lookup_persistent(self, names, now):
+        """
+        :return: Normalised name -> SteamID or None, for the names found (and not expired) in the database.
+        :rtype: dict
+        """
+        found = {}
+        if self.path is None:
+            return found
+        connection = self._connection()
+        for chunk in _chunks(names, _LOOKUP_CHUNK_SIZE):
+            rows = connection.execute("SELECT name, steamid, expires FROM vanity_names WHERE name IN "
+                                      "({marks})".format(marks=", ".join("?" * len(chunk))), chunk).fetchall()
+            for name, steamid, expires in rows:
+                if expires >= now:
+                    found[name] = steamid
+                    self._remember(name, steamid, expires)
+        return found
+
+    def lookup(self, name):
+        """
+        Look a name up in the caches only, without calling the API.
+
+        :type name: str
+        :return: (found, SteamID or None). A found None means the name is known not to exist.
+        :rtype: (bool, int or None)
+        """
+        name = _normalise(name)
+        now = time.time()
+        found, steamid = self._lookup_memory(name, now)
+        if found is True:
+            return found, steamid
+        persistent = self._lookup_persistent([name], now)
+        if name in persistent:
+            return True, persistent[name]
+        return False, None
+
+    def store(self, name, steamid):
+        """
+        Cache an answer obtained elsewhere. (E.g.: by an asynchronous call)
+
+        :type name: str
+        :param steamid: The name's SteamID, or None if no user has it.
+        :type steamid: int or None
+        """
+        self.store_many({name: steamid})
+
+    def store_many(self, answers):
+        """
+        :param answers: Name -> SteamID or None.
+        :type answers: dict
+        """
+        now = time.time()
+        rows = []
+        for name, steamid in answers.items():
+            name = _normalise(name)
+            if steamid is not None:
+                steamid = int(steamid)
+            expires = now + (self.ttl if steamid is not None else self.negative_ttl)
+            self._remember(name, steamid, expires)
+            rows += [(name, steamid, expires)]
+        if self.path is not None and len(rows) > 0:
+            connection = self._connection()
+            with connection:
+                connection.executemany("INSERT OR REPLACE INTO vanity_names (name, steamid, expires) "
+                                       "VALUES (?, ?, ?)", rows)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.path is not None:
+            connection = self._connection()
+            with connection:
+                connection.execute("DELETE FROM vanity_names")
+
+    def __len__(self):
+        return len(self._entries)
+
+    # RESOLVING
+    def _call(self, name):
+        """
+        :return: The name's SteamID, or None if no user has it.
+        :rtype: int or None
+        """
+        with self._lock:
+            self.calls += 1
+        response = APIConnection().call("ISteamUser", "ResolveVanityURL", "v0001", vanityurl=name)
+        if response.success == NO_MATCH:
+            return None
+        return int(response.steamid)
+
+    def resolve(self, name):
+        """
+        :type name: str
+        :return: The name's SteamID, or None if no user has it.
+        :rtype: int or None
+        """
+        found, steamid = self.lookup(name)
+        if found is True:
+            return steamid
+        steamid = self._call(_normalise(name))
+        self.store(name, steamid)
+        return steamid
+
+    def resolve_many(self, names, max_workers=None):
+        """
+        Resolve many names at once. Cached names are answered from memory, then from the database in bulk;
+        the rest are resolved concurrently, one call each.
+
+        :type names: list of str
+        :param max_workers: How many names to resolve concurrently. (Default: the resolver's "max_workers")
+        :type max_workers: int or None
+        :return: Name (as given) -> SteamID, or None for names no user has.
+        :rtype: dict
+        :raise: The first API error, if any call failed. The names resolved before it stay cached.
+        """
+        if max_workers is None:
+            max_workers = self.max_workers
+        names = list(names)
+        now = time.time()
+        answers = {}
+        missing = []
+        for name in set(_normalise(name) for name in names):
+            found, steamid = self._lookup_memory(name, now)
+            if found is True:
+                answers[name] = steamid
+            else:
+                missing += [name]
+        persistent = self._lookup_persistent(missing, now)
+        answers.update(persistent)
+        missing = [name for name in missing if name not in persistent]
+
+        def resolve(name):
+            steamid = self._call(name)
+            self.store(name, steamid)
+            return steamid
+
+        answers.update(zip(missing, _parallel_map(resolve, missing, max_workers)))
+        return dict((name, answers[_normalise(name)]) for name in names)
+
+
+_default_resolver = None
+_default_resolver_lock = threading.Lock()
+
+
+def default_resolver():
+    """
+    :return: The resolver "SteamUser(userurl=...)" uses. Created, in memory only, on first use.
+    :rtype: VanityResolver
+    """
+    global _default_resolver
+    with _default_resolver_lock:
+        if _default_resolver is None:
+            _default_resolver = VanityResolver()
+        return _default_resolver
+
+
+def set_default_resolver(resolver):
+    """
+    Swap the resolver "SteamUser(userurl=...)" uses, e.g. for one backed by a database file.
+
+    :type resolver: VanityResolver
+    """
+    global _default_resolver
+    with _default_resolver_lock:
+        _default_resolver = resolver
+
+
+def resolve_or_raise(name, resolver=None):
+    """
+    :type name: str
+    :rtype: int
+    :raise: errors.APIUserNotFound if no user has the name.
+    """
+    if resolver is None:
+        resolver = default_resolver()
+    steamid = resolver.resolve(name)
+    if steamid is None:
+        raise errors.APIUserNotFound("No user has the vanity name \"{name}\"".format(name=name))
+    return steamid
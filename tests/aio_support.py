@@ -0,0 +1,23 @@
+"""
+Coroutine helpers for test_aio. Kept out of the test module, so it still imports on Pythons without "async".
+"""
+import asyncio
+
+
+def run_and_close(connection, coroutine_function, *args):
+    """
+    Run a coroutine function to completion in a new event loop, then close the connection's session.
+
+    :return: The coroutine's result, in a one-item list: asyncio may repr a task's result, and a user's
+             repr fetches its name.
+    """
+    result = []
+
+    async def run():
+        try:
+            result.append(await coroutine_function(*args))
+        finally:
+            await connection.close()
+
+    asyncio.run(run())
+    return result
@@ -0,0 +1,141 @@
+"""
+Shared fixtures: a local stand-in for the Steam Web API and store (see "steamapi.bench"), which counts the
+calls it answers per command, and a test case that points the API connections at it.
+"""
+import collections
+import shutil
+import tempfile
+import unittest
+
+from steamapi import cache, transport
+from steamapi.app import SteamApp
+from steamapi.bench import FakeSteamServer
+from steamapi.core import APIConnection, StoreAPIConnection
+
+
+class CountingSteamServer(FakeSteamServer):
+    """
+    A FakeSteamServer that also counts the calls it answers, per command. (E.g.: "appdetails")
+
+    Calls about the SteamIDs in "private_steamids" are refused, as they are for private profiles. Calls made
+    with the API keys in "throttled_keys" are answered with a 429. "key_counts" counts calls per API key.
+    """
+    def __init__(self, **options):
+        super(CountingSteamServer, self).__init__(**options)
+        self.command_counts = collections.Counter()
+        self.key_counts = collections.Counter()
+        self.private_steamids = set()
+        self.throttled_keys = set()
+
+    def _respond(self, path, params):
+        command = path.strip("/").split("/")[1]
+        with self._lock:
+            self.command_counts[command] += 1
+            self.key_counts[params.get("key")] += 1
+        if params.get("key") in self.throttled_keys:
+            return 429, b""
+        if params.get("steamid") is not None and int(params["steamid"]) in self.private_steamids:
+            return 401, b""
+        return super(CountingSteamServer, self)._respond(path, params)
+
+
+class CappedSteamServer(CountingSteamServer):
+    """
+    Refuses price batches of more than "max_batch" apps, like the real store does past some size.
+    """
+    max_batch = 30
+
+    def _generate_appdetails(self, params):
+        if len(params["appids"].split(",")) > self.max_batch:
+            return None
+        return super(CappedSteamServer, self)._generate_appdetails(params)
+
+
+class ServerTestCase(unittest.TestCase):
+    """
+    Runs tests against a CountingSteamServer (or a subclass), in "self.server", shared by the test case's
+    tests. Its counters and the process-wide caches are reset before each test.
+    """
+    # The server's class, and keyword arguments for it.
+    server_class = CountingSteamServer
+    server_options = {}
+
+    @classmethod
+    def setUpClass(cls):
+        # The connections are singletons: only the first instantiation's arguments count.
+        APIConnection(api_key="TESTKEY")
+        StoreAPIConnection()
+        cls.server = cls.server_class(**cls.server_options)
+        cls.server.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.server.redirect()
+        self.server.command_counts.clear()
+        self.server.key_counts.clear()
+        self.server.private_steamids.clear()
+        self.server.throttled_keys.clear()
+        self.server.request_count = 0
+        cache.disable_identity_map()
+        SteamApp._appdetails_batch_sizes.clear()
+
+    def tearDown(self):
+        self.server.restore()
+        for connection in (APIConnection(), StoreAPIConnection()):
+            # Drop the kept-alive connections, so the server's handler threads don't outlive it.
+            session = getattr(connection.transport, "_session", None)
+            if session is not None:
+                session.close()
+
+
+class CassetteTestCase(ServerTestCase):
+    """
+    A ServerTestCase that can record its calls to a cassette, in a temporary directory, and replay them
+    without the server. "record" and "replay" swap both connections' transports; the usual ones are put
+    back after each test.
+    """
+    def setUp(self):
+        super(CassetteTestCase, self).setUp()
+        self.cassette_path = tempfile.mkdtemp(prefix="steamapi-cassette-")
+        self._transports = dict((connection, connection.transport)
+                                for connection in (APIConnection(), StoreAPIConnection()))
+
+    def tearDown(self):
+        for connection, original in self._transports.items():
+            connection.transport = original
+        shutil.rmtree(self.cassette_path, ignore_errors=True)
+        super(CassetteTestCase, self).tearDown()
+
+    def record(self):
+        """
+        Send calls to the server as usual, recording them.
+        """
+        for connection, original in self._transports.items():
+            connection.transport = transport.RecordingTransport(self.cassette_path, original)
+
+    def replay(self):
+        """
+        Answer calls from the recordings.
+
+        :rtype: transport.ReplayTransport
+        """
+        replay = transport.ReplayTransport(self.cassette_path)
+        for connection in self._transports:
+            connection.transport = replay
+        return replay
+
+
+class TemporaryDirectoryTestCase(unittest.TestCase):
+    """
+    Gives every test an empty directory, in "self.directory", deleted afterwards.
+    """
+    def setUp(self):
+        super(TemporaryDirectoryTestCase, self).setUp()
+        self.directory = tempfile.mkdtemp(prefix="steamapi-tests-")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+        super(TemporaryDirectoryTestCase, self).tearDown()
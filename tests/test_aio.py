@@ -0,0 +1,137 @@
+import sys
+import unittest
+
+from steamapi import errors, vanity
+from steamapi.bench import BASE_STEAMID
+from steamapi.core import APIConnection, StoreAPIConnection
+from steamapi.user import SteamUser
+
+from .support import CountingSteamServer, ServerTestCase
+
+try:
+    import aiohttp
+    from steamapi import aio
+    from .aio_support import run_and_close
+except (ImportError, SyntaxError):
+    aio = None
+
+
+@unittest.skipIf(aio is None or sys.version_info < (3, 7), "Requires Python 3.7+ and aiohttp.")
+class AsyncFriendsTest(ServerTestCase):
+    server_options = {"friends_per_user": 250}
+
+    def setUp(self):
+        super(AsyncFriendsTest, self).setUp()
+        self.connection = aio.AsyncAPIConnection()
+        self.previous_template = self.connection.QUERY_TEMPLATE
+        self.connection.QUERY_TEMPLATE = APIConnection().QUERY_TEMPLATE
+        self.previous_precache = self.connection.precache
+
+    def tearDown(self):
+        self.connection.QUERY_TEMPLATE = self.previous_template
+        self.connection.precache = self.previous_precache
+        super(AsyncFriendsTest, self).tearDown()
+
+    def fetch_friends(self, steamid):
+        return run_and_close(self.connection, aio.AsyncSteamUser(steamid).fetch_friends)[0]
+
+    def test_precaches_summaries_in_chunks(self):
+        friends = self.fetch_friends(BASE_STEAMID)
+        self.assertEqual(len(friends), 250)
+        self.assertEqual(self.server.command_counts["GetPlayerSummaries"], 3)
+        # Already cached: reading names makes no more calls.
+        self.assertEqual(friends[-1].name, SteamUser._summary.lookup(friends[-1]).personaname)
+        self.assertEqual(self.server.command_counts["GetPlayerSummaries"], 3)
+
+    def test_precache_follows_the_async_connection_setting(self):
+        self.connection.precache = False
+        APIConnection().precache = True
+        self.fetch_friends(BASE_STEAMID + 1000)
+        self.assertEqual(self.server.command_counts["GetFriendList"], 1)
+        self.assertEqual(self.server.command_counts["GetPlayerSummaries"], 0)
+
+
+class NullStoreServer(CountingSteamServer):
+    """
+    Answers every "appdetails" call with a bare "null", as the store does for some apps.
+    """
+    def _generate_appdetails(self, params):
+        return None
+
+
+class _AsyncServerTestCase(ServerTestCase):
+    """
+    Points both async connections at the test server, and gives every test a fresh vanity resolver.
+    """
+    def setUp(self):
+        super(_AsyncServerTestCase, self).setUp()
+        self.api = aio.AsyncAPIConnection()
+        self.store = aio.AsyncStoreAPIConnection()
+        self.previous_templates = (self.api.QUERY_TEMPLATE, self.store.QUERY_TEMPLATE)
+        self.api.QUERY_TEMPLATE = APIConnection().QUERY_TEMPLATE
+        self.store.QUERY_TEMPLATE = StoreAPIConnection().QUERY_TEMPLATE
+        self.previous_resolver = vanity.default_resolver()
+        vanity.set_default_resolver(vanity.VanityResolver())
+
+    def tearDown(self):
+        vanity.set_default_resolver(self.previous_resolver)
+        self.api.QUERY_TEMPLATE, self.store.QUERY_TEMPLATE = self.previous_templates
+        super(_AsyncServerTestCase, self).tearDown()
+
+
+@unittest.skipIf(aio is None or sys.version_info < (3, 7), "Requires Python 3.7+ and aiohttp.")
+class AsyncNullAppInfoTest(_AsyncServerTestCase):
+    server_class = NullStoreServer
+
+    def test_null_body_means_no_details(self):
+        app = aio.AsyncSteamApp(440)
+        self.assertEqual(run_and_close(self.store, app.fetch_app_info), [None])
+        # Cached: the blocking property doesn't call again.
+        self.assertIsNone(app.app_info)
+        self.assertEqual(self.server.command_counts["appdetails"], 1)
+
+
+class NoMatchSteamServer(CountingSteamServer):
+    """
+    Knows no vanity names starting with "nobody".
+    """
+    def _generate_ResolveVanityURL(self, params):
+        if params["vanityurl"].startswith("nobody"):
+            return {"response": {"success": vanity.NO_MATCH, "message": "No match"}}
+        return super(NoMatchSteamServer, self)._generate_ResolveVanityURL(params)
+
+
+@unittest.skipIf(aio is None or sys.version_info < (3, 7), "Requires Python 3.7+ and aiohttp.")
+class AsyncVanityTest(_AsyncServerTestCase):
+    server_class = NoMatchSteamServer
+
+    def setUp(self):
+        super(AsyncVanityTest, self).setUp()
+        # Resolving with blocking I/O on the event loop is a bug: fail loudly if it happens.
+        self.resolve_or_raise = vanity.resolve_or_raise
+
+        def blocking_resolve(*args, **kwargs):
+            raise AssertionError("Resolved with blocking I/O.")
+        vanity.resolve_or_raise = blocking_resolve
+
+    def tearDown(self):
+        vanity.resolve_or_raise = self.resolve_or_raise
+        super(AsyncVanityTest, self).tearDown()
+
+    def test_fetch_resolves_vanity_names_asynchronously(self):
+        user = aio.AsyncSteamUser(userurl="gabe")
+        summary = run_and_close(self.api, user.fetch_summary)[0]
+        steamid = BASE_STEAMID + len("gabe")
+        self.assertEqual(int(summary.steamid), steamid)
+        self.assertEqual(user.steamid, steamid)
+        self.assertEqual(self.server.command_counts["ResolveVanityURL"], 1)
+        self.assertIs(SteamUser._summary.lookup(user), summary)
+
+    def test_unknown_vanity_name_raises(self):
+        user = aio.AsyncSteamUser(userurl="nobody")
+        with self.assertRaises(errors.APIUserNotFound):
+            run_and_close(self.api, user.fetch_games)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+
+from steamapi.app import APP_INFO_FILTERS, SteamApp
+from steamapi.bench import BASE_APPID
+
+from .support import CappedSteamServer, ServerTestCase
+
+
+class LoadManyTest(ServerTestCase):
+    def test_multi_group_filters_take_one_call_per_app(self):
+        apps, calls = SteamApp._load_many(range(BASE_APPID, BASE_APPID + 100), APP_INFO_FILTERS, 4, False)
+        self.assertEqual(calls, 100)
+        self.assertEqual(self.server.command_counts["appdetails"], 100)
+        self.assertEqual(apps[-1].name, "Game {appid}".format(appid=BASE_APPID + 99))
+        self.assertEqual(self.server.command_counts["appdetails"], 100)
+
+    def test_prices_are_batched(self):
+        apps = SteamApp.load_many(range(BASE_APPID, BASE_APPID + 250), filters=("price_overview",))
+        self.assertEqual(len(apps), 250)
+        self.assertEqual(self.server.command_counts["appdetails"], 3)
+        self.assertEqual(apps[0].price_overview.final, 999)
+        self.assertEqual(self.server.command_counts["appdetails"], 3)
+
+    def test_cached_apps_are_skipped_unless_refreshing(self):
+        apps = SteamApp.load_many(range(BASE_APPID, BASE_APPID + 150), filters=("price_overview",))
+        apps, calls = SteamApp._load_many(apps + [BASE_APPID + 150], ("price_overview",), 4, False)
+        self.assertEqual(calls, 1)
+        apps, calls = SteamApp._load_many(apps, ("price_overview",), 4, True)
+        self.assertEqual(calls, 2)
+
+
+class RejectedBatchTest(ServerTestCase):
+    server_class = CappedSteamServer
+
+    def test_rejected_size_is_learned_once(self):
+        apps, calls = SteamApp._load_many(range(BASE_APPID, BASE_APPID + 250), ("price_overview",), 4, False)
+        # The probe: 100 and 50 are refused, then four batches of 25 go through. Then six more of 25.
+        self.assertEqual(calls, 12)
+        self.assertEqual(self.server.command_counts["appdetails"], 12)
+        self.assertEqual(SteamApp._appdetails_batch_size(("price_overview",)), 25)
+        self.assertEqual(apps[-1].price_overview.final, 999)
+
+        apps, calls = SteamApp._load_many(range(BASE_APPID, BASE_APPID + 100), ("price_overview",), 4, True)
+        self.assertEqual(calls, 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
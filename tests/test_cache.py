@@ -0,0 +1,100 @@
+import os
+import sqlite3
+import time
+import unittest
+
+from steamapi.cache import LRUCache, SQLiteResponseCache
+from steamapi.decorators import INFINITE
+
+from .support import TemporaryDirectoryTestCase
+
+
+class SQLiteResponseCacheTest(TemporaryDirectoryTestCase):
+    def make_cache(self, **options):
+        return SQLiteResponseCache(os.path.join(self.directory, "responses.sqlite"), default_ttl=3600, **options)
+
+    def assertTotalsMatch(self, response_cache):
+        connection = response_cache._connection()
+        counted = connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        self.assertEqual(tuple(response_cache._totals(connection)), tuple(counted))
+
+    def test_round_trip(self):
+        response_cache = self.make_cache()
+        response_cache.set_raw("a", b"value", INFINITE)
+        self.assertEqual(response_cache.get("a"), b"value")
+        self.assertEqual(response_cache.get("b"), None)
+
+    def test_expired_entries_are_dropped(self):
+        response_cache = self.make_cache()
+        response_cache.set_raw("a", b"value", time.time() - 1)
+        self.assertEqual(response_cache.get("a"), None)
+        self.assertTotalsMatch(response_cache)
+
+    def test_totals_follow_inserts_replacements_and_clears(self):
+        response_cache = self.make_cache()
+        for index in range(20):
+            response_cache.set_raw("key{0}".format(index), b"x" * index, INFINITE)
+        response_cache.set_raw("key5", b"y" * 100, INFINITE)
+        self.assertTotalsMatch(response_cache)
+        self.assertEqual(response_cache._totals(response_cache._connection())[0], 20)
+        response_cache.clear()
+        self.assertEqual(tuple(response_cache._totals(response_cache._connection())), (0, 0))
+
+    def test_evicts_least_recently_used_down_to_the_low_water_mark(self):
+        response_cache = self.make_cache(max_entries=100)
+        response_cache.ACCESS_RESOLUTION = 0
+        for index in range(100):
+            response_cache.set_raw("key{0}".format(index), b"x", INFINITE)
+            time.sleep(0.0001)
+        # Used recently, so it outlives the other early entries.
+        self.assertEqual(response_cache.get("key0"), b"x")
+        response_cache.set_raw("key100", b"x", INFINITE)
+
+        self.assertTotalsMatch(response_cache)
+        self.assertEqual(response_cache._totals(response_cache._connection())[0], 90)
+        self.assertEqual(response_cache.get("key0"), b"x")
+        self.assertEqual(response_cache.get("key1"), None)
+        self.assertEqual(response_cache.get("key100"), b"x")
+
+    def test_evicts_by_size(self):
+        response_cache = self.make_cache(max_bytes=1000)
+        for index in range(30):
+            response_cache.set_raw("key{0}".format(index), b"x" * 100, INFINITE)
+        entries, total_size = response_cache._totals(response_cache._connection())
+        self.assertTrue(total_size <= 1000)
+        self.assertEqual(response_cache.get("key29"), b"x" * 100)
+        self.assertTotalsMatch(response_cache)
+
+    def test_fresh_hits_do_not_write(self):
+        response_cache = self.make_cache()
+        response_cache.set_raw("a", b"value", INFINITE)
+        connection = response_cache._connection()
+        changes = connection.total_changes
+        for _ in range(10):
+            response_cache.get("a")
+        self.assertEqual(connection.total_changes, changes)
+
+    def test_counts_databases_created_without_totals(self):
+        path = os.path.join(self.directory, "responses.sqlite")
+        connection = sqlite3.connect(path)
+        with connection:
+            connection.execute("CREATE TABLE responses (key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+                               "size INTEGER NOT NULL, expires REAL NOT NULL, accessed REAL NOT NULL)")
+            connection.execute("INSERT INTO responses VALUES ('a', x'00', 3, 0, 0)")
+        connection.close()
+        response_cache = SQLiteResponseCache(path)
+        self.assertEqual(tuple(response_cache._totals(response_cache._connection())), (1, 3))
+
+
+class LRUCacheTest(unittest.TestCase):
+    def test_keeps_the_most_recently_used(self):
+        lru = LRUCache(2)
+        lru.set("a", 1)
+        lru.set("b", 2)
+        lru.get("a")
+        lru.set("c", 3)
+        self.assertEqual((lru.get("a"), lru.get("b"), lru.get("c")), (1, None, 3))
+
+
+if __name__ == "__main__":
+    unittest.main()
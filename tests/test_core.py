@@ -0,0 +1,223 @@
+import threading
+import time
+import unittest
+
+from steamapi.bench import BASE_APPID, BASE_STEAMID
+from steamapi.core import (APIConnection, APIResponse, APIResponseList, StoreAPIConnection, _parallel_imap,
+                           _parallel_map, _parse_response)
+from steamapi.user import SteamUser
+
+from .support import CountingSteamServer, ServerTestCase
+
+
+class ParallelMapTest(unittest.TestCase):
+    def test_results_keep_the_items_order(self):
+        def slow_square(number):
+            # Later items finish first.
+            time.sleep(0.001 * (10 - number))
+            return number * number
+
+        self.assertEqual(_parallel_map(slow_square, range(10), 4), [number * number for number in range(10)])
+
+    def test_runs_on_the_calling_thread_with_one_worker_or_item(self):
+        caller = threading.current_thread()
+        on_caller = lambda item: threading.current_thread() is caller
+        self.assertEqual(_parallel_map(on_caller, [1, 2, 3], 1), [True, True, True])
+        self.assertEqual(_parallel_map(on_caller, [1], 8), [True])
+        self.assertEqual(_parallel_map(on_caller, [], 8), [])
+
+    def test_uses_at_most_max_workers_threads(self):
+        lock = threading.Lock()
+        running = [0]
+        most_running = [0]
+
+        def track(item):
+            with lock:
+                running[0] += 1
+                most_running[0] = max(most_running[0], running[0])
+            time.sleep(0.01)
+            with lock:
+                running[0] -= 1
+
+        _parallel_map(track, range(20), 3)
+        self.assertTrue(1 < most_running[0] <= 3)
+
+    def test_errors_are_raised_to_the_caller(self):
+        def fail_on_three(number):
+            if number == 3:
+                raise ValueError(number)
+            return number
+
+        self.assertRaises(ValueError, _parallel_map, fail_on_three, range(6), 3)
+
+    def test_abandoned_iteration_skips_queued_items(self):
+        called = []
+
+        def record(item):
+            called.append(item)
+            time.sleep(0.01)
+            return item
+
+        results = _parallel_imap(record, range(100), 2)
+        self.assertEqual(next(results), 0)
+        results.close()
+        self.assertTrue(len(called) < 100)
+
+    def test_unordered_yields_every_result(self):
+        self.assertEqual(sorted(_parallel_imap(lambda number: -number, range(10), 4, ordered=False)),
+                         sorted(-number for number in range(10)))
+
+
+def run_concurrently(function, count):
+    """
+    :return: What "function" returned on each of "count" threads, started together.
+    :rtype: list
+    """
+    results = [None] * count
+
+    def run(index):
+        results[index] = function()
+
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+class SingleFlightTest(ServerTestCase):
+    # Slow enough for every thread to join the first one's call.
+    server_options = {"latency": 0.2}
+
+    def test_identical_calls_share_one_request(self):
+        # Arguments can be unhashable, like this dictionary, too.
+        call = lambda: APIConnection().call("ISteamUser", "GetPlayerSummaries", "v0002",
+                                            steamids=[BASE_STEAMID, BASE_STEAMID + 1], input_json={"unused": 1})
+        responses = run_concurrently(call, 8)
+        self.assertEqual(self.server.command_counts["GetPlayerSummaries"], 1)
+        self.assertEqual([len(response.players) for response in responses], [2] * 8)
+
+    def test_different_calls_do_not(self):
+        calls = iter(range(4))
+        call = lambda: APIConnection().call("ISteamUser", "GetPlayerSummaries", "v0002",
+                                            steamids=[BASE_STEAMID + next(calls)])
+        run_concurrently(call, 4)
+        self.assertEqual(self.server.command_counts["GetPlayerSummaries"], 4)
+
+    def test_property_misses_share_one_request(self):
+        user = SteamUser(BASE_STEAMID)
+        names = run_concurrently(lambda: user.name, 8)
+        self.assertEqual(len(set(names)), 1)
+        self.assertEqual(self.server.command_counts["GetPlayerSummaries"], 1)
+
+
+class APIResponseTest(unittest.TestCase):
+    def setUp(self):
+        self.raw = {"response": {"player": {"name": "Gabe", "games": [{"appid": 440}, {"appid": 570}]},
+                                 "tags": [1, 2],
+                                 "count": 2}}
+
+    def test_unwraps_the_response_envelope(self):
+        response = _parse_response(self.raw)
+        self.assertIs(response._raw, self.raw["response"])
+        self.assertEqual(response.count, 2)
+        self.assertEqual(response["count"], 2)
+        self.assertIsNone(response.missing)
+        self.assertEqual(sorted(response), ["count", "player", "tags"])
+
+    def test_nested_values_are_wrapped_on_first_access(self):
+        response = _parse_response(self.raw)
+        self.assertIsNone(response._wrapped)
+        player = response.player
+        self.assertIsInstance(player, APIResponse)
+        self.assertIs(player._raw, self.raw["response"]["player"])
+        # Wrapped once, then reused.
+        self.assertIs(response.player, player)
+        self.assertEqual(list(response._wrapped), ["player"])
+        self.assertIsInstance(player.games, APIResponseList)
+        self.assertEqual(response.tags, [1, 2])
+
+    def test_stringify_lists(self):
+        response = _parse_response(self.raw, stringify_lists=True)
+        self.assertEqual(response.tags, ["1", "2"])
+        # Nested responses keep converting.
+        self.assertEqual(_parse_response({"nested": self.raw}, stringify_lists=True).nested.response.tags,
+                         ["1", "2"])
+        self.assertEqual(response.player.games[0].appid, 440)
+        self.assertEqual(_parse_response(self.raw).tags, [1, 2])
+
+        # The class-wide switch still applies to every response.
+        APIResponse.stringify_lists = True
+        try:
+            self.assertEqual(_parse_response(self.raw).player.games, [{"appid": 440}, {"appid": 570}])
+            self.assertEqual(_parse_response(self.raw).tags, ["1", "2"])
+        finally:
+            APIResponse.stringify_lists = False
+
+
+class APIResponseListTest(unittest.TestCase):
+    def setUp(self):
+        self.raw = [{"appid": 440}, {"appid": 570}, {"appid": 730}]
+        self.games = APIResponseList(self.raw)
+
+    def test_indexing_wraps_lazily(self):
+        self.assertIsNone(self.games._wrapped)
+        first = self.games[0]
+        self.assertIsInstance(first, APIResponse)
+        self.assertIs(self.games[0], first)
+        self.assertEqual(self.games[-1].appid, 730)
+        self.assertEqual(self.games._wrapped.count(None), 1)
+        self.assertRaises(IndexError, lambda: self.games[3])
+        self.assertIs(self.games._raw, self.raw)
+
+    def test_slicing(self):
+        self.assertEqual([game.appid for game in self.games[1:]], [570, 730])
+        self.assertEqual([game.appid for game in self.games[::-2]], [730, 440])
+        self.assertEqual(self.games[5:], [])
+        self.assertIs(self.games[:1][0], self.games[0])
+
+    def test_iteration_and_length(self):
+        self.assertEqual(len(self.games), 3)
+        self.assertEqual([game.appid for game in self.games], [440, 570, 730])
+
+    def test_equality_and_repr(self):
+        self.assertEqual(self.games, [{"appid": 440}, {"appid": 570}, {"appid": 730}])
+        self.assertEqual(self.games, APIResponseList(list(self.raw)))
+        self.assertNotEqual(self.games, APIResponseList(self.raw[:2]))
+        self.assertFalse(self.games != self.raw)
+        self.assertEqual(repr(self.games), repr(self.raw))
+
+
+class TaggedSteamServer(CountingSteamServer):
+    """
+    Adds a list of plain values to every player summary.
+    """
+    def _generate_GetPlayerSummaries(self, params):
+        response = super(TaggedSteamServer, self)._generate_GetPlayerSummaries(params)
+        for player in response["response"]["players"]:
+            player["tags"] = [1, 2]
+        return response
+
+
+class StringifyListsTest(ServerTestCase):
+    server_class = TaggedSteamServer
+
+    def setUp(self):
+        super(StringifyListsTest, self).setUp()
+        APIConnection().stringify_lists = True
+
+    def tearDown(self):
+        APIConnection().stringify_lists = False
+        super(StringifyListsTest, self).tearDown()
+
+    def test_only_the_connections_responses_are_converted(self):
+        response = APIConnection().call("ISteamUser", "GetPlayerSummaries", "v0002", steamids=BASE_STEAMID)
+        self.assertEqual(response.players[0].tags, ["1", "2"])
+        details = StoreAPIConnection().call("appdetails", appids=BASE_APPID)
+        self.assertEqual(details[str(BASE_APPID)].data.dlc[0], BASE_APPID + 1)
+        self.assertFalse(APIResponse.stringify_lists)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+import array
+import unittest
+
+from steamapi import export
+from steamapi.bench import BASE_STEAMID
+from steamapi.export import FriendGraphCSR, PlaytimeMatrix
+
+from .support import ServerTestCase, TemporaryDirectoryTestCase
+
+
+class FriendGraphCSRTest(ServerTestCase):
+    server_options = {"friends_per_user": 3}
+
+    def test_from_users(self):
+        graph = FriendGraphCSR.from_users([BASE_STEAMID, BASE_STEAMID + 10])
+        self.assertEqual(list(graph.nodes), [BASE_STEAMID, BASE_STEAMID + 10])
+        self.assertEqual(list(graph.friends_of(BASE_STEAMID + 10)), [BASE_STEAMID + 11, BASE_STEAMID + 12,
+                                                                     BASE_STEAMID + 13])
+
+    def test_private_friend_lists_are_left_out(self):
+        self.server.private_steamids.add(BASE_STEAMID)
+        graph = FriendGraphCSR.from_users([BASE_STEAMID, BASE_STEAMID + 10])
+        self.assertEqual(list(graph.nodes), [BASE_STEAMID + 10])
+        self.assertEqual(len(graph.friends_of(BASE_STEAMID)), 0)
+
+
+class ColumnarExportTest(TemporaryDirectoryTestCase):
+    def setUp(self):
+        super(ColumnarExportTest, self).setUp()
+        # Exercise the "array" fallback, whether or not NumPy is installed.
+        self._numpy = export.numpy
+        export.numpy = None
+
+    def tearDown(self):
+        export.numpy = self._numpy
+        super(ColumnarExportTest, self).tearDown()
+
+    def test_columns_hold_64_bit_steamids(self):
+        graph = FriendGraphCSR.from_edges([(BASE_STEAMID + 1, BASE_STEAMID), (BASE_STEAMID, BASE_STEAMID + 1),
+                                           (BASE_STEAMID + 1, BASE_STEAMID + 2)])
+        self.assertEqual(list(graph.nodes), [BASE_STEAMID + 1, BASE_STEAMID])
+        self.assertEqual(list(graph.offsets), [0, 2, 3])
+        self.assertEqual(list(graph.friends_of(BASE_STEAMID + 1)), [BASE_STEAMID, BASE_STEAMID + 2])
+        self.assertIsInstance(graph.targets, array.array)
+
+    def test_save_and_load(self):
+        graph = FriendGraphCSR.from_edges([(BASE_STEAMID, BASE_STEAMID + 1), (BASE_STEAMID, BASE_STEAMID + 2)])
+        graph.save(self.directory)
+        loaded = FriendGraphCSR.load(self.directory)
+        for name, typecode in FriendGraphCSR.COLUMNS:
+            self.assertEqual(list(getattr(loaded, name)), list(getattr(graph, name)))
+
+        class Game(object):
+            def __init__(self, appid, playtime_forever):
+                self.appid = appid
+                self.playtime_forever = playtime_forever
+
+        matrix = PlaytimeMatrix.from_games([(BASE_STEAMID, [Game(10, 5), Game(20, 0)]), (BASE_STEAMID + 1, [])])
+        matrix.save(self.directory)
+        loaded = PlaytimeMatrix.load(self.directory)
+        self.assertEqual(list(loaded.users), [BASE_STEAMID, BASE_STEAMID + 1])
+        self.assertEqual(list(loaded.offsets), [0, 2, 2])
+        self.assertEqual(list(loaded.apps), [10, 20])
+        self.assertEqual(list(loaded.playtimes), [5, 0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import gc
+import os
+import shutil
+import tempfile
+import unittest
+
+from steamapi.bench import BASE_STEAMID
+from steamapi.graph import FriendGraphCrawler
+
+from .support import ServerTestCase
+
+
+class FriendGraphCrawlerTest(ServerTestCase):
+    server_options = {"friends_per_user": 3}
+
+    def setUp(self):
+        super(FriendGraphCrawlerTest, self).setUp()
+        directory = tempfile.mkdtemp(prefix="steamapi-tests-")
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.checkpoint_path = os.path.join(directory, "crawl.sqlite")
+
+    def crawler(self, **options):
+        options.setdefault("max_depth", 3)
+        options.setdefault("window", 2)
+        options.setdefault("skip_private", False)
+        return FriendGraphCrawler([BASE_STEAMID, BASE_STEAMID + 100], **options)
+
+    def test_crawl(self):
+        crawler = self.crawler()
+        edges = list(crawler.crawl())
+        # Friends are the next three SteamIDs, so each seed's levels hold 1, 3 and 3 users to expand, with
+        # three friends each, and it reaches 9 users.
+        self.assertEqual(len(edges), 2 * 7 * 3)
+        self.assertEqual(crawler.visited_count, 2 + 2 * 9)
+        self.assertEqual(self.server.command_counts["GetFriendList"], 2 * 7)
+
+    def test_node_budget(self):
+        crawler = self.crawler(max_nodes=5, checkpoint_path=self.checkpoint_path)
+        edges = list(crawler.crawl())
+        self.assertEqual(crawler.visited_count, 5)
+        self.assertEqual(len(edges), 5 * 3)
+
+    def test_checkpointed_crawl_matches(self):
+        expected = set(self.crawler().crawl())
+        crawler = self.crawler(checkpoint_path=self.checkpoint_path)
+        self.assertEqual(set(crawler.crawl()), expected)
+        self.assertEqual(crawler.visited_count, 20)
+
+    def test_resume_after_a_crash(self):
+        expected = set(self.crawler().crawl())
+        crawler = self.crawler(checkpoint_path=self.checkpoint_path)
+        edges = crawler.crawl()
+        # Stop mid-window, without the crawler getting to save anything more.
+        before = [next(edges) for index in range(10)]
+        del edges, crawler
+        gc.collect()
+
+        resumed = FriendGraphCrawler.resume(self.checkpoint_path, window=2, skip_private=False)
+        self.assertEqual(resumed.max_depth, 3)
+        after = list(resumed.crawl())
+        self.assertEqual(set(before) | set(after), expected)
+        # The window in progress is yielded again, but nothing before it.
+        self.assertLess(len(after), len(expected))
+        self.assertGreater(len(before) + len(after), len(expected))
+        self.assertEqual(resumed.visited_count, 20)
+
+    def test_resume_without_a_checkpoint(self):
+        self.assertRaises(IOError, FriendGraphCrawler.resume, self.checkpoint_path)
+
+
+if __name__ == "__main__":
+    unittest.main()
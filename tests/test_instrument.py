@@ -0,0 +1,253 @@
+import time
+import unittest
+
+from steamapi import errors, instrument
+from steamapi.bench import BASE_STEAMID
+from steamapi.cache import HOUR, ResponseCache
+from steamapi.core import APIConnection, GET, STORE_INTERFACE
+from steamapi.decorators import cached_property
+from steamapi.throttle import KeyPool
+from steamapi.user import SteamUser
+
+from .support import ServerTestCase
+
+
+def make_call_event(command="GetPlayerSummaries", latency=0.01, **fields):
+    event = instrument.CallEvent("ISteamUser", command, "v0002", GET, 100.0)
+    event.latency = latency
+    event.status = 200
+    for name, value in fields.items():
+        setattr(event, name, value)
+    return event
+
+
+class HistogramTest(unittest.TestCase):
+    def test_aggregates_calls_per_endpoint(self):
+        histogram = instrument.Histogram(buckets=(0.01, 0.1, 1.0))
+        histogram(make_call_event(latency=0.005, bytes=100, retries=2, cache="hit"))
+        histogram(make_call_event(latency=0.05, bytes=None, decode_time=0.25, wrap_time=0.5))
+        histogram(make_call_event(latency=5.0, error=errors.APIFailure()))
+        histogram(make_call_event(command="GetPlayerBans"))
+
+        stats = histogram.stats()["calls"][("ISteamUser", "GetPlayerSummaries")]
+        self.assertEqual(stats, {"count": 3,
+                                 "errors": 1,
+                                 "latency_sum": 5.055,
+                                 "latency_buckets": [1, 1, 0, 1],
+                                 "bytes": 100,
+                                 "decode_time": 0.25,
+                                 "wrap_time": 0.5,
+                                 "retries": 2,
+                                 "cache_hits": 1})
+        self.assertEqual(histogram.stats()["calls"][("ISteamUser", "GetPlayerBans")]["count"], 1)
+
+    def test_percentiles_are_bucket_bounds(self):
+        histogram = instrument.Histogram(buckets=(0.01, 0.1, 1.0))
+        for latency in (0.005, 0.005, 0.05, 5.0):
+            histogram(make_call_event(latency=latency))
+        self.assertEqual(histogram.percentile("ISteamUser", "GetPlayerSummaries", 50), 0.01)
+        self.assertEqual(histogram.percentile("ISteamUser", "GetPlayerSummaries", 75), 0.1)
+        self.assertEqual(histogram.percentile("ISteamUser", "GetPlayerSummaries", 99), float("inf"))
+        self.assertIsNone(histogram.percentile("ISteamUser", "GetPlayerBans", 50))
+
+    def test_counts_cached_property_outcomes(self):
+        histogram = instrument.Histogram()
+        for outcome in ("miss", "hit", "hit", "stale"):
+            histogram(instrument.CacheEvent("SteamUser", "_summary", outcome))
+        self.assertEqual(histogram.stats()["cached_properties"], {("SteamUser", "_summary", "miss"): 1,
+                                                                  ("SteamUser", "_summary", "hit"): 2,
+                                                                  ("SteamUser", "_summary", "stale"): 1})
+        histogram.reset()
+        self.assertEqual(histogram.stats(), {"calls": {}, "cached_properties": {}})
+
+
+class PrometheusExporterTest(unittest.TestCase):
+    def test_renders_the_text_format(self):
+        exporter = instrument.PrometheusExporter(buckets=(0.1, 1.0))
+        exporter(make_call_event(latency=0.5, bytes=100, retries=1))
+        exporter(instrument.CacheEvent("SteamUser", "_summary", "hit"))
+        labels = 'interface="ISteamUser",command="GetPlayerSummaries"'
+        lines = exporter.render().split("\n")
+
+        self.assertEqual(lines[:2], ["# HELP steamapi_call_latency_seconds API call latency, retries included.",
+                                     "# TYPE steamapi_call_latency_seconds histogram"])
+        self.assertEqual(lines[2:7], ['steamapi_call_latency_seconds_bucket{%s,le="0.1"} 0' % labels,
+                                      'steamapi_call_latency_seconds_bucket{%s,le="1.0"} 1' % labels,
+                                      'steamapi_call_latency_seconds_bucket{%s,le="+Inf"} 1' % labels,
+                                      'steamapi_call_latency_seconds_sum{%s} 0.5' % labels,
+                                      'steamapi_call_latency_seconds_count{%s} 1' % labels])
+        self.assertIn("# TYPE steamapi_calls_total counter", lines)
+        self.assertIn("steamapi_calls_total{%s} 1" % labels, lines)
+        self.assertIn("steamapi_response_bytes_total{%s} 100" % labels, lines)
+        self.assertIn("steamapi_retries_total{%s} 1" % labels, lines)
+        self.assertIn("steamapi_call_errors_total{%s} 0" % labels, lines)
+        self.assertIn('steamapi_cached_property_reads_total{owner="SteamUser",name="_summary",outcome="hit"} 1',
+                      lines)
+        self.assertEqual(lines[-1], "")
+
+    def test_escapes_label_values(self):
+        exporter = instrument.PrometheusExporter(prefix="steam")
+        exporter(make_call_event(command='Say "hi"\\\n'))
+        self.assertIn('steam_calls_total{interface="ISteamUser",command="Say \\"hi\\"\\\\\\n"} 1',
+                      exporter.render().split("\n"))
+
+
+class SpanSinkTest(unittest.TestCase):
+    def setUp(self):
+        self.spans = []
+        self.sink = instrument.SpanSink(self.spans.append)
+
+    def test_call_events_become_spans(self):
+        self.sink(make_call_event(latency=0.5, bytes=100, cache="miss"))
+        self.assertEqual(self.spans, [{"name": "ISteamUser.GetPlayerSummaries",
+                                       "start_time": 100.0,
+                                       "end_time": 100.5,
+                                       "status": "OK",
+                                       "attributes": {"http.method": GET,
+                                                      "http.status_code": 200,
+                                                      "http.response_content_length": 100,
+                                                      "steamapi.interface": "ISteamUser",
+                                                      "steamapi.command": "GetPlayerSummaries",
+                                                      "steamapi.version": "v0002",
+                                                      "steamapi.retries": 0,
+                                                      "steamapi.decode_time": 0.0,
+                                                      "steamapi.wrap_time": 0.0,
+                                                      "steamapi.response_cache": "miss"}}])
+
+    def test_failed_calls_have_an_error_status(self):
+        event = instrument.CallEvent(STORE_INTERFACE, "appdetails", None, GET, 100.0)
+        event.error = errors.APIBadCall()
+        self.sink(event)
+        self.assertEqual(self.spans[0]["status"], "ERROR")
+        self.assertEqual(self.spans[0]["attributes"]["exception.type"], "APIBadCall")
+        for attribute in ("steamapi.version", "http.status_code", "http.response_content_length"):
+            self.assertNotIn(attribute, self.spans[0]["attributes"])
+
+    def test_cache_events_are_ignored(self):
+        self.sink(instrument.CacheEvent("SteamUser", "_summary", "hit"))
+        self.assertEqual(self.spans, [])
+
+
+class MemoryResponseCache(ResponseCache):
+    """
+    Caches every endpoint, in a dictionary.
+    """
+    def __init__(self):
+        super(MemoryResponseCache, self).__init__(default_ttl=HOUR)
+        self.entries = {}
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def set_raw(self, key, value, expires):
+        self.entries[key] = value
+
+    def clear(self):
+        self.entries.clear()
+
+
+class InstrumentedCallTest(ServerTestCase):
+    """
+    The events the connections and cached properties emit, collected from a subscribed sink.
+    """
+    def setUp(self):
+        super(InstrumentedCallTest, self).setUp()
+        self.connection = APIConnection()
+        self.response_cache = self.connection.response_cache
+        self.events = []
+        self.sink = instrument.subscribe(self.events.append)
+
+    def tearDown(self):
+        instrument.unsubscribe(self.sink)
+        self.connection.response_cache = self.response_cache
+        self.connection.reset("TESTKEY")
+        super(InstrumentedCallTest, self).tearDown()
+
+    def call_events(self):
+        return [event for event in self.events if isinstance(event, instrument.CallEvent)]
+
+    def cache_events(self):
+        return [(event.owner, event.name, event.outcome) for event in self.events
+                if isinstance(event, instrument.CacheEvent)]
+
+    def test_nothing_is_measured_without_sinks(self):
+        instrument.unsubscribe(self.sink)
+        self.assertFalse(instrument.enabled())
+        self.connection.call("ISteamUser", "GetPlayerSummaries", "v0002", steamids=BASE_STEAMID)
+        self.assertEqual(self.events, [])
+
+    def test_call_event_fields(self):
+        started = time.time()
+        self.connection.call("ISteamUser", "GetPlayerSummaries", "v0002", steamids=BASE_STEAMID)
+        event, = self.call_events()
+        self.assertEqual((event.interface, event.command, event.version, event.method),
+                         ("ISteamUser", "GetPlayerSummaries", "v0002", GET))
+        self.assertEqual(event.status, 200)
+        self.assertEqual(event.retries, 0)
+        self.assertIsNone(event.cache)
+        self.assertIsNone(event.error)
+        raw = self.connection.call_raw("ISteamUser", "GetPlayerSummaries", "v0002", steamids=BASE_STEAMID)
+        self.assertEqual(event.bytes, len(raw))
+        self.assertGreaterEqual(event.started, started - 1)
+        self.assertGreater(event.latency, 0)
+        self.assertGreaterEqual(event.decode_time, 0)
+
+    def test_retries_are_counted(self):
+        self.connection.reset(KeyPool(["A", "B"]))
+        self.server.throttled_keys.add("A")
+        self.connection.call("ISteamUser", "GetPlayerSummaries", "v0002", steamids=BASE_STEAMID)
+        event, = self.call_events()
+        self.assertEqual((event.retries, event.status), (1, 200))
+
+    def test_failed_calls_carry_their_error(self):
+        self.server.private_steamids.add(BASE_STEAMID)
+        self.assertRaises(errors.APIUnauthorized, self.connection.call, "IPlayerService", "GetBadges", "v1",
+                          steamid=BASE_STEAMID)
+        event, = self.call_events()
+        self.assertEqual(event.status, 401)
+        self.assertIsInstance(event.error, errors.APIUnauthorized)
+
+    def test_response_cache_misses_then_hits(self):
+        self.connection.response_cache = MemoryResponseCache()
+        for _ in range(2):
+            self.connection.call("ISteamUser", "GetPlayerSummaries", "v0002", steamids=BASE_STEAMID)
+        miss, hit = self.call_events()
+        self.assertEqual((miss.cache, hit.cache), ("miss", "hit"))
+        self.assertEqual(hit.bytes, miss.bytes)
+        self.assertIsNone(hit.status)
+        self.assertEqual(self.server.command_counts["GetPlayerSummaries"], 1)
+
+    def test_cached_property_reads(self):
+        user = SteamUser(BASE_STEAMID)
+        user.name
+        user.name
+        self.assertEqual(self.cache_events(), [("SteamUser", "name", "miss"),
+                                               ("SteamUser", "_summary", "miss"),
+                                               ("SteamUser", "name", "hit")])
+        self.assertEqual([event.command for event in self.call_events()], ["GetPlayerSummaries"])
+
+    def test_stale_and_expired_reads(self):
+        class Clock(object):
+            @cached_property(ttl=0.05, stale_ttl=60)
+            def stale(self):
+                return time.time()
+
+            @cached_property(ttl=0.05)
+            def expired(self):
+                return time.time()
+
+        clock = Clock()
+        clock.stale
+        clock.expired
+        time.sleep(0.1)
+        clock.stale
+        clock.expired
+        cached_property._refresh_queue.wait(5)
+        self.assertEqual(self.cache_events(), [("Clock", "stale", "miss"),
+                                               ("Clock", "expired", "miss"),
+                                               ("Clock", "stale", "stale"),
+                                               ("Clock", "expired", "expired")])
+
+
+if __name__ == "__main__":
+    unittest.main()
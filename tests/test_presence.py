@@ -0,0 +1,49 @@
+import unittest
+
+from steamapi.bench import BASE_STEAMID
+from steamapi.consts import OnlineState
+from steamapi.presence import PresenceChange, PresenceTracker
+
+from .support import ServerTestCase
+
+# Game IDs of non-Steam shortcuts and mods use all 64 bits.
+SHORTCUT_GAMEID = 2 ** 64 - 5
+
+
+def player(steamid, state, game=0):
+    return {"steamid": str(steamid), "personastate": state, "gameid": str(game), "lastlogoff": 1500000000}
+
+
+class PresenceTrackerTest(ServerTestCase):
+    def test_polls_100_users_per_call(self):
+        tracker = PresenceTracker(range(BASE_STEAMID, BASE_STEAMID + 250))
+        self.assertEqual(tracker.poll(), [])
+        self.assertEqual(self.server.command_counts["GetPlayerSummaries"], 3)
+        state, game, last_logoff = tracker.state(BASE_STEAMID + 4)
+        self.assertEqual(state, (BASE_STEAMID + 4) % 100000 % 7)
+        # The same answers again: no changes.
+        self.assertEqual(tracker.poll(), [])
+
+    def test_reports_changes_only(self):
+        tracker = PresenceTracker([BASE_STEAMID, BASE_STEAMID + 1])
+        tracker._apply([[player(BASE_STEAMID, OnlineState.OFFLINE),
+                         player(BASE_STEAMID + 1, OnlineState.ONLINE)]], 1, True)
+        events = tracker._apply([[player(BASE_STEAMID, OnlineState.ONLINE, SHORTCUT_GAMEID),
+                                  player(BASE_STEAMID + 1, OnlineState.ONLINE)]], 2, False)
+        self.assertEqual([(event.kind, event.steamid, event.old, event.new) for event in events],
+                         [(PresenceChange.CAME_ONLINE, BASE_STEAMID, OnlineState.OFFLINE, OnlineState.ONLINE),
+                          (PresenceChange.STARTED_GAME, BASE_STEAMID, 0, SHORTCUT_GAMEID)])
+        self.assertEqual(tracker.state(BASE_STEAMID), (OnlineState.ONLINE, SHORTCUT_GAMEID, 1500000000))
+
+        events = tracker._apply([[player(BASE_STEAMID, OnlineState.OFFLINE)]], 3, False)
+        self.assertEqual([event.kind for event in events], [PresenceChange.WENT_OFFLINE,
+                                                             PresenceChange.STOPPED_GAME])
+
+    def test_unknown_users_have_no_state(self):
+        tracker = PresenceTracker([BASE_STEAMID])
+        self.assertIsNone(tracker.state(BASE_STEAMID))
+        self.assertIsNone(tracker.state(BASE_STEAMID + 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+import time
+import unittest
+
+from steamapi import errors
+from steamapi.bench import BASE_APPID, BASE_STEAMID
+from steamapi.core import APIConnection, StoreAPIConnection
+from steamapi.refresh import RefreshScheduler
+
+from .support import CappedSteamServer, ServerTestCase
+
+
+class RefreshBudgetTest(ServerTestCase):
+    def test_app_details_stay_within_budget(self):
+        scheduler = RefreshScheduler(max_calls=5)
+        scheduler.watch_apps(range(BASE_APPID, BASE_APPID + 250))
+        self.assertEqual(scheduler.run_once(), 5)
+        self.assertEqual(self.server.command_counts["appdetails"], 5)
+        self.assertEqual(scheduler.refreshes, 5)
+        # The budget is spent until the period is over.
+        self.assertEqual(scheduler.run_once(), 0)
+        self.assertEqual(self.server.command_counts["appdetails"], 5)
+
+    def test_summaries_are_planned_100_users_per_call(self):
+        scheduler = RefreshScheduler(max_calls=2)
+        scheduler.watch_users(range(BASE_STEAMID, BASE_STEAMID + 250))
+        self.assertEqual(scheduler.run_once(), 2)
+        self.assertEqual(self.server.command_counts["GetPlayerSummaries"], 2)
+        self.assertEqual(scheduler.refreshes, 200)
+
+
+class RejectedBatchBudgetTest(ServerTestCase):
+    server_class = CappedSteamServer
+
+    def test_rejected_batches_are_spent(self):
+        scheduler = RefreshScheduler(app_groups=("price_overview",), max_calls=20)
+        scheduler.watch_apps(range(BASE_APPID, BASE_APPID + 250))
+        # Planned as three batches of 100; the store's limit makes it twelve calls.
+        self.assertEqual(scheduler.run_once(), 12)
+        self.assertEqual(self.server.command_counts["appdetails"], 12)
+        self.assertEqual(scheduler._remaining_budget(time.time()), 8)
+
+
+class FailingBudgetTest(ServerTestCase):
+    server_options = {"error_rate": 1.0, "error_status": 500}
+
+    def setUp(self):
+        super(FailingBudgetTest, self).setUp()
+        # One request per call, so the server's count is the number of calls.
+        self._retry_policies = dict((connection, connection.retry_policy)
+                                    for connection in (APIConnection(), StoreAPIConnection()))
+        for connection in self._retry_policies:
+            connection.retry_policy = None
+
+    def tearDown(self):
+        for connection, retry_policy in self._retry_policies.items():
+            connection.retry_policy = retry_policy
+        super(FailingBudgetTest, self).tearDown()
+
+    def test_failed_calls_are_spent(self):
+        scheduler = RefreshScheduler(user_fields=("summary", "badges"), max_calls=5)
+        scheduler.watch_users(range(BASE_STEAMID, BASE_STEAMID + 150))
+        scheduler.watch_apps(range(BASE_APPID, BASE_APPID + 10))
+        for attempt in range(10):
+            try:
+                scheduler.run_once()
+            except errors.APIError:
+                pass
+        self.assertGreater(self.server.request_count, 0)
+        self.assertLessEqual(self.server.request_count, 5)
+        self.assertEqual(scheduler._remaining_budget(time.time()), 5 - self.server.request_count)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+import sys
+import unittest
+
+import requests.exceptions
+
+from steamapi import retry
+
+
+def _load_module_copy(name, path):
+    """
+    Execute a module's source again, as a separate module, so module-level code runs against patched globals.
+    """
+    if sys.version_info[0] < 3:
+        import imp
+        return imp.load_source(name, path)
+    import importlib.util
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class NotSentErrorsTest(unittest.TestCase):
+    def test_posts_failing_with_connection_errors_are_not_retried(self):
+        # A plain ConnectionError may be a connection reset after the request went out.
+        policy = retry.RetryPolicy(jitter=False)
+        error = requests.exceptions.ConnectionError()
+        self.assertIsNone(policy.next_delay(0, error, "POST", 0))
+        self.assertEqual(policy.next_delay(0, error, "GET", 0), policy.backoff)
+
+    def test_without_connect_timeout(self):
+        # "requests" before 2.4 (e.g. the pinned 1.2.3) has no ConnectTimeout.
+        connect_timeout = getattr(requests.exceptions, "ConnectTimeout", None)
+        if connect_timeout is not None:
+            del requests.exceptions.ConnectTimeout
+        try:
+            path = retry.__file__
+            if path.endswith(".pyc"):
+                path = path[:-1]
+            module = _load_module_copy("steamapi._retry_without_connect_timeout", path)
+        finally:
+            if connect_timeout is not None:
+                requests.exceptions.ConnectTimeout = connect_timeout
+        self.assertEqual(module.NOT_SENT_ERRORS, ())
+        policy = module.RetryPolicy(jitter=False)
+        self.assertIsNone(policy.next_delay(0, requests.exceptions.ConnectionError(), "POST", 0))
+
+    @unittest.skipUnless(hasattr(requests.exceptions, "ConnectTimeout"), "requests before 2.4")
+    def test_connect_timeouts_are_not_sent_errors(self):
+        self.assertTrue(issubclass(requests.exceptions.ConnectTimeout, retry.NOT_SENT_ERRORS))
+        policy = retry.RetryPolicy(jitter=False)
+        self.assertEqual(policy.next_delay(0, requests.exceptions.ConnectTimeout(), "POST", 0), policy.backoff)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,258 @@
+import threading
+import time
+import unittest
+
+from steamapi import errors
+from steamapi.bench import BASE_STEAMID
+from steamapi.core import APIConnection, StoreAPIConnection, STORE_INTERFACE
+from steamapi.throttle import AIMDLimiter, KeyPool, RateLimiter
+
+from .support import ServerTestCase
+
+
+class KeyPoolTestCase(ServerTestCase):
+    """
+    Gives APIConnection a KeyPool for each test, and puts its usual key back afterwards.
+    """
+    server_options = {"retry_after": 120}
+
+    def setUp(self):
+        super(KeyPoolTestCase, self).setUp()
+        self.connection = APIConnection()
+        self.retry_policy = self.connection.retry_policy
+
+    def tearDown(self):
+        self.connection.retry_policy = self.retry_policy
+        self.connection.reset("TESTKEY")
+        super(KeyPoolTestCase, self).tearDown()
+
+    def use_pool(self, *args, **kwargs):
+        pool = KeyPool(*args, **kwargs)
+        self.connection.reset(pool)
+        return pool
+
+    def call(self, count=1):
+        for index in range(count):
+            self.connection.call("ISteamUser", "GetPlayerSummaries", "v0002", steamids=BASE_STEAMID + index)
+
+
+class KeyPoolTest(KeyPoolTestCase):
+    def test_round_robin_spreads_calls_evenly(self):
+        pool = self.use_pool(["A", "B", "C"])
+        self.call(6)
+        self.assertEqual(dict(self.server.key_counts), {"A": 2, "B": 2, "C": 2})
+        self.assertEqual([pool.usage[key]["calls_today"] for key in "ABC"], [2, 2, 2])
+
+    def test_least_used_picks_the_key_with_fewest_calls(self):
+        pool = self.use_pool(["A", "B"], strategy=KeyPool.LEAST_USED)
+        pool.acquire()
+        pool.acquire()
+        pool.acquire()
+        # "A" and "B" have made 2 and 1 calls.
+        self.call()
+        self.assertEqual(dict(self.server.key_counts), {"B": 1})
+
+    def test_exhausted_keys_leave_the_rotation(self):
+        pool = self.use_pool(["A", "B"], daily_quota=2)
+        self.call(2)
+        pool.acquire()
+        self.assertEqual(pool.usage["A"], {"calls_today": 2, "throttled": 0, "available": False})
+        self.call()
+        self.assertEqual(dict(self.server.key_counts), {"A": 1, "B": 2})
+
+    def test_all_keys_exhausted_until_the_next_day(self):
+        pool = self.use_pool(["A", "B"], daily_quota=1)
+        self.connection.retry_policy = None
+        self.call(2)
+        with self.assertRaises(errors.APIThrottled) as context:
+            self.call()
+        now = time.time()
+        self.assertAlmostEqual(context.exception.retry_after, (pool._day + 1) * 86400 - now, delta=5)
+        # Refused by the pool, without a request.
+        self.assertEqual(self.server.command_counts["GetPlayerSummaries"], 2)
+
+    def test_quota_resets_when_the_day_rolls_over(self):
+        pool = self.use_pool(["A"], daily_quota=1)
+        self.connection.retry_policy = None
+        self.call()
+        self.assertRaises(errors.APIThrottled, self.call)
+
+        tomorrow = pool._day + 1
+        pool._today = lambda: tomorrow
+        self.call()
+        self.assertEqual(self.server.key_counts["A"], 2)
+        self.assertEqual(pool.usage["A"]["calls_today"], 1)
+
+    def test_throttled_key_cools_down_for_retry_after(self):
+        pool = self.use_pool(["A", "B"])
+        self.server.throttled_keys.add("A")
+        self.connection.retry_policy = None
+        self.assertRaises(errors.APIThrottled, self.call)
+        self.assertEqual(pool.usage["A"], {"calls_today": 1, "throttled": 1, "available": False})
+        self.assertAlmostEqual(pool._cooldown_until["A"] - time.time(), 120, delta=5)
+
+        # "A" is skipped while it rests.
+        self.call(3)
+        self.assertEqual(dict(self.server.key_counts), {"A": 1, "B": 3})
+
+    def test_retry_moves_on_to_another_key(self):
+        self.use_pool(["A", "B"])
+        self.server.throttled_keys.add("A")
+        self.server.retry_after = 0
+        try:
+            self.call()
+        finally:
+            self.server.retry_after = 120
+        self.assertEqual(dict(self.server.key_counts), {"A": 1, "B": 1})
+
+    def test_retry_after_is_the_shortest_cooldown_when_every_key_is_out(self):
+        pool = self.use_pool(["A", "B"], cooldown=600)
+        self.server.throttled_keys.update(["A", "B"])
+        self.connection.retry_policy = None
+        self.assertRaises(errors.APIThrottled, self.call)
+        self.assertRaises(errors.APIThrottled, self.call)
+        # Both keys rest for the server's Retry-After, not the pool's own cooldown.
+        with self.assertRaises(errors.APIThrottled) as context:
+            self.call()
+        self.assertAlmostEqual(context.exception.retry_after, 120, delta=5)
+        self.assertEqual(self.server.command_counts["GetPlayerSummaries"], 2)
+
+        pool.record("A", 429, 30)
+        self.assertFalse(pool.usage["A"]["available"])
+        # A shorter Retry-After doesn't cut a cooldown short.
+        self.assertAlmostEqual(pool._time_until_available(time.time()), 120, delta=5)
+
+
+class RateLimiterTest(unittest.TestCase):
+    def test_bucket_allows_a_burst_then_paces(self):
+        limiter = RateLimiter(rate=10, burst=2)
+        delays = [limiter.reserve("KEY", "ISteamUser") for _ in range(4)]
+        self.assertEqual(delays[:2], [0.0, 0.0])
+        self.assertAlmostEqual(delays[2], 0.1, delta=0.01)
+        self.assertAlmostEqual(delays[3], 0.2, delta=0.01)
+        self.assertEqual(limiter.throttled_calls, 2)
+        self.assertAlmostEqual(limiter.throttled_time, 0.3, delta=0.02)
+
+    def test_buckets_are_per_key(self):
+        limiter = RateLimiter(rate=1, key_rates={"FAST": 100})
+        self.assertEqual(limiter.reserve("A", "ISteamUser"), 0.0)
+        self.assertEqual(limiter.reserve("B", "ISteamUser"), 0.0)
+        self.assertAlmostEqual(limiter.reserve("A", "ISteamUser"), 1.0, delta=0.01)
+        self.assertEqual(limiter.reserve("FAST", "ISteamUser"), 0.0)
+        self.assertEqual(limiter.reserve("FAST", "ISteamUser"), 0.0)
+
+    def test_interface_limit_applies_across_keys_and_to_the_store(self):
+        limiter = RateLimiter(interface_rates={"ISteamUserStats": 5, STORE_INTERFACE: 5}, burst=1)
+        self.assertEqual(limiter.reserve("A", "ISteamUserStats"), 0.0)
+        self.assertAlmostEqual(limiter.reserve("B", "ISteamUserStats"), 0.2, delta=0.01)
+        # Other interfaces aren't limited; store calls have no key.
+        self.assertEqual(limiter.reserve("A", "ISteamUser"), 0.0)
+        self.assertEqual(limiter.reserve(None, STORE_INTERFACE), 0.0)
+        self.assertAlmostEqual(limiter.reserve(None, STORE_INTERFACE), 0.2, delta=0.01)
+        self.assertEqual(limiter.stats["throttled_calls"], 2)
+
+
+class AIMDLimiterTest(unittest.TestCase):
+    def test_backs_off_multiplicatively(self):
+        limiter = AIMDLimiter(initial=8, minimum=2)
+        for limit in (4, 2, 2):
+            limiter.acquire()
+            limiter.release(False)
+            self.assertEqual(limiter.limit, limit)
+        self.assertEqual(limiter.backoffs, 3)
+
+    def test_recovers_about_one_slot_per_round(self):
+        limiter = AIMDLimiter(initial=4, maximum=5)
+        for _ in range(4):
+            limiter.acquire()
+            limiter.release(True)
+        self.assertEqual(limiter.limit, 4)
+        self.assertAlmostEqual(limiter._limit, 5, delta=0.1)
+        for _ in range(20):
+            limiter.acquire()
+            limiter.release(True)
+        self.assertEqual(limiter.limit, 5)
+
+    def test_waiting_for_a_slot_counts_as_throttled_time(self):
+        limiter = AIMDLimiter(initial=1)
+        limiter.acquire()
+        timer = threading.Timer(0.1, limiter.release, (True,))
+        timer.start()
+        limiter.acquire()
+        timer.join()
+        self.assertGreaterEqual(limiter.throttled_time, 0.08)
+        self.assertEqual(limiter.stats["in_flight"], 1)
+
+
+class LimitedConnectionTest(ServerTestCase):
+    """
+    The limiters, plugged into APIConnection and StoreAPIConnection.
+    """
+    def setUp(self):
+        super(LimitedConnectionTest, self).setUp()
+        self.connection = APIConnection()
+        self.store = StoreAPIConnection()
+        self.previous = dict((connection, (connection.rate_limiter, connection.concurrency_limiter,
+                                           connection.retry_policy))
+                             for connection in (self.connection, self.store))
+        for connection in self.previous:
+            connection.retry_policy = None
+
+    def tearDown(self):
+        for connection, (rate_limiter, concurrency_limiter, retry_policy) in self.previous.items():
+            connection.rate_limiter = rate_limiter
+            connection.concurrency_limiter = concurrency_limiter
+            connection.retry_policy = retry_policy
+        self.server.error_rate = 0.0
+        self.server.error_status = 503
+        super(LimitedConnectionTest, self).tearDown()
+
+    def call(self, index=0):
+        self.connection.call("ISteamUser", "GetPlayerSummaries", "v0002", steamids=BASE_STEAMID + index)
+
+    def test_calls_are_paced(self):
+        self.connection.rate_limiter = RateLimiter(rate=20, burst=1)
+        started = time.time()
+        for index in range(5):
+            self.call(index)
+        elapsed = time.time() - started
+        # Four waits of up to 1/20th of a second each, minus the time the calls themselves took.
+        self.assertGreaterEqual(elapsed, 0.19)
+        self.assertEqual(self.connection.rate_limiter.throttled_calls, 4)
+        self.assertGreater(self.connection.rate_limiter.throttled_time, 0.1)
+        self.assertLessEqual(self.connection.rate_limiter.throttled_time, elapsed)
+
+    def test_store_calls_are_paced_by_the_store_limit(self):
+        self.store.rate_limiter = RateLimiter(rate=1, interface_rates={STORE_INTERFACE: 20}, burst=1)
+        for index in range(3):
+            self.store.call("appdetails", appids=index + 10, filters=["price_overview"])
+        self.assertEqual(self.store.rate_limiter.throttled_calls, 2)
+
+    def test_backs_off_on_429_and_5xx_then_recovers(self):
+        limiter = AIMDLimiter(initial=8)
+        self.connection.concurrency_limiter = limiter
+        for status, limit in ((429, 4), (500, 2), (503, 1)):
+            self.server.error_rate = 1.0
+            self.server.error_status = status
+            self.assertRaises(errors.APIException, self.call)
+            self.assertEqual(limiter.limit, limit)
+        self.assertEqual(limiter.backoffs, 3)
+
+        self.server.error_rate = 0.0
+        for index in range(10):
+            self.call(index)
+        self.assertGreater(limiter.limit, 1)
+        self.assertEqual(limiter.backoffs, 3)
+        self.assertEqual(limiter.stats["in_flight"], 0)
+
+    def test_client_errors_are_not_backoffs(self):
+        limiter = AIMDLimiter(initial=8)
+        self.connection.concurrency_limiter = limiter
+        self.server.private_steamids.add(BASE_STEAMID)
+        self.assertRaises(errors.APIUnauthorized, self.connection.call, "IPlayerService", "GetBadges", "v1",
+                          steamid=BASE_STEAMID)
+        self.assertEqual(limiter.backoffs, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
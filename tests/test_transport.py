@@ -0,0 +1,85 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from steamapi import errors
+from steamapi.app import SteamApp
+from steamapi.bench import BASE_APPID, BASE_STEAMID
+from steamapi.transport import Cassette, _make_response
+from steamapi.user import UserBatch
+
+from .support import CassetteTestCase
+
+
+class CassetteTest(unittest.TestCase):
+    def test_keys_ignore_host_order_and_api_key(self):
+        cassette = Cassette("unused")
+        self.assertEqual(cassette.key("GET", "http://localhost:8080/ISteamUser/GetFriendList/v0001/",
+                                      {"steamid": 1, "relationship": "friend", "key": "A"}),
+                         cassette.key("GET", "https://api.steampowered.com/ISteamUser/GetFriendList/v0001/",
+                                      {"key": "B", "relationship": "friend", "steamid": 1}))
+        self.assertNotEqual(cassette.key("GET", "http://localhost/a/", {"steamid": 1}),
+                            cassette.key("POST", "http://localhost/a/", {"steamid": 1}))
+
+    def test_rerecording_replaces_the_file_in_one_step(self):
+        directory = tempfile.mkdtemp(prefix="steamapi-cassette-")
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        cassette = Cassette(directory)
+        url = "http://localhost/ISteamUser/GetPlayerSummaries/v0002/"
+        key = cassette.key("GET", url, {"steamids": 1})
+
+        def record(body):
+            cassette.save(key, "GET", url, {"steamids": 1}, _make_response(url, 200, {}, body), 0.0)
+
+        record(b"old")
+        # Deleting the old recording first would leave a moment with no recording at all.
+        removed = []
+        remove = os.remove
+        os.remove = lambda path: (removed.append(path), remove(path))
+        try:
+            record(b"new")
+        finally:
+            os.remove = remove
+        self.assertEqual(removed, [])
+        self.assertEqual(cassette.load(key)["body"], b"new")
+
+
+class RecordReplayTest(CassetteTestCase):
+    def test_replay_answers_without_the_server(self):
+        self.record()
+        users = UserBatch(range(BASE_STEAMID, BASE_STEAMID + 150)).load(fields=("summary",)).users
+        apps = SteamApp.load_many(range(BASE_APPID, BASE_APPID + 150), filters=("price_overview",))
+        recorded = self.server.request_count
+        self.assertEqual(recorded, 4)
+
+        replay = self.replay()
+        replayed_users = UserBatch(range(BASE_STEAMID, BASE_STEAMID + 150)).load(fields=("summary",)).users
+        replayed_apps, calls = SteamApp._load_many(range(BASE_APPID, BASE_APPID + 150), ("price_overview",), 4,
+                                                   False)
+        self.assertEqual(self.server.request_count, recorded)
+        self.assertEqual(replay.replayed, recorded)
+        self.assertEqual(calls, 2)
+        self.assertEqual([user.name for user in replayed_users], [user.name for user in users])
+        self.assertEqual([app.price_overview.final for app in replayed_apps],
+                         [app.price_overview.final for app in apps])
+
+    def test_api_key_is_not_recorded(self):
+        self.record()
+        UserBatch([BASE_STEAMID]).load(fields=("summary",))
+        recordings = os.listdir(self.cassette_path)
+        self.assertEqual(len(recordings), 1)
+        recording = Cassette(self.cassette_path).load(recordings[0].split(".")[0])
+        self.assertNotIn("key", recording["params"])
+        self.assertEqual(recording["params"]["steamids"], str(BASE_STEAMID))
+
+    def test_unrecorded_calls_fail(self):
+        self.record()
+        UserBatch([BASE_STEAMID]).load(fields=("summary",))
+        self.replay()
+        self.assertRaises(errors.APIRecordingNotFound, UserBatch([BASE_STEAMID + 1]).load, fields=("summary",))
+        self.assertEqual(self.server.request_count, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,134 @@
+import time
+import unittest
+
+from steamapi import core
+from steamapi.bench import BASE_APPID, BASE_STEAMID
+from steamapi.cache import ResponseCache
+from steamapi.core import APIConnection
+from steamapi.decorators import HOUR, cached_property
+from steamapi.user import SteamUser, UserBatch
+
+from .support import ServerTestCase
+
+
+class UserBatchTest(ServerTestCase):
+    def test_loads_100_users_per_call(self):
+        batch = UserBatch(range(BASE_STEAMID, BASE_STEAMID + 250)).load(fields=("summary", "bans"))
+        self.assertEqual(len(batch), 250)
+        self.assertEqual(self.server.command_counts["GetPlayerSummaries"], 3)
+        self.assertEqual(self.server.command_counts["GetPlayerBans"], 3)
+        user = batch.users[-1]
+        self.assertEqual(SteamUser._summary.lookup(user).steamid, str(BASE_STEAMID + 249))
+
+    def test_skips_cached_users_unless_refreshing(self):
+        users = UserBatch(range(BASE_STEAMID, BASE_STEAMID + 150)).load(fields=("summary",)).users
+        UserBatch(users + [BASE_STEAMID + 150]).load(fields=("summary",))
+        self.assertEqual(self.server.command_counts["GetPlayerSummaries"], 3)
+        UserBatch(users).load(fields=("summary",), refresh=True)
+        self.assertEqual(self.server.command_counts["GetPlayerSummaries"], 5)
+
+    def test_duplicates_are_loaded_once(self):
+        batch = UserBatch([BASE_STEAMID, str(BASE_STEAMID), SteamUser(BASE_STEAMID)]).load(fields=("summary",))
+        self.assertEqual(len(batch), 1)
+        self.assertEqual(self.server.command_counts["GetPlayerSummaries"], 1)
+
+    def test_unknown_fields_are_rejected(self):
+        self.assertRaises(ValueError, UserBatch([BASE_STEAMID]).load, fields=("nickname",))
+
+
+class StaleRefreshTest(ServerTestCase):
+    def test_stale_summaries_are_refreshed_in_batches(self):
+        users = UserBatch(range(BASE_STEAMID, BASE_STEAMID + 250)).load(fields=("summary",)).users
+        expired = time.time() - 2 * HOUR - 1
+        for user in users:
+            user._cache["_summary"] = (user._cache["_summary"][0], expired)
+        self.server.command_counts.clear()
+
+        # Stale names are served straight away...
+        names = [user.name for user in users]
+        self.assertEqual(len(names), 250)
+        self.assertTrue(cached_property._refresh_queue.wait(timeout=10))
+        # ...and refreshed on a bounded number of threads, many users per call.
+        refresh_queue = cached_property._refresh_queue
+        self.assertLessEqual(len(refresh_queue._workers), refresh_queue.max_workers)
+        self.assertLessEqual(self.server.command_counts["GetPlayerSummaries"], 4)
+        for user in users:
+            self.assertGreater(SteamUser._summary.last_updated(user), expired)
+
+
+class SpyResponseCache(ResponseCache):
+    """
+    Caches every endpoint, but only notes the keys it's asked about.
+    """
+    def __init__(self):
+        super(SpyResponseCache, self).__init__(default_ttl=HOUR)
+        self.keys = []
+
+    def get(self, key):
+        self.keys += [key]
+        return None
+
+    def set_raw(self, key, value, expires):
+        self.keys += [key]
+
+    def clear(self):
+        pass
+
+
+class StreamingTest(ServerTestCase):
+    """
+    The "iter_*" generators, reading the response with ijson.
+    """
+    server_options = {"friends_per_user": 250, "games_per_user": 30}
+    use_ijson = True
+
+    def setUp(self):
+        super(StreamingTest, self).setUp()
+        if self.use_ijson is True and core.ijson is None:
+            self.skipTest("ijson isn't installed")
+        self._ijson = core.ijson
+        if self.use_ijson is False:
+            core.ijson = None
+        self._response_cache = APIConnection().response_cache
+        APIConnection().response_cache = self.response_cache = SpyResponseCache()
+
+    def tearDown(self):
+        core.ijson = self._ijson
+        APIConnection().response_cache = self._response_cache
+        super(StreamingTest, self).tearDown()
+
+    def test_iter_friends(self):
+        friends = list(SteamUser(BASE_STEAMID).iter_friends())
+        self.assertEqual(len(friends), 250)
+        self.assertEqual(friends[-1].steamid, BASE_STEAMID + 250)
+        self.assertEqual(friends[0].relationship, "friend")
+        self.assertEqual(self.server.command_counts["GetFriendList"], 1)
+        # No summaries were precached.
+        self.assertEqual(self.server.command_counts["GetPlayerSummaries"], 0)
+
+    def test_iter_games(self):
+        games = list(SteamUser(BASE_STEAMID).iter_games())
+        self.assertEqual([game.appid for game in games], list(range(BASE_APPID, BASE_APPID + 30)))
+        self.assertEqual(games[2].name, "Game 2")
+        self.assertEqual(games[2].playtime_forever, 74)
+
+    def test_streamed_calls_skip_the_response_cache(self):
+        list(SteamUser(BASE_STEAMID).iter_friends())
+        self.assertEqual(self.response_cache.keys, [])
+        SteamUser(BASE_STEAMID).friends
+        self.assertNotEqual(self.response_cache.keys, [])
+
+    def test_missing_lists_are_empty(self):
+        self.assertEqual(list(APIConnection().iter_items("ISteamUser", "GetFriendList", "v0001",
+                                                         ("friendslist", "nobody"), steamid=BASE_STEAMID)), [])
+
+
+class DecodedStreamingTest(StreamingTest):
+    """
+    The "iter_*" generators, without ijson: the response is decoded in one go.
+    """
+    use_ijson = False
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from steamapi import cache, errors, vanity
+from steamapi.bench import BASE_STEAMID
+from steamapi.user import SteamUser
+from steamapi.vanity import VanityResolver
+
+from .support import CountingSteamServer, ServerTestCase
+
+
+class NoMatchSteamServer(CountingSteamServer):
+    """
+    Knows no vanity names starting with "nobody".
+    """
+    def _generate_ResolveVanityURL(self, params):
+        if params["vanityurl"].startswith("nobody"):
+            return {"response": {"success": vanity.NO_MATCH, "message": "No match"}}
+        return super(NoMatchSteamServer, self)._generate_ResolveVanityURL(params)
+
+
+class VanityTestCase(ServerTestCase):
+    server_class = NoMatchSteamServer
+
+    def setUp(self):
+        super(VanityTestCase, self).setUp()
+        self._default_resolver = vanity.default_resolver()
+        self.resolver = VanityResolver()
+        vanity.set_default_resolver(self.resolver)
+
+    def tearDown(self):
+        vanity.set_default_resolver(self._default_resolver)
+        super(VanityTestCase, self).tearDown()
+
+
+class VanityResolverTest(VanityTestCase):
+    def test_resolve_many_calls_once_per_name(self):
+        answers = self.resolver.resolve_many(["alice", "Alice ", "nobody1"])
+        self.assertEqual(answers, {"alice": BASE_STEAMID + 5, "Alice ": BASE_STEAMID + 5, "nobody1": None})
+        self.assertEqual(self.server.command_counts["ResolveVanityURL"], 2)
+        # Names no user has are cached too.
+        self.resolver.resolve_many(["ALICE", "nobody1"])
+        self.assertEqual(self.server.command_counts["ResolveVanityURL"], 2)
+
+    def test_answers_outlive_the_resolver(self):
+        directory = tempfile.mkdtemp(prefix="steamapi-tests-")
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        path = os.path.join(directory, "vanity.sqlite")
+        VanityResolver(path).resolve_many(["alice", "nobody1"])
+        self.assertEqual(VanityResolver(path).resolve_many(["alice", "nobody1"]),
+                         {"alice": BASE_STEAMID + 5, "nobody1": None})
+        self.assertEqual(self.server.command_counts["ResolveVanityURL"], 2)
+
+    def test_unknown_names_raise(self):
+        self.assertRaises(errors.APIUserNotFound, vanity.resolve_or_raise, "nobody1", self.resolver)
+
+
+class VanityUserTest(VanityTestCase):
+    def test_users_resolve_on_first_use(self):
+        user = SteamUser(userurl="alice")
+        self.assertEqual(self.server.request_count, 0)
+        self.assertEqual(user.steamid, BASE_STEAMID + 5)
+        self.assertEqual(SteamUser(userurl="alice").steamid, BASE_STEAMID + 5)
+        self.assertEqual(self.server.command_counts["ResolveVanityURL"], 1)
+        self.assertRaises(errors.APIUserNotFound, getattr, SteamUser(userurl="nobody1"), "steamid")
+
+    def test_resolved_users_join_the_identity_map(self):
+        cache.enable_identity_map()
+        user = SteamUser(userurl="alice")
+        # Reading a cached property resolves the name after the user already got a private cache.
+        name = user.name
+        self.assertIs(user._cache, SteamUser(BASE_STEAMID + 5)._cache)
+        self.assertEqual(SteamUser(BASE_STEAMID + 5).name, name)
+        self.assertEqual(self.server.command_counts["GetPlayerSummaries"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()